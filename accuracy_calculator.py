@@ -1,4 +1,5 @@
 import pandas as pd
+import numpy as np
 
 
 def compare_values(recognized, reference):
@@ -56,21 +57,31 @@ def normalize_text(text):
     return normalized
 
 
-def calculate_accuracy_stats(df):
-    total_tests = len(df)
+ACCURACY_MATCH_COLUMNS = ['Indications Match', 'Series Match', 'Model Match', 'Rate Match', 'Overall Match',
+                          'Overall Confidence Match']
 
-    indications_correct = int(df['Indications Match'].sum())
-    series_correct = int(df['Series Match'].sum())
-    model_correct = int(df['Model Match'].sum())
-    rate_correct = int(df['Rate Match'].sum())
-    overall_correct = int(df['Overall Match'].sum())
 
-    if 'Overall Confidence Match' in df.columns:
-        overall_conf_correct = int(df['Overall Confidence Match'].sum())
-    else:
-        overall_conf_correct = 0
+def count_matches(df):
+    # Счетчики складываются между частями данных: по ним точность считается без общего DataFrame
+    counts = {'total_tests': len(df)}
+    for col in ACCURACY_MATCH_COLUMNS:
+        counts[col] = int(df[col].sum()) if col in df.columns or col != 'Overall Confidence Match' else 0
+    return counts
+
+
+def calculate_accuracy_stats(df):
+    return accuracy_stats_from_counts(count_matches(df))
 
 
+def accuracy_stats_from_counts(counts):
+    total_tests = counts['total_tests']
+    indications_correct = counts['Indications Match']
+    series_correct = counts['Series Match']
+    model_correct = counts['Model Match']
+    rate_correct = counts['Rate Match']
+    overall_correct = counts['Overall Match']
+    overall_conf_correct = counts['Overall Confidence Match']
+
     def calculate_percentage(correct, total):
         return float((correct / total) * 100 if total > 0 else 0)
 
@@ -100,4 +111,282 @@ def calculate_accuracy_stats(df):
             'correct': overall_conf_correct,
             'accuracy': calculate_percentage(overall_conf_correct, total_tests)
         }
-    }
\ No newline at end of file
+    }
+
+CHARACTER_METRIC_FIELDS = {
+    'indications': ('Indications', 'Inidications (reference)'),
+    'series': ('Series number', 'Series number (reference)'),
+}
+
+MAX_METRIC_STRING_LENGTH = 64
+CHARACTER_METRICS_CHUNK_SIZE = 200_000
+
+_TEXT_TRANSLATION = str.maketrans({
+    ' ': '', '-': '', '_': '',
+    'х': 'x', 'Х': 'X',
+    'с': 'c', 'С': 'C',
+    'о': 'o', 'О': 'O'
+})
+
+
+def _column_as_strings(df, column):
+    if column not in df.columns:
+        return pd.Series([''] * len(df), index=df.index, dtype=object)
+    values = df[column].astype(object).where(df[column].notna(), '')
+    return values.astype(str).str.strip().replace({'nan': '', 'None': '', '<NA>': ''})
+
+
+def normalize_reading_series(values):
+    values = values.str.replace(' ', '', regex=False).str.replace(',', '.', regex=False)
+    values = values.where(~values.str.startswith('ERROR:'), '')
+    # 12345.0 -> 12345, 12345.60 -> 12345.6: Indications пишется через float()
+    values = values.str.replace(r'^(\d+)\.0*$', r'\1', regex=True)
+    return values.str.replace(r'^(\d+\.\d*?[1-9])0+$', r'\1', regex=True)
+
+
+def normalize_text_series(values):
+    values = values.where(~values.str.startswith('ERROR:'), '')
+    return values.str.lower().str.translate(_TEXT_TRANSLATION)
+
+
+def encode_strings(values, max_length=MAX_METRIC_STRING_LENGTH):
+    values = [value[:max_length] for value in values]
+    width = max(1, max((len(value) for value in values), default=1))
+    codes = np.array(values, dtype=f'U{width}').view(np.uint32).reshape(len(values), width)
+    lengths = np.fromiter((len(value) for value in values), dtype=np.int64, count=len(values))
+    return codes, lengths
+
+
+def batch_edit_distance(ref_codes, ref_lengths, hyp_codes, hyp_lengths):
+    rows = len(ref_lengths)
+    hyp_width = hyp_codes.shape[1]
+    positions = np.arange(hyp_width + 1, dtype=np.int16)
+
+    distances = hyp_lengths.astype(np.int16)
+    previous = np.broadcast_to(positions, (rows, hyp_width + 1)).copy()
+
+    for i in range(1, int(ref_lengths.max(initial=0)) + 1):
+        cost = (hyp_codes != ref_codes[:, i - 1:i]).astype(np.int16)
+        best = np.minimum(previous[:, :-1] + cost, previous[:, 1:] + 1)
+
+        # Вставки: cur[j] = min(best[j - 1], cur[j - 1] + 1) = j + cummin(best[k] - k)
+        current = np.empty_like(previous)
+        current[:, 0] = i
+        current[:, 1:] = best
+        current = np.minimum.accumulate(current - positions, axis=1) + positions
+
+        finished = ref_lengths == i
+        if finished.any():
+            distances[finished] = current[finished, hyp_lengths[finished]]
+        previous = current
+
+    return distances
+
+
+def _accumulate_chunk(totals, ref_values, hyp_values):
+    ref_codes, ref_lengths = encode_strings(ref_values)
+    hyp_codes, hyp_lengths = encode_strings(hyp_values)
+
+    distances = batch_edit_distance(ref_codes, ref_lengths, hyp_codes, hyp_lengths)
+    totals['rows'] += len(ref_values)
+    totals['reference_chars'] += int(ref_lengths.sum())
+    totals['edit_distance'] += int(distances.sum())
+    totals['exact'] += int((distances == 0).sum())
+
+    aligned = ref_lengths == hyp_lengths
+    totals['length_mismatch'] += int((~aligned).sum())
+    if not aligned.any():
+        return
+
+    width = min(ref_codes.shape[1], hyp_codes.shape[1])
+    ref_aligned = ref_codes[aligned, :width]
+    hyp_aligned = hyp_codes[aligned, :width]
+    valid = np.arange(width) < ref_lengths[aligned][:, None]
+
+    totals['position_correct'][:width] += ((ref_aligned == hyp_aligned) & valid).sum(axis=0)
+    totals['position_total'][:width] += valid.sum(axis=0)
+
+    zero = ord('0')
+    digits = valid & (ref_aligned >= zero) & (ref_aligned <= zero + 9) & \
+        (hyp_aligned >= zero) & (hyp_aligned <= zero + 9)
+    pairs = (ref_aligned[digits].astype(np.int64) - zero) * 10 + (hyp_aligned[digits].astype(np.int64) - zero)
+    totals['digit_confusion'] += np.bincount(pairs, minlength=100).reshape(10, 10)
+
+
+def _new_field_totals():
+    return {
+        'rows': 0,
+        'reference_chars': 0,
+        'edit_distance': 0,
+        'exact': 0,
+        'length_mismatch': 0,
+        'position_correct': np.zeros(MAX_METRIC_STRING_LENGTH, dtype=np.int64),
+        'position_total': np.zeros(MAX_METRIC_STRING_LENGTH, dtype=np.int64),
+        'digit_confusion': np.zeros((10, 10), dtype=np.int64),
+    }
+
+
+def _accumulate_field(totals, ref_values, hyp_values, chunk_size=CHARACTER_METRICS_CHUNK_SIZE):
+    for start in range(0, len(ref_values), chunk_size):
+        _accumulate_chunk(totals, ref_values[start:start + chunk_size], hyp_values[start:start + chunk_size])
+
+
+def calculate_field_character_metrics(ref_values, hyp_values, chunk_size=CHARACTER_METRICS_CHUNK_SIZE):
+    totals = _new_field_totals()
+    _accumulate_field(totals, ref_values, hyp_values, chunk_size)
+    return _finalize_field_totals(totals)
+
+
+def _finalize_field_totals(totals):
+    used_positions = int(np.count_nonzero(totals['position_total']))
+    position_accuracy = [
+        float(correct / total * 100) if total > 0 else 0.0
+        for correct, total in zip(totals['position_correct'][:used_positions],
+                                  totals['position_total'][:used_positions])
+    ]
+
+    confusion = totals['digit_confusion']
+    errors = [(int(confusion[r, h]), f"{r}→{h}") for r in range(10) for h in range(10)
+              if r != h and confusion[r, h] > 0]
+    errors.sort(reverse=True)
+
+    return {
+        'rows': totals['rows'],
+        'reference_chars': totals['reference_chars'],
+        'edit_distance': totals['edit_distance'],
+        'cer': float(totals['edit_distance'] / totals['reference_chars'] * 100)
+        if totals['reference_chars'] > 0 else 0.0,
+        'exact': totals['exact'],
+        'length_mismatch': totals['length_mismatch'],
+        'position_accuracy': position_accuracy,
+        'digit_confusion': confusion.tolist(),
+        'top_confusions': [(pair, count) for count, pair in errors[:5]],
+    }
+
+
+def new_character_totals():
+    return {field: _new_field_totals() for field in CHARACTER_METRIC_FIELDS}
+
+
+def accumulate_character_metrics(totals, df):
+    for field, (result_col, reference_col) in CHARACTER_METRIC_FIELDS.items():
+        normalize = normalize_reading_series if field == 'indications' else normalize_text_series
+        references = normalize(_column_as_strings(df, reference_col))
+        results = normalize(_column_as_strings(df, result_col))
+
+        has_reference = (references != '').to_numpy()
+        _accumulate_field(totals[field], references[has_reference].tolist(), results[has_reference].tolist())
+
+
+def finalize_character_metrics(totals):
+    return {field: _finalize_field_totals(field_totals) for field, field_totals in totals.items()}
+
+
+def calculate_character_metrics(df):
+    totals = new_character_totals()
+    accumulate_character_metrics(totals, df)
+    return finalize_character_metrics(totals)
+
+
+SLICE_COLUMNS = ['Model (reference)', 'Rate (reference)']
+IMAGE_SIZE_SLICE = 'Размер изображения'
+IMAGE_SIZE_BUCKETS = [0, 0.3, 1, 2, 5, 12, np.inf]
+IMAGE_SIZE_LABELS = ['< 0.3 Мп', '0.3–1 Мп', '1–2 Мп', '2–5 Мп', '5–12 Мп', '≥ 12 Мп']
+CONFIDENCE_SLICE = 'Уверенность'
+CONFIDENCE_BUCKETS = [-np.inf, 0.5, 0.7, 0.8, 0.9, 0.95, np.inf]
+CONFIDENCE_LABELS = ['< 0.50', '0.50–0.70', '0.70–0.80', '0.80–0.90', '0.90–0.95', '≥ 0.95']
+EMPTY_SLICE_VALUE = '(нет данных)'
+OTHER_SLICE_VALUE = '(прочие)'
+
+
+def _image_megapixels(df):
+    if 'Total Pixels' in df.columns:
+        pixels = pd.to_numeric(df['Total Pixels'], errors='coerce')
+    elif 'Width (px)' in df.columns and 'Height (px)' in df.columns:
+        pixels = pd.to_numeric(df['Width (px)'], errors='coerce') * pd.to_numeric(df['Height (px)'], errors='coerce')
+    else:
+        # Размер из ответа распознавания: "1920x1080"
+        sizes = _column_as_strings(df, 'Image Size').str.extract(r'(\d+)\s*[xх×]\s*(\d+)')
+        pixels = pd.to_numeric(sizes[0], errors='coerce') * pd.to_numeric(sizes[1], errors='coerce')
+    return pixels.where(pixels > 0) / 1e6
+
+
+def _bucket(values, edges, labels):
+    buckets = pd.cut(values, edges, right=False, labels=labels)
+    return pd.Categorical(buckets.astype(object).where(buckets.notna(), EMPTY_SLICE_VALUE),
+                          categories=labels + [EMPTY_SLICE_VALUE])
+
+
+def _slice_keys(df, columns, max_values):
+    keys = []
+    for column in SLICE_COLUMNS + [c for c in columns if c not in SLICE_COLUMNS]:
+        if column not in df.columns:
+            continue
+        # Строки нормализуются только для уникальных значений, строки кадра дальше идут кодами
+        raw_codes, uniques = pd.factorize(df[column])
+        names = _column_as_strings(pd.DataFrame({column: uniques}), column).replace('', EMPTY_SLICE_VALUE)
+        value_codes, values = pd.factorize(np.append(names.to_numpy(dtype=object), EMPTY_SLICE_VALUE))
+        codes = value_codes[raw_codes]
+        if max_values is not None and len(values) > max_values:
+            keep = np.argsort(-np.bincount(codes, minlength=len(values)), kind='stable')[:max_values]
+            mapping = np.full(len(values), max_values)
+            mapping[keep] = np.arange(max_values)
+            codes = mapping[codes]
+            values = list(values[keep]) + [OTHER_SLICE_VALUE]
+        keys.append((column, pd.Categorical.from_codes(codes, categories=values)))
+    keys.append((IMAGE_SIZE_SLICE, _bucket(_image_megapixels(df), IMAGE_SIZE_BUCKETS, IMAGE_SIZE_LABELS)))
+    if 'Overall Confidence' in df.columns:
+        confidence = pd.to_numeric(df['Overall Confidence'], errors='coerce')
+        keys.append((CONFIDENCE_SLICE, _bucket(confidence, CONFIDENCE_BUCKETS, CONFIDENCE_LABELS)))
+    return keys
+
+
+def count_slices(df, columns=(), max_values=None):
+    # Все срезы за один проход: коды значений каждого признака сдвигаются в общее пространство,
+    # и счетчики всех срезов получаются одним np.bincount на колонку совпадений
+    codes, index, offset = [], [], 0
+    for dimension, values in _slice_keys(df, columns, max_values):
+        codes.append(values.codes.astype(np.int64) + offset)
+        index.extend((dimension, str(value)) for value in values.categories)
+        offset += len(values.categories)
+
+    all_codes = np.concatenate(codes)
+    counts = {'total_tests': np.bincount(all_codes, minlength=offset)}
+    for col in ACCURACY_MATCH_COLUMNS:
+        matches = pd.to_numeric(df[col], errors='coerce').fillna(0).to_numpy(np.int64) \
+            if col in df.columns else np.zeros(len(df), dtype=np.int64)
+        counts[col] = np.bincount(all_codes, weights=np.tile(matches, len(codes)), minlength=offset).astype(np.int64)
+
+    result = pd.DataFrame(counts, index=pd.MultiIndex.from_tuples(index, names=['dimension', 'value']))
+    return result[result['total_tests'] > 0]
+
+
+def merge_slice_counts(total, counts):
+    if total is None:
+        return counts
+    return pd.concat([total, counts]).groupby(level=[0, 1], sort=False).sum()
+
+
+def cap_slice_counts(counts, max_values):
+    # Значения за пределами max_values самых частых сливаются в "(прочие)"; корзины размера и уверенности не трогаем
+    parts = []
+    for dimension, group in counts.groupby(level=0, sort=False):
+        if dimension in (IMAGE_SIZE_SLICE, CONFIDENCE_SLICE) or len(group) <= max_values:
+            parts.append(group)
+            continue
+        keep = set(group['total_tests'].nlargest(max_values).index.get_level_values(1))
+        values = [value if value in keep else OTHER_SLICE_VALUE for value in group.index.get_level_values(1)]
+        group.index = pd.MultiIndex.from_arrays([[dimension] * len(group), values], names=counts.index.names)
+        parts.append(group.groupby(level=[0, 1], sort=False).sum())
+    return pd.concat(parts) if parts else counts
+
+
+def slice_stats_from_counts(counts):
+    return [
+        dict(dimension=dimension, value=value, **accuracy_stats_from_counts(row))
+        for (dimension, value), row in zip(counts.index, counts.to_dict('records'))
+    ]
+
+
+def calculate_slice_stats(df, columns=(), max_values=50):
+    return slice_stats_from_counts(count_slices(df, columns, max_values))
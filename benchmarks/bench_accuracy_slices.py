@@ -0,0 +1,46 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from accuracy_calculator import calculate_accuracy_stats, calculate_slice_stats, _slice_keys
+from bench_results_io import make_results
+
+ROWS = int(os.getenv('BENCH_ROWS', '1000000'))
+
+# Срезы одним проходом против цикла с маской и calculate_accuracy_stats на каждое значение среза
+
+
+def slices_by_loop(df, columns=()):
+    slices = []
+    for dimension, values in _slice_keys(df, columns, 50):
+        for value in values.categories:
+            part = df[values == value]
+            if len(part):
+                slices.append(dict(dimension=dimension, value=str(value), **calculate_accuracy_stats(part)))
+    return slices
+
+
+def main():
+    df = make_results(ROWS)
+    columns = ['Rate', 'Series number']
+
+    start = time.perf_counter()
+    slices = calculate_slice_stats(df, columns)
+    single_pass = time.perf_counter() - start
+
+    start = time.perf_counter()
+    looped = slices_by_loop(df, columns)
+    loop = time.perf_counter() - start
+
+    print(f"строк: {ROWS}, срезов: {len(slices)}")
+    print(f"один проход: {single_pass:.2f} с, цикл по срезам: {loop:.2f} с")
+    print(f"результаты совпадают: {slices == looped}")
+    worst = min(slices, key=lambda item: item['overall']['accuracy'])
+    print(f"худший срез: {worst['dimension']} = {worst['value']}, {worst['overall']['accuracy']:.1f}% "
+          f"({worst['total_tests']} тестов)")
+
+
+if __name__ == "__main__":
+    main()
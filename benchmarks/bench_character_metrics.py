@@ -0,0 +1,48 @@
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from accuracy_calculator import calculate_character_metrics
+
+ROWS = int(os.getenv('BENCH_ROWS', '1000000'))
+
+
+def make_frame(rows, seed=42):
+    rng = np.random.default_rng(seed)
+    readings = pd.Series(rng.integers(0, 10 ** 7, rows)).astype(str)
+    serials = pd.Series(rng.integers(10 ** 7, 10 ** 8, rows)).astype(str)
+
+    recognized_readings = readings.copy()
+    broken = rng.random(rows) < 0.1
+    recognized_readings[broken] = recognized_readings[broken].str.replace('1', '7', regex=False)
+
+    recognized_serials = serials.copy()
+    broken = rng.random(rows) < 0.05
+    recognized_serials[broken] = recognized_serials[broken].str[:-1]
+
+    return pd.DataFrame({
+        'Inidications (reference)': readings,
+        'Indications': recognized_readings,
+        'Series number (reference)': 'SN' + serials,
+        'Series number': 'SN' + recognized_serials,
+    })
+
+
+def main():
+    df = make_frame(ROWS)
+    start = time.perf_counter()
+    metrics = calculate_character_metrics(df)
+    elapsed = time.perf_counter() - start
+
+    print(f"строк: {ROWS}, время: {elapsed:.2f} с")
+    for field, values in metrics.items():
+        print(f"{field}: CER {values['cer']:.3f}%, частые ошибки: {values['top_confusions'][:3]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Пиковая память обработки частями при разном числе строк эталонов: при CHUNKED_MODE она должна
+# определяться размером части, а не набора. Распознавание подменено готовым ответом в том же процессе -
+# измеряется только путь чтение эталонов -> сравнение -> запись результатов.
+# Каждый размер считается в отдельном процессе, иначе ru_maxrss показал бы максимум предыдущего.
+# Эталоны тоже пишет отдельный процесс: ru_maxrss наследуется через fork/exec, и пик генератора
+# в родителе попал бы в пик обработки
+
+ROWS = int(os.getenv('BENCH_ROWS', '1000000'))
+IMAGES = int(os.getenv('BENCH_IMAGES', '200'))
+CHUNK_SIZE = int(os.getenv('BENCH_CHUNK_SIZE', '5000'))
+WRITE_BATCH = 100000
+
+
+def write_reference(path, rows, images, seed=42):
+    # Эталоны пишутся пачками, чтобы и сам генератор не держал все строки в памяти
+    rng = np.random.default_rng(seed)
+    writer = None
+    for start in range(0, rows, WRITE_BATCH):
+        count = min(WRITE_BATCH, rows - start)
+        readings = pd.Series(rng.integers(0, 10 ** 6, count)).astype(str)
+        df = pd.DataFrame({
+            'Filename': [f"img_{i % images}.jpg" for i in range(start, start + count)],
+            'Inidications (reference)': readings,
+            'Series number (reference)': 'SN' + readings,
+            'Model (reference)': rng.choice(['CE102', 'Меркурий 201', 'Нева 103'], count),
+            'Rate (reference)': rng.choice(['1', '2', '3'], count),
+            'Indications': '',
+            'Series number': '',
+            'Model': '',
+            'Rate': '',
+        })
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        if writer is None:
+            writer = pq.ParquetWriter(path, table.schema)
+        writer.write_table(table)
+    writer.close()
+
+
+def canned_recognition(image_path, task_id, program_script, image_bytes=None):
+    number = int(os.path.basename(image_path)[4:-4])
+    return {
+        'status': 'completed',
+        'meter_reading': str(number * 7919 % 10 ** 6),
+        'serial_number': f"SN{number}",
+        'model': 'CE102',
+        'rate': str(number % 3 + 1),
+        'serial_number_confidence': 0.9,
+        'recognition_confidences': [0.9, 0.8],
+        'overall_confidence': 0.72,
+        'timings': {'total': 0.5},
+        'image_size': '10x10',
+        'create_date': '',
+    }
+
+
+def child(images_folder, reference_file):
+    import process.image_processor as image_processor
+    from utils.file_utils import results_parquet_path
+
+    image_processor.CHUNKED_MODE = True
+    image_processor.CHUNK_SIZE = CHUNK_SIZE
+    image_processor.RAW_ARCHIVE_ENABLED = False
+    image_processor.SELECTED_SERVER = 'bench'
+    image_processor.run_recognition_on_image = canned_recognition
+
+    processor = image_processor.ImageProcessor()
+    start = time.perf_counter()
+    success, processed, errors, skipped = processor.process_images_folder(images_folder, reference_file, '')
+    elapsed = time.perf_counter() - start
+
+    chunked = processor.last_report['chunked'] if processor.last_report else None
+    results_file = processor.results_file
+    for path in (results_file, results_parquet_path(results_file)):
+        if path and os.path.exists(path):
+            os.remove(path)
+
+    if not success or chunked is None:
+        print("FAILED")
+        return
+    print(f"RESULT {processed} {elapsed:.1f} {chunked['peak_rss_mb']:.1f}")
+
+
+def main():
+    levels = sorted({max(CHUNK_SIZE, ROWS // 10), ROWS})
+    print(f"часть: {CHUNK_SIZE} строк, изображений: {IMAGES}")
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, LOG_PROFILE='perf', DB_PATH=os.path.join(tmp, 'bench.db'))
+        images_folder = os.path.join(tmp, 'images')
+        os.makedirs(images_folder)
+        for i in range(IMAGES):
+            with open(os.path.join(images_folder, f"img_{i}.jpg"), 'wb') as f:
+                f.write(b'\xff\xd8' + bytes(64))
+
+        for rows in levels:
+            reference_file = os.path.join(tmp, f"reference_{rows}.parquet")
+            subprocess.run([sys.executable, os.path.abspath(__file__), '--reference', str(rows), reference_file],
+                           check=True)
+            output = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', images_folder,
+                                     reference_file], env=env, capture_output=True, text=True).stdout
+            os.remove(reference_file)
+            lines = [line for line in output.splitlines() if line.startswith(('RESULT', 'FAILED'))]
+            if not lines or lines[-1].startswith('FAILED'):
+                print(f"{rows:>9} строк: ошибка прогона")
+                continue
+            _, processed, elapsed, peak = lines[-1].split()
+            print(f"{rows:>9} строк: обработано {processed}, {float(elapsed):8.1f} с, "
+                  f"пик памяти {float(peak):7.1f} МБ")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == '--child':
+        child(sys.argv[2], sys.argv[3])
+    elif len(sys.argv) == 4 and sys.argv[1] == '--reference':
+        write_reference(sys.argv[3], int(sys.argv[2]), IMAGES)
+    else:
+        main()
@@ -0,0 +1,119 @@
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.db_manager import DatabaseManager
+
+WRITES_PER_THREAD = int(os.getenv('BENCH_DB_WRITES', '200'))
+READERS = 2
+
+
+def make_report(n):
+    accuracy = {'correct': n, 'accuracy': 95.0}
+    metrics = {'rows': 100, 'reference_chars': 800, 'edit_distance': 12, 'cer': 1.5, 'length_mismatch': 1,
+               'position_accuracy': [99.0] * 8, 'digit_confusion': [[0] * 10 for _ in range(10)]}
+    return {
+        'completion_time': '2024-01-01 00:00:00', 'total_images': 100, 'successfully_processed': 98,
+        'errors': 2, 'success_rate': 98.0, 'total_time_seconds': 60,
+        'accuracy': {key: accuracy for key in ('overall', 'indications', 'series', 'model', 'rate')},
+        'character_metrics': {'indications': metrics, 'series': metrics},
+    }
+
+
+class SharedConnectionManager(DatabaseManager):
+    # Прежняя схема: одно соединение check_same_thread=False на все потоки, без блокировок
+    @property
+    def connection(self):
+        if getattr(self, '_shared', None) is None:
+            self._shared = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+            self._shared.row_factory = sqlite3.Row
+            self._shared.execute("PRAGMA foreign_keys = ON")
+            self._shared.execute("PRAGMA journal_mode = WAL")
+            self._create_tables(self._shared)
+            self._connections.append(self._shared)
+        return self._shared
+
+    @contextmanager
+    def write_transaction(self):
+        cursor = self.connection.cursor()
+        try:
+            yield cursor
+            self.connection.commit()
+        finally:
+            cursor.close()
+
+
+def run_manager(manager_class, db_path, writers, backup_path=None):
+    manager = manager_class(db_path)
+    stop = threading.Event()
+    errors = []
+    reads = [0]
+
+    def writer():
+        for n in range(WRITES_PER_THREAD):
+            try:
+                if not manager.save_test_result(make_report(n)):
+                    errors.append(n)
+            except Exception as e:
+                errors.append(e)
+
+    def reader():
+        while not stop.is_set():
+            try:
+                manager.get_total_records()
+                manager.get_test_history(5)
+                reads[0] += 1
+            except Exception:
+                errors.append('read')
+
+    start = time.perf_counter()
+    readers = [threading.Thread(target=reader) for _ in range(READERS)]
+    threads = [threading.Thread(target=writer) for _ in range(writers)]
+    for thread in readers + threads:
+        thread.start()
+    if backup_path:
+        time.sleep(0.05)
+        manager.backup_database(backup_path)
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    stop.set()
+    for thread in readers:
+        thread.join()
+
+    rows = manager.get_total_records()
+    metric_rows = manager.connection.execute("SELECT COUNT(*) FROM character_metrics").fetchone()[0]
+    manager.close()
+    return elapsed, rows, metric_rows, len(errors), reads[0]
+
+
+def main():
+    import logging
+    logging.disable(logging.CRITICAL)
+
+    print(f"{'вариант':<22}{'писателей':>10}{'записей':>9}{'метрик':>8}{'ошибок':>8}{'чтений':>8}"
+          f"{'записей/с':>11}{'копия':>8}")
+    cases = [('общее соединение', SharedConnectionManager), ('DatabaseManager', DatabaseManager)]
+    with tempfile.TemporaryDirectory() as tmp:
+        for writers in (1, 4, 8):
+            for name, manager_class in cases:
+                prefix = os.path.join(tmp, f"{manager_class.__name__}_{writers}")
+                backup_path = f"{prefix}_backup.db"
+                elapsed, rows, metric_rows, errors, reads = run_manager(manager_class, f"{prefix}.db", writers,
+                                                                        backup_path)
+                integrity = '-'
+                if os.path.exists(backup_path):
+                    backup = sqlite3.connect(backup_path)
+                    integrity = backup.execute("PRAGMA integrity_check").fetchone()[0]
+                    backup.close()
+                print(f"{name:<22}{writers:>10}{rows:>9}{metric_rows:>8}{errors:>8}{reads:>8}"
+                      f"{rows / elapsed:>11.0f}{integrity:>8}")
+
+if __name__ == "__main__":
+    main()
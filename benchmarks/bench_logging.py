@@ -0,0 +1,88 @@
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.log_utils import setup_logging, shutdown_logging, image_context, detail_enabled, DETAIL, SUMMARY
+
+logger = logging.getLogger('bench')
+
+IMAGES = int(os.getenv('BENCH_IMAGES', '2000'))
+RECORDS_PER_IMAGE = 30
+
+
+def log_one_image(image_file, use_context):
+    result = {'meter_reading': '12345.6', 'serial_number': 'AB123456', 'model': 'CE102', 'rate': '1'}
+    if use_context:
+        with image_context(image_file):
+            if detail_enabled():
+                for i in range(RECORDS_PER_IMAGE):
+                    logger.info(f"📋 {image_file}: поле {i} = {result}", extra=DETAIL)
+    else:
+        for i in range(RECORDS_PER_IMAGE):
+            logger.info(f"📋 {image_file}: поле {i} = {result}")
+
+
+def run_sync_baseline(log_path):
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    handler = logging.FileHandler(log_path, encoding='utf-8')
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    root.addHandler(handler)
+    root.setLevel(logging.INFO)
+
+    start = time.perf_counter()
+    for n in range(IMAGES):
+        log_one_image(f"img_{n}.jpg", use_context=False)
+    elapsed = time.perf_counter() - start
+
+    root.removeHandler(handler)
+    handler.close()
+    return elapsed
+
+
+def run_queued(log_path, profile, log_format, sample_rate):
+    setup_logging(profile, log_format, sample_rate, log_file=log_path)
+
+    start = time.perf_counter()
+    for n in range(IMAGES):
+        log_one_image(f"img_{n}.jpg", use_context=True)
+    logger.info("итог прогона", extra=SUMMARY)
+    elapsed = time.perf_counter() - start
+
+    shutdown_logging()
+    return elapsed
+
+
+def main():
+    cases = [
+        ('queue text, sample 1.0', 'default', 'text', 1.0),
+        ('queue json, sample 1.0', 'default', 'json', 1.0),
+        ('queue json, sample 0.1', 'default', 'json', 0.1),
+        ('queue text, perf', 'perf', 'text', 1.0),
+    ]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = [('sync baseline', run_sync_baseline(os.path.join(tmp, 'baseline.log')))]
+        # stderr не должен влиять на измерение
+        devnull = open(os.devnull, 'w')
+        saved_stderr, sys.stderr = sys.stderr, devnull
+        try:
+            for name, profile, log_format, sample_rate in cases:
+                path = os.path.join(tmp, f"{name.replace(' ', '_').replace(',', '')}.log")
+                results.append((name, run_queued(path, profile, log_format, sample_rate)))
+        finally:
+            sys.stderr = saved_stderr
+            devnull.close()
+
+    print(f"{'вариант':<28}{'всего, с':>10}{'на изображение, мкс':>24}")
+    for name, elapsed in results:
+        print(f"{name:<28}{elapsed:>10.3f}{elapsed / IMAGES * 1e6:>24.1f}")
+
+
+if __name__ == "__main__":
+    main()
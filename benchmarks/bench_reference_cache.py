@@ -0,0 +1,76 @@
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.file_utils import load_excel_data
+from utils.reference_cache import load_reference_data
+
+ROWS = int(os.getenv('BENCH_ROWS', '50000'))
+
+
+def make_reference(rows, seed=42):
+    rng = np.random.default_rng(seed)
+    readings = pd.Series(rng.integers(0, 10 ** 6, rows)).astype(str)
+    return pd.DataFrame({
+        'Filename': [f"img_{i}.jpg" for i in range(rows)],
+        'Width (px)': rng.integers(640, 4000, rows),
+        'Height (px)': rng.integers(480, 3000, rows),
+        'Total Pixels': rng.integers(10 ** 5, 10 ** 7, rows),
+        'Inidications (reference)': readings,
+        'Series number (reference)': 'SN' + readings,
+        'Model (reference)': rng.choice(['CE102', 'Меркурий 201', 'Нева 103'], rows),
+        'Rate (reference)': rng.choice(['1', '2', '3'], rows),
+        'Indications': '',
+        'Series number': '',
+        'Model': '',
+        'Rate': '',
+    })
+
+
+def old_startup(excel_file):
+    # Прежний путь: полный read_excel + преобразования типов + iterrows по всем строкам
+    df = load_excel_data(excel_file)
+    filename_to_index = {}
+    for idx, row in df.iterrows():
+        filename = str(row.get('Filename', '')).strip()
+        if filename:
+            filename_to_index[filename] = idx
+    return df, filename_to_index
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        excel_file = os.path.join(tmp, 'reference.xlsx')
+        cache_dir = os.path.join(tmp, 'cache')
+        make_reference(ROWS).to_excel(excel_file, sheet_name='Image Data', index=False)
+
+        old_time, (old_df, old_mapping) = timed(old_startup, excel_file)
+        miss_time, _ = timed(load_reference_data, excel_file, cache_dir)
+        hit_time, (df, mapping) = timed(load_reference_data, excel_file, cache_dir)
+        os.utime(excel_file)
+        touch_time, _ = timed(load_reference_data, excel_file, cache_dir)
+
+        assert mapping == old_mapping
+        pd.testing.assert_frame_equal(df, old_df)
+
+    print(f"строк: {ROWS}")
+    print(f"read_excel + iterrows:        {old_time:8.3f} с")
+    print(f"кэш, первый запуск (сборка):  {miss_time:8.3f} с")
+    print(f"кэш, попадание:               {hit_time:8.3f} с")
+    print(f"кэш, изменен только mtime:    {touch_time:8.3f} с")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.file_utils import load_results_data, save_results_parquet, results_parquet_path
+
+ROWS = int(os.getenv('BENCH_ROWS', '100000'))
+
+
+def make_results(rows, seed=42):
+    rng = np.random.default_rng(seed)
+    readings = pd.Series(rng.integers(0, 10 ** 6, rows)).astype(str)
+    return pd.DataFrame({
+        'Filename': [f"img_{i}.jpg" for i in range(rows)],
+        'Width (px)': rng.integers(640, 4000, rows),
+        'Height (px)': rng.integers(480, 3000, rows),
+        'Total Pixels': rng.integers(10 ** 5, 10 ** 7, rows),
+        'Inidications (reference)': readings,
+        'Series number (reference)': 'SN' + readings,
+        'Model (reference)': rng.choice(['CE102', 'Меркурий 201', 'Нева 103'], rows),
+        'Rate (reference)': rng.choice(['1', '2', '3'], rows),
+        'Indications': readings,
+        'Series number': 'SN' + readings,
+        'Model': rng.choice(['CE102', 'Меркурий 201', 'Нева 103'], rows),
+        'Rate': rng.choice(['1', '2', '3'], rows),
+        'Indications Match': rng.integers(0, 2, rows),
+        'Series Match': rng.integers(0, 2, rows),
+        'Model Match': rng.integers(0, 2, rows),
+        'Rate Match': rng.integers(0, 2, rows),
+        'Overall Match': rng.integers(0, 2, rows),
+        'Overall Confidence': rng.random(rows),
+        'Timing Total': rng.random(rows) * 5,
+    })
+
+
+def main():
+    df = make_results(ROWS)
+    with tempfile.TemporaryDirectory() as tmp:
+        excel_file = os.path.join(tmp, 'results.xlsx')
+        df.to_excel(excel_file, sheet_name='Image Data', index=False)
+
+        start = time.perf_counter()
+        load_results_data(excel_file)
+        excel_time = time.perf_counter() - start
+
+        save_results_parquet(df, excel_file)
+        start = time.perf_counter()
+        load_results_data(excel_file)
+        parquet_time = time.perf_counter() - start
+
+        size_excel = os.path.getsize(excel_file) / 1024 / 1024
+        size_parquet = os.path.getsize(results_parquet_path(excel_file)) / 1024 / 1024
+
+    print(f"строк: {ROWS}")
+    print(f"xlsx:    {excel_time:8.3f} с, {size_excel:6.1f} МБ")
+    print(f"parquet: {parquet_time:8.3f} с, {size_parquet:6.1f} МБ")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+import argparse
+import json
+import queue
+import random
+import threading
+import time
+import urllib.request
+import uuid
+from email import policy
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Заменитель сервера распознавания для load_test.py: тот же API (POST /tasks, GET /result?uuid=),
+# очередь задач и фиксированное число обработчиков, поэтому у него есть предсказуемая емкость
+# workers / service_time запросов в секунду. Если в форме задачи есть callback_url, готовый результат
+# отправляется на него POST-запросом (часть уведомлений можно терять - проверка страховочного опроса).
+# С квотой заменитель, как и общие серверы, отвечает 429 на запросы сверх rate/burst.
+# stall_rate задач зависают на stall_time секунд - так выглядят изображения, тормозящие весь прогон
+
+RESULT = {
+    'meter_reading': '123.4',
+    'serial_number': 'AB1',
+    'model': 'M1',
+    'rate': '1',
+    'serial_number_confidence': 0.9,
+    'recognition_confidences': [0.9],
+    'overall_confidence': 0.81,
+    'image_size': '10x10',
+}
+
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Очередь соединений по умолчанию (5) сбрасывает подключения раньше, чем насыщаются обработчики
+    request_queue_size = 1024
+
+    def __init__(self, address, workers, service_time, jitter, seed=1, callback_loss=0.0, quota=None,
+                 stall_rate=0.0, stall_time=0.0):
+        super().__init__(address, StandInHandler)
+        self.stall_rate = stall_rate
+        self.stall_time = stall_time
+        self.stalled = 0
+        self.quota = quota
+        self.quota_tokens = quota[1] if quota else 0
+        self.quota_updated = time.monotonic()
+        self.accepted = 0
+        self.throttled = 0
+        self.service_time = service_time
+        self.jitter = jitter
+        self.callback_loss = callback_loss
+        self.callbacks_sent = 0
+        self.callbacks_dropped = 0
+        self.tasks = {}
+        self.pending = queue.Queue()
+        self.lock = threading.Lock()
+        self.random = random.Random(seed)
+        for i in range(workers):
+            threading.Thread(target=self._work, name=f"stand-in_{i}", daemon=True).start()
+
+    def _work(self):
+        while True:
+            task_uuid = self.pending.get()
+            with self.lock:
+                self.tasks[task_uuid]['status'] = 'processing'
+                # Логнормальный разброс: у реального распознавания длинный хвост времени обработки
+                duration = self.service_time * self.random.lognormvariate(0, self.jitter) if self.jitter \
+                    else self.service_time
+                if self.stall_rate and self.random.random() < self.stall_rate:
+                    self.stalled += 1
+                    duration += self.stall_time
+            time.sleep(duration)
+            with self.lock:
+                task = self.tasks[task_uuid]
+                task.update(RESULT, status='completed', timings={'total': duration})
+                callback_url = task.pop('callback_url', None)
+                payload = dict(task, task_id=task_uuid)
+                if callback_url and self.random.random() < self.callback_loss:
+                    self.callbacks_dropped += 1
+                    callback_url = None
+            if callback_url:
+                self._notify(callback_url, payload)
+
+    def _notify(self, callback_url, payload):
+        request = urllib.request.Request(callback_url, data=json.dumps(payload).encode('utf-8'),
+                                         headers={'Content-Type': 'application/json'}, method='POST')
+        try:
+            urllib.request.urlopen(request, timeout=5).close()
+            with self.lock:
+                self.callbacks_sent += 1
+        except OSError:
+            pass
+
+    def admit(self):
+        with self.lock:
+            if self.quota:
+                rate, burst = self.quota
+                now = time.monotonic()
+                self.quota_tokens = min(burst, self.quota_tokens + (now - self.quota_updated) * rate)
+                self.quota_updated = now
+                if self.quota_tokens < 1:
+                    self.throttled += 1
+                    return False
+                self.quota_tokens -= 1
+            self.accepted += 1
+            return True
+
+    def create_task(self, callback_url=None):
+        task_uuid = str(uuid.uuid4())
+        with self.lock:
+            self.tasks[task_uuid] = {'status': 'queued', 'create_date': time.strftime("%Y-%m-%d %H:%M:%S")}
+            if callback_url:
+                self.tasks[task_uuid]['callback_url'] = callback_url
+        self.pending.put(task_uuid)
+        return task_uuid
+
+    def get_task(self, task_uuid):
+        with self.lock:
+            task = self.tasks.get(task_uuid)
+            return dict(task) if task else None
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def _send(self, code, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _form_fields(self, body):
+        # Текстовые поля multipart-формы; файл изображения заменителю не нужен
+        content_type = self.headers.get('Content-Type', '')
+        if not content_type.startswith('multipart/form-data'):
+            return {}
+        message = BytesParser(policy=policy.HTTP).parsebytes(
+            f"Content-Type: {content_type}\r\n\r\n".encode('utf-8') + body)
+        return {part.get_param('name', header='content-disposition'): part.get_content()
+                for part in message.iter_parts() if part.get_filename() is None}
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if urlparse(self.path).path.rstrip('/') != '/tasks':
+            return self._send(404, {'error': 'not found'})
+        if not self.server.admit():
+            return self._send(429, {'error': 'rate limit exceeded'})
+        callback_url = self._form_fields(body).get('callback_url')
+        self._send(200, {'task_id': self.server.create_task(callback_url)})
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if not self.server.admit():
+            return self._send(429, {'error': 'rate limit exceeded'})
+        task_uuid = parse_qs(url.query).get('uuid', [''])[0]
+        task = self.server.get_task(task_uuid) if url.path.rstrip('/') == '/result' else None
+        if task is None:
+            return self._send(404, {'error': 'unknown task'})
+        self._send(200, task)
+
+
+def start_stand_in(port=0, workers=4, service_time=0.1, jitter=0.3, callback_loss=0.0, quota=None,
+                   stall_rate=0.0, stall_time=0.0):
+    server = StandInServer(('127.0.0.1', port), workers, service_time, jitter, callback_loss=callback_loss,
+                           quota=quota, stall_rate=stall_rate, stall_time=stall_time)
+    threading.Thread(target=server.serve_forever, name='stand-in', daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Заменитель сервера распознавания для нагрузочного теста')
+    parser.add_argument('--port', type=int, default=9100)
+    parser.add_argument('--workers', type=int, default=4, help='Обработчиков задач')
+    parser.add_argument('--service-time', type=float, default=0.1, help='Среднее время обработки, сек')
+    parser.add_argument('--jitter', type=float, default=0.3, help='Разброс времени обработки (sigma логнормального)')
+    parser.add_argument('--callback-loss', type=float, default=0.0,
+                        help='Доля обратных вызовов, которые заменитель не отправит (0..1)')
+    parser.add_argument('--quota', help='Квота клиента RATE:BURST, сверх нее ответ 429')
+    parser.add_argument('--stall-rate', type=float, default=0.0, help='Доля зависающих задач (0..1)')
+    parser.add_argument('--stall-time', type=float, default=30.0, help='На сколько зависает задача, сек')
+    args = parser.parse_args()
+
+    quota = None
+    if args.quota:
+        rate, burst = args.quota.split(':')
+        quota = (float(rate), int(burst))
+    server, url = start_stand_in(args.port, args.workers, args.service_time, args.jitter, args.callback_loss,
+                                 quota, args.stall_rate, args.stall_time)
+    print(f"Заменитель сервера: {url} (емкость ~{args.workers / args.service_time:.1f} запр/сек)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
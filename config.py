@@ -1,19 +1,23 @@
 import threading
 from datetime import datetime
+from functools import lru_cache
 from dotenv import load_dotenv
 from openpyxl.styles import PatternFill, Alignment, Font, Border, Side
 import subprocess
 import os
 import logging
-
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-)
-logger = logging.getLogger(__name__)
+from utils.log_utils import setup_logging
 
 load_dotenv()
 
+LOG_PROFILE = os.getenv('LOG_PROFILE', 'default')
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')
+LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', '1.0'))
+LOG_FILE = os.getenv('LOG_FILE', '')
+
+setup_logging(LOG_PROFILE, LOG_FORMAT, LOG_SAMPLE_RATE, LOG_FILE or None)
+logger = logging.getLogger(__name__)
+
 logger.info("🔧 ЗАГРУЖЕННЫЕ ПЕРЕМЕННЫЕ ИЗ .env:")
 logger.info(f"   MAX_WORKERS (raw): '{os.getenv('MAX_WORKERS')}'")
 logger.info(f"   PROCESSING_MODE: '{os.getenv('PROCESSING_MODE')}'")
@@ -39,15 +43,108 @@ SERVERS = {
 
 PROCESSING_MODE = os.getenv('PROCESSING_MODE', 'sequential')
 
-max_workers_str = 1
+MAX_WORKERS = max(1, int(os.getenv('MAX_WORKERS', '1'))) if PROCESSING_MODE == 'parallel' else 1
+SCHEDULING_STRATEGY = os.getenv('SCHEDULING_STRATEGY', 'lpt')
+RAW_ARCHIVE_ENABLED = os.getenv('RAW_ARCHIVE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+
+SUITE_PARALLELISM = max(1, int(os.getenv('SUITE_PARALLELISM', '2')))
+
+PREFETCH_DEPTH = max(0, int(os.getenv('PREFETCH_DEPTH', '8')))
+PREFETCH_MAX_MB = float(os.getenv('PREFETCH_MAX_MB', '256'))
+PREFETCH_WORKERS = max(1, int(os.getenv('PREFETCH_WORKERS', '2')))
+
+WATCH_BACKEND = os.getenv('WATCH_BACKEND', 'auto')
+WATCH_POLL_INTERVAL = float(os.getenv('WATCH_POLL_INTERVAL', '1.0'))
+WATCH_DEBOUNCE_SECONDS = float(os.getenv('WATCH_DEBOUNCE_SECONDS', '0.5'))
+
+DEDUP_MODE = os.getenv('DEDUP_MODE', 'off')
+DEDUP_PERCEPTUAL_DISTANCE = int(os.getenv('DEDUP_PERCEPTUAL_DISTANCE', '4'))
+
+REFERENCE_CACHE_ENABLED = os.getenv('REFERENCE_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+REFERENCE_CACHE_DIR = os.getenv('REFERENCE_CACHE_DIR') or \
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'detail', '.reference_cache')
+
+TASK_JOURNAL_ENABLED = os.getenv('TASK_JOURNAL_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+TASK_JOURNAL_DIR = os.getenv('TASK_JOURNAL_DIR') or \
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'detail', '.task_journal')
+TASK_JOURNAL_TTL_HOURS = float(os.getenv('TASK_JOURNAL_TTL_HOURS', '24'))
+
+CALLBACK_ENABLED = os.getenv('CALLBACK_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+CALLBACK_HOST = os.getenv('CALLBACK_HOST', '0.0.0.0')
+CALLBACK_PORT = int(os.getenv('CALLBACK_PORT', '0'))
+CALLBACK_PUBLIC_URL = os.getenv('CALLBACK_PUBLIC_URL', '')
+CALLBACK_FIELD = os.getenv('CALLBACK_FIELD', 'callback_url')
+CALLBACK_SAFETY_POLL_SECONDS = float(os.getenv('CALLBACK_SAFETY_POLL_SECONDS', '30'))
+
+# Квоты серверов (создание задач и опрос результатов вместе): RATE_LIMIT_RPS - для всех серверов,
+# RATE_LIMITS - переопределения вида server1:5:10,server2:2 (имя:запросов_в_сек[:всплеск])
+RATE_LIMIT_RPS = float(os.getenv('RATE_LIMIT_RPS', '0'))
+RATE_LIMIT_BURST = max(1, int(os.getenv('RATE_LIMIT_BURST', '5')))
+RATE_LIMITS = os.getenv('RATE_LIMITS', '')
+
+# Хеджирование: задача дольше HEDGE_PERCENTILE-го процентиля недавних задержек дублируется на HEDGE_SERVER
+# (не задан - тот же сервер, с предупреждением при запуске), в локальном режиме - вторым процессом распознавателя; берется первый результат.
+# Пакетный локальный режим (LOCAL_BATCH_MODE) не хеджируется
+HEDGE_ENABLED = os.getenv('HEDGE_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+HEDGE_SERVER = os.getenv('HEDGE_SERVER', '')
+HEDGE_PERCENTILE = float(os.getenv('HEDGE_PERCENTILE', '95'))
+HEDGE_MIN_SAMPLES = max(1, int(os.getenv('HEDGE_MIN_SAMPLES', '20')))
+HEDGE_BUDGET = float(os.getenv('HEDGE_BUDGET', '0.05'))
+HEDGE_MIN_DELAY = float(os.getenv('HEDGE_MIN_DELAY', '1.0'))
+HEDGE_WINDOW = max(1, int(os.getenv('HEDGE_WINDOW', '200')))
+
+PROFILE_ENABLED = os.getenv('PROFILE_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+PROFILE_TRACEMALLOC_EVERY = int(os.getenv('PROFILE_TRACEMALLOC_EVERY', '0'))
+PROFILE_TRACEMALLOC_TOP = int(os.getenv('PROFILE_TRACEMALLOC_TOP', '15'))
+PROFILE_SAMPLE_INTERVAL = float(os.getenv('PROFILE_SAMPLE_INTERVAL', '0'))
+
+ADAPTIVE_CONCURRENCY = os.getenv('ADAPTIVE_CONCURRENCY', 'false').lower() in ('1', 'true', 'yes')
+ADAPTIVE_MIN_CONCURRENCY = max(1, int(os.getenv('ADAPTIVE_MIN_CONCURRENCY', '1')))
+ADAPTIVE_MAX_CONCURRENCY = max(1, int(os.getenv('ADAPTIVE_MAX_CONCURRENCY', '16')))
+ADAPTIVE_LATENCY_TOLERANCE = float(os.getenv('ADAPTIVE_LATENCY_TOLERANCE', '2.0'))
+# 0 - ядра делятся между одновременными процессами распознавателя; с ADAPTIVE_CONCURRENCY - по стартовому
+# лимиту (MAX_WORKERS). Если AIMD поднимет параллелизм выше него, потоков станет больше ядер
+RECOGNIZER_THREADS = int(os.getenv('RECOGNIZER_THREADS', '0'))
+
+LOCAL_BATCH_MODE = os.getenv('LOCAL_BATCH_MODE', 'auto')
+LOCAL_BATCH_MAX_SIZE = max(1, int(os.getenv('LOCAL_BATCH_MAX_SIZE', '16')))
+LOCAL_BATCH_TARGET_SECONDS = float(os.getenv('LOCAL_BATCH_TARGET_SECONDS', '30'))
+
+SAMPLING_ENABLED = os.getenv('SAMPLING_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+SAMPLE_CI_WIDTH = float(os.getenv('SAMPLE_CI_WIDTH', '2.0'))
+SAMPLE_CONFIDENCE = float(os.getenv('SAMPLE_CONFIDENCE', '0.95'))
+SAMPLE_MIN_SIZE = int(os.getenv('SAMPLE_MIN_SIZE', '30'))
+SAMPLE_CHECK_EVERY = max(1, int(os.getenv('SAMPLE_CHECK_EVERY', '10')))
+SAMPLE_SEED = int(os.getenv('SAMPLE_SEED')) if os.getenv('SAMPLE_SEED') else None
+
+# Обработка частями: эталоны читаются и результаты пишутся по CHUNK_SIZE строк, память не зависит от размера набора
+CHUNKED_MODE = os.getenv('CHUNKED_MODE', 'false').lower() in ('1', 'true', 'yes')
+CHUNK_SIZE = max(1, int(os.getenv('CHUNK_SIZE', '5000')))
+
+# Срезы точности: кроме модели, тарифа, размера изображения и уверенности - колонки через запятую
+SLICE_COLUMNS = [c.strip() for c in os.getenv('SLICE_COLUMNS', '').split(',') if c.strip()]
+SLICE_MAX_VALUES = max(1, int(os.getenv('SLICE_MAX_VALUES', '50')))
 
 logger.info("🔧 ФИНАЛЬНЫЕ ЗНАЧЕНИЯ КОНФИГУРАЦИИ:")
-logger.info(f"   MAX_WORKERS: 1")
+logger.info(f"   MAX_WORKERS: {MAX_WORKERS}")
 logger.info(f"   PROCESSING_MODE: '{PROCESSING_MODE}'")
+logger.info(f"   SCHEDULING_STRATEGY: '{SCHEDULING_STRATEGY}'")
+if ADAPTIVE_CONCURRENCY:
+    logger.info(f"   ADAPTIVE_CONCURRENCY: {ADAPTIVE_MIN_CONCURRENCY}..{ADAPTIVE_MAX_CONCURRENCY}")
+if SAMPLING_ENABLED:
+    logger.info(f"   SAMPLING: ширина интервала {SAMPLE_CI_WIDTH} п.п., доверие {SAMPLE_CONFIDENCE}")
+if CHUNKED_MODE:
+    logger.info(f"   CHUNKED_MODE: части по {CHUNK_SIZE} строк")
 logger.info(f"   SELECTED_SERVER: '{SELECTED_SERVER}'")
+if HEDGE_ENABLED and SELECTED_SERVER != 'default' and (HEDGE_SERVER or SELECTED_SERVER) == SELECTED_SERVER:
+    logger.warning(f"⚠️ HEDGE_SERVER не задан или совпадает с SELECTED_SERVER: повторы уйдут на тот же сервер "
+                   f"'{SELECTED_SERVER}' и его circuit breaker - от перегрузки или отказа сервера хеджирование "
+                   f"не защитит. Укажите резервный сервер в HEDGE_SERVER")
 logger.info(f"   DB_TYPE: '{DB_TYPE}'")
 logger.info(f"   DB_PATH: '{DB_PATH}'")
+logger.info(f"   LOG_PROFILE: '{LOG_PROFILE}' ({LOG_FORMAT}, sample rate {LOG_SAMPLE_RATE})")
 
+@lru_cache(maxsize=None)
 def get_git_version():
     try:
         result = subprocess.run(
@@ -114,6 +211,16 @@ THICK_BORDER = Side(border_style="thick", color="000000")
 HEADER_FILL = BLUE_FILL
 
 TIMEOUT = 120
+
+RETRY_MAX_ATTEMPTS = int(os.getenv('RETRY_MAX_ATTEMPTS', '3'))
+RETRY_BACKOFF_BASE = float(os.getenv('RETRY_BACKOFF_BASE', '5'))
+RETRY_BACKOFF_MAX = float(os.getenv('RETRY_BACKOFF_MAX', '120'))
+RUN_DEADLINE_SECONDS = float(os.getenv('RUN_DEADLINE_SECONDS', '0'))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', '5'))
+CIRCUIT_RESET_SECONDS = float(os.getenv('CIRCUIT_RESET_SECONDS', '30'))
+# Промежуточное сохранение результатов в Excel не чаще раза в PROGRESS_SAVE_INTERVAL секунд: каждое
+# сохранение переписывает всю книгу. 0 - только итоговое сохранение
+PROGRESS_SAVE_INTERVAL = float(os.getenv('PROGRESS_SAVE_INTERVAL', '30'))
 SUPPORTED_IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.tif')
 
 logger.info("=" * 60)
@@ -1,45 +1,99 @@
 import sqlite3
+import json
 import logging
 import os
+import threading
+from contextlib import contextmanager
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
 
+PRAGMAS = (
+    "PRAGMA foreign_keys = ON",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA busy_timeout = 30000",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -16000",
+    "PRAGMA mmap_size = 268435456",
+)
+
+
 class DatabaseManager:
-    def __init__(self):
-        self.connection = None
-        from config import DB_PATH
-        self.db_path = DB_PATH
-        self.connect()
+    def __init__(self, db_path=None):
+        if db_path is None:
+            from config import DB_PATH
+            db_path = DB_PATH
+        self.db_path = db_path
+        self.last_insert_id = None
+        # Соединение открывается лениво и свое для каждого потока; запись в SQLite
+        # все равно однопоточная, поэтому писатели внутри процесса идут через блокировку
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._write_lock = threading.RLock()
+        self._schema_ready = False
+
+    @property
+    def connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self.connect()
+        return connection
 
     def connect(self):
         try:
             db_dir = os.path.dirname(self.db_path)
             if db_dir and not os.path.exists(db_dir):
-                os.makedirs(db_dir)
+                os.makedirs(db_dir, exist_ok=True)
 
-            self.connection = sqlite3.connect(
+            connection = sqlite3.connect(
                 self.db_path,
                 check_same_thread=False,
-                timeout=30
+                timeout=30,
+                cached_statements=256
             )
-            self.connection.execute("PRAGMA foreign_keys = ON")
-            self.connection.execute("PRAGMA journal_mode = WAL")
-            self.connection.row_factory = sqlite3.Row
-
-            self._create_tables()
-            logger.info(f"✅ Успешное подключение к SQLite: {self.db_path}")
+            connection.row_factory = sqlite3.Row
+            for pragma in PRAGMAS:
+                connection.execute(pragma)
+
+            self._local.connection = connection
+            with self._connections_lock:
+                self._connections.append(connection)
+
+            if not self._schema_ready:
+                with self._write_lock:
+                    if not self._schema_ready:
+                        connection.execute("PRAGMA journal_mode = WAL")
+                        self._create_tables(connection)
+                        self._schema_ready = True
+                        logger.info(f"✅ Успешное подключение к SQLite: {self.db_path}")
+            return connection
         except Exception as e:
             logger.error(f"❌ Ошибка подключения к SQLite: {e}")
-            self.connection = None
+            self._local.connection = None
+            return None
 
-    def _create_tables(self):
-        if not self.connection:
-            return
+    @contextmanager
+    def write_transaction(self):
+        connection = self.connection
+        if connection is None:
+            raise sqlite3.OperationalError(f"Нет соединения с {self.db_path}")
+        with self._write_lock:
+            cursor = connection.cursor()
+            try:
+                cursor.execute("BEGIN IMMEDIATE")
+                yield cursor
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
+            finally:
+                cursor.close()
 
+    def _create_tables(self, connection):
         try:
-            cursor = self.connection.cursor()
+            cursor = connection.cursor()
 
             create_table_query = """
             CREATE TABLE IF NOT EXISTS test_results (
@@ -62,20 +116,80 @@ class DatabaseManager:
             """
 
             cursor.execute(create_table_query)
-            self.connection.commit()
-            logger.info("✅ Таблица test_results создана/проверена")
+
+            create_character_metrics_query = """
+            CREATE TABLE IF NOT EXISTS character_metrics (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                test_result_id INTEGER NOT NULL,
+                field VARCHAR(50) NOT NULL,
+                rows_count INTEGER NOT NULL DEFAULT 0,
+                reference_chars INTEGER NOT NULL DEFAULT 0,
+                edit_distance INTEGER NOT NULL DEFAULT 0,
+                cer DECIMAL(6,2) NOT NULL DEFAULT 0.00,
+                length_mismatch INTEGER NOT NULL DEFAULT 0,
+                position_accuracy TEXT,
+                digit_confusion TEXT,
+                FOREIGN KEY (test_result_id) REFERENCES test_results(id) ON DELETE CASCADE
+            )
+            """
+
+            cursor.execute(create_character_metrics_query)
+
+            create_accuracy_slices_query = """
+            CREATE TABLE IF NOT EXISTS accuracy_slices (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                test_result_id INTEGER NOT NULL,
+                dimension VARCHAR(100) NOT NULL,
+                value TEXT NOT NULL,
+                total_tests INTEGER NOT NULL DEFAULT 0,
+                total_accuracy DECIMAL(5,2) NOT NULL DEFAULT 0.00,
+                counter_reading_accuracy DECIMAL(5,2) NOT NULL DEFAULT 0.00,
+                serial_number_accuracy DECIMAL(5,2) NOT NULL DEFAULT 0.00,
+                counter_model_accuracy DECIMAL(5,2) NOT NULL DEFAULT 0.00,
+                tariff_accuracy DECIMAL(5,2) NOT NULL DEFAULT 0.00,
+                FOREIGN KEY (test_result_id) REFERENCES test_results(id) ON DELETE CASCADE
+            )
+            """
+
+            cursor.execute(create_accuracy_slices_query)
+            connection.commit()
+            logger.info("✅ Таблицы test_results, character_metrics, accuracy_slices созданы/проверены")
 
         except Exception as e:
             logger.error(f"❌ Ошибка создания таблиц: {e}")
 
+    def _test_result_values(self, report_data, excel_file_path=None):
+        from config import APP_VERSION
+
+        file_info = f"Файл: {os.path.basename(excel_file_path)}" if excel_file_path else "Тестовые данные"
+        comments = f"Автоматическое тестирование. {file_info}. Успешность: {report_data['success_rate']:.1f}%"
+        sampling = report_data.get('sampling')
+        if sampling:
+            comments += f". Выборочная оценка: {sampling['sampled']} из {sampling['population']} изображений"
+        if report_data.get('watch'):
+            comments += f". Режим наблюдения: обновлений {report_data['watch']['updates']}"
+
+        return (
+            report_data['completion_time'],
+            APP_VERSION,
+            "test_suite_v1.0",
+            report_data['total_images'],
+            report_data['successfully_processed'],
+            report_data['errors'],
+            report_data['accuracy']['overall']['accuracy'],
+            report_data['accuracy']['indications']['accuracy'],
+            report_data['accuracy']['series']['accuracy'],
+            report_data['accuracy']['model']['accuracy'],
+            report_data['accuracy']['rate']['accuracy'],
+            report_data['total_time_seconds'],
+            comments
+        )
+
     def save_test_result(self, report_data, excel_file_path=None):
         if not self.connection:
-            self.connect()
-            if not self.connection:
-                return False
+            return False
 
         try:
-            cursor = self.connection.cursor()
             query = """
             INSERT INTO test_results (
                 test_date, system_version, test_system_version, total_images,
@@ -84,44 +198,140 @@ class DatabaseManager:
                 duration_seconds, comments
             ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             """
-            from config import APP_VERSION
-
-            file_info = f"Файл: {os.path.basename(excel_file_path)}" if excel_file_path else "Тестовые данные"
-            comments = f"Автоматическое тестирование. {file_info}. Успешность: {report_data['success_rate']:.1f}%"
-
-            values = (
-                report_data['completion_time'],
-                APP_VERSION,
-                "test_suite_v1.0",
-                report_data['total_images'],
-                report_data['successfully_processed'],
-                report_data['errors'],
-                report_data['accuracy']['overall']['accuracy'],
-                report_data['accuracy']['indications']['accuracy'],
-                report_data['accuracy']['series']['accuracy'],
-                report_data['accuracy']['model']['accuracy'],
-                report_data['accuracy']['rate']['accuracy'],
-                report_data['total_time_seconds'],
-                comments
-            )
+            values = self._test_result_values(report_data, excel_file_path)
 
-            cursor.execute(query, values)
-            self.connection.commit()
+            with self.write_transaction() as cursor:
+                cursor.execute(query, values)
+                test_result_id = cursor.lastrowid
+                self._save_character_metrics(cursor, test_result_id, report_data.get('character_metrics'))
+                self._save_accuracy_slices(cursor, test_result_id, report_data.get('slices'))
+            self.last_insert_id = test_result_id
 
-            logger.info(f"✅ Результаты тестирования сохранены в базу данных (ID: {cursor.lastrowid})")
-            return True
+            logger.info(f"✅ Результаты тестирования сохранены в базу данных (ID: {test_result_id})")
+            return test_result_id
 
         except Exception as e:
             logger.error(f"❌ Ошибка сохранения в базу данных: {e}")
             return False
+
+    def update_test_result(self, test_result_id, report_data, excel_file_path=None):
+        if not self.connection:
+            return False
+
+        try:
+            query = """
+            UPDATE test_results SET
+                test_date = ?, system_version = ?, test_system_version = ?, total_images = ?,
+                successful_images = ?, error_images = ?, total_accuracy = ?, counter_reading_accuracy = ?,
+                serial_number_accuracy = ?, counter_model_accuracy = ?, tariff_accuracy = ?,
+                duration_seconds = ?, comments = ?
+            WHERE id = ?
+            """
+            values = self._test_result_values(report_data, excel_file_path) + (test_result_id,)
+
+            with self.write_transaction() as cursor:
+                cursor.execute(query, values)
+                if cursor.rowcount == 0:
+                    logger.warning(f"⚠️ Запись {test_result_id} не найдена в базе данных")
+                    return False
+                if report_data.get('character_metrics'):
+                    cursor.execute("DELETE FROM character_metrics WHERE test_result_id = ?", (test_result_id,))
+                    self._save_character_metrics(cursor, test_result_id, report_data['character_metrics'])
+                if report_data.get('slices'):
+                    cursor.execute("DELETE FROM accuracy_slices WHERE test_result_id = ?", (test_result_id,))
+                    self._save_accuracy_slices(cursor, test_result_id, report_data['slices'])
+
+            logger.info(f"✅ Результаты тестирования обновлены в базе данных (ID: {test_result_id})")
+            return test_result_id
+
+        except Exception as e:
+            logger.error(f"❌ Ошибка обновления записи в базе данных: {e}")
+            return False
+
+    def _save_character_metrics(self, cursor, test_result_id, character_metrics):
+        if not character_metrics:
+            return
+
+        query = """
+        INSERT INTO character_metrics (
+            test_result_id, field, rows_count, reference_chars, edit_distance,
+            cer, length_mismatch, position_accuracy, digit_confusion
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """
+        cursor.executemany(query, [
+            (
+                test_result_id,
+                field,
+                metrics['rows'],
+                metrics['reference_chars'],
+                metrics['edit_distance'],
+                metrics['cer'],
+                metrics['length_mismatch'],
+                json.dumps(metrics['position_accuracy']),
+                json.dumps(metrics['digit_confusion'])
+            )
+            for field, metrics in character_metrics.items()
+        ])
+
+    def get_character_metrics(self, test_result_id):
+        cursor = None
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute("SELECT * FROM character_metrics WHERE test_result_id = ?", (test_result_id,))
+            metrics = {}
+            for row in cursor.fetchall():
+                record = dict(row)
+                record['position_accuracy'] = json.loads(record['position_accuracy'] or '[]')
+                record['digit_confusion'] = json.loads(record['digit_confusion'] or '[]')
+                metrics[record['field']] = record
+            return metrics
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения посимвольных метрик: {e}")
+            return {}
         finally:
             if cursor:
                 cursor.close()
 
-    def get_test_history(self, limit=10):
-        if not self.connection:
-            self.connect()
+    def _save_accuracy_slices(self, cursor, test_result_id, slices):
+        if not slices:
+            return
+
+        query = """
+        INSERT INTO accuracy_slices (
+            test_result_id, dimension, value, total_tests, total_accuracy, counter_reading_accuracy,
+            serial_number_accuracy, counter_model_accuracy, tariff_accuracy
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """
+        cursor.executemany(query, [
+            (
+                test_result_id,
+                item['dimension'],
+                item['value'],
+                item['total_tests'],
+                item['overall']['accuracy'],
+                item['indications']['accuracy'],
+                item['series']['accuracy'],
+                item['model']['accuracy'],
+                item['rate']['accuracy']
+            )
+            for item in slices
+        ])
+
+    def get_accuracy_slices(self, test_result_id):
+        cursor = None
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute("SELECT * FROM accuracy_slices WHERE test_result_id = ? ORDER BY id", (test_result_id,))
+            return [dict(row) for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения срезов точности: {e}")
+            return []
+        finally:
+            if cursor:
+                cursor.close()
 
+    def get_test_history(self, limit=10):
+        cursor = None
         try:
             cursor = self.connection.cursor()
 
@@ -146,10 +356,9 @@ class DatabaseManager:
 
     def get_total_records(self):
         if not self.connection:
-            self.connect()
-            if not self.connection:
-                return 0
+            return 0
 
+        cursor = None
         try:
             cursor = self.connection.cursor()
             cursor.execute("SELECT COUNT(*) FROM test_results")
@@ -163,46 +372,53 @@ class DatabaseManager:
                 cursor.close()
 
     def get_last_insert_id(self):
-        if not self.connection:
-            return "N/A"
-
-        try:
-            cursor = self.connection.cursor()
-            cursor.execute("SELECT last_insert_rowid()")
-            result = cursor.fetchone()
-            return result[0] if result else "N/A"
-        except Exception as e:
-            logger.error(f"❌ Ошибка получения последнего ID: {e}")
-            return "N/A"
-        finally:
-            if cursor:
-                cursor.close()
+        return self.last_insert_id if self.last_insert_id is not None else "N/A"
 
     def clear_test_data(self):
         if not self.connection:
             return False
 
         try:
-            cursor = self.connection.cursor()
-            cursor.execute("DELETE FROM test_results")
-            self.connection.commit()
+            with self.write_transaction() as cursor:
+                cursor.execute("DELETE FROM test_results")
             logger.info("✅ Тестовые данные очищены")
             return True
         except Exception as e:
             logger.error(f"❌ Ошибка очистки данных: {e}")
             return False
-        finally:
-            if cursor:
-                cursor.close()
 
-    def backup_database(self, backup_path=None):
+    def checkpoint(self, mode='TRUNCATE'):
+        if not self.connection:
+            return None
+
+        try:
+            with self._write_lock:
+                busy, wal_pages, checkpointed = self.connection.execute(
+                    f"PRAGMA wal_checkpoint({mode})").fetchone()
+            logger.info(f"✅ WAL checkpoint ({mode}): {checkpointed}/{wal_pages} страниц"
+                        + (", база занята читателями" if busy else ""))
+            return busy, wal_pages, checkpointed
+        except Exception as e:
+            logger.error(f"❌ Ошибка WAL checkpoint: {e}")
+            return None
+
+    def backup_database(self, backup_path=None, pages=256):
+        if not self.connection:
+            return None
+
         try:
             if backup_path is None:
                 timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
                 backup_path = f"backup_testing_system_{timestamp}.db"
 
-            import shutil
-            shutil.copy2(self.db_path, backup_path)
+            # Онлайн-копия через backup API пакетами по pages страниц. Писатели процесса ждут
+            # на блокировке (иначе каждая запись перезапускает копирование), читатели работают
+            target = sqlite3.connect(backup_path)
+            try:
+                with self._write_lock:
+                    self.connection.backup(target, pages=pages)
+            finally:
+                target.close()
             logger.info(f"✅ Резервная копия создана: {backup_path}")
             return backup_path
         except Exception as e:
@@ -210,9 +426,23 @@ class DatabaseManager:
             return None
 
     def close(self):
-        if self.connection:
-            self.connection.close()
-            logger.info("✅ Соединение с базой данных закрыто")
-
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        if not connections:
+            return
 
-db_manager = DatabaseManager()
\ No newline at end of file
+        try:
+            connections[0].execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ WAL checkpoint при закрытии не выполнен: {e}")
+        for connection in connections:
+            try:
+                connection.close()
+            except sqlite3.Error:
+                pass
+        self._local = threading.local()
+        logger.info("✅ Соединение с базой данных закрыто")
+
+
+# Соединение открывается при первом обращении, а не при импорте модуля
+db_manager = DatabaseManager()
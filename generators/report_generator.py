@@ -3,7 +3,9 @@ import pandas as pd
 import openpyxl
 from openpyxl.utils import get_column_letter
 from config import *
-from accuracy_calculator import calculate_accuracy_stats
+from accuracy_calculator import calculate_accuracy_stats, calculate_character_metrics, calculate_slice_stats
+from utils.log_utils import DETAIL, SUMMARY
+from process.sampler import SAMPLING_LABELS
 
 logger = logging.getLogger(__name__)
 
@@ -36,7 +38,7 @@ def add_version_info_to_excel(wb, excel_file_path):
         ws.column_dimensions['C'].width = 25
         ws.column_dimensions['D'].width = 25
 
-        logger.info(f"Добавлена информация о версии v{version} и времени {creation_time} в файл")
+        logger.info(f"Добавлена информация о версии v{version} и времени {creation_time} в файл", extra=DETAIL)
 
     except Exception as e:
         logger.warning(f"Не удалось добавить информацию о версии в Excel: {e}")
@@ -165,71 +167,52 @@ def auto_adjust_column_widths(ws, start_row=4):
         ws.column_dimensions[column_letter].width = adjusted_width
 
 
-def generate_summary_report(processed_count, errors_count, skipped_count, total_time, excel_file):
+def generate_summary_report(processed_count, errors_count, skipped_count, total_time, excel_file,
+                            retry_stats=None, schedule_stats=None, sampling_stats=None,
+                            concurrency_stats=None, dedup_stats=None, prefetch_stats=None,
+                            callback_stats=None, rate_limit_stats=None, hedge_stats=None, chunked_stats=None):
     logger.info(f"🎯 ПОЛУЧЕН ФАЙЛ В generate_summary_report: {excel_file}")
     logger.info(f"📁 Абсолютный путь: {os.path.abspath(excel_file)}")
 
     total_attempted = processed_count + errors_count
     timing_totals = []
 
-    try:
-        logger.info(f"📊 ЗАГРУЖАЕМ ДАННЫЕ ДЛЯ РАСЧЕТА ТОЧНОСТИ ИЗ: {excel_file}")
-
-        df_full = pd.read_excel(excel_file, sheet_name='Image Data', header=None)
-        logger.info(f"📋 ВСЕГО СТРОК В ФАЙЛЕ: {len(df_full)}")
-
-        header_row = None
-        for i in range(min(10, len(df_full))):
-            row_values = [str(x) for x in df_full.iloc[i].values if pd.notna(x)]
-            logger.info(f"   Строка {i}: {row_values}")
-            if 'Filename' in row_values:
-                header_row = i
-                logger.info(f"✅ НАЙДЕНЫ ЗАГОЛОВКИ В СТРОКЕ {i}")
-                break
-
-        if header_row is None:
-            logger.error("❌ НЕ НАЙДЕНА СТРОКА С ЗАГОЛОВКАМИ")
-            accuracy_stats = create_empty_accuracy_stats()
-        else:
-            df = pd.read_excel(excel_file, sheet_name='Image Data', header=header_row)
-            logger.info(f"📊 ЗАГРУЖЕНО ДАННЫХ: {len(df)} строк, {len(df.columns)} колонок")
-            logger.info(f"📋 КОЛОНКИ: {list(df.columns)}")
-
-            # ПОЛУЧАЕМ TIMING TOTALS ИЗ DataFrame
-            if 'Timing Total' in df.columns:
-                timing_totals = df['Timing Total'].dropna().tolist()
-                logger.info(f"⏱️  Найдено {len(timing_totals)} значений Timing Total")
-                if timing_totals:
-                    avg_from_timing = sum(timing_totals) / len(timing_totals)
-                    logger.info(f"📊 Среднее время из Timing Total: {avg_from_timing:.2f} сек")
-            else:
-                logger.warning("⚠️ Колонка 'Timing Total' не найдена в DataFrame")
-
-            required_cols = ['Indications Match', 'Series Match', 'Model Match', 'Rate Match', 'Overall Match']
-            for col in required_cols:
-                if col in df.columns:
-                    non_zero = (df[col] == 1).sum()
-                    logger.info(f"   ✅ {col}: {non_zero} совпадений из {len(df)}")
-                else:
-                    logger.error(f"   ❌ {col}: ОТСУТСТВУЕТ")
-
-            accuracy_stats = calculate_accuracy_stats(df)
-
-    except Exception as e:
-        logger.error(f"❌ Ошибка загрузки данных для расчета точности: {str(e)}")
-        import traceback
-        logger.error(f"📋 Детали ошибки: {traceback.format_exc()}")
-        accuracy_stats = create_empty_accuracy_stats()
+    if chunked_stats is not None:
+        accuracy_stats, character_metrics, slices = accuracy_from_chunks(chunked_stats, retry_stats)
+    else:
+        accuracy_stats, character_metrics, timing_totals, slices = accuracy_from_results(excel_file, sampling_stats,
+                                                                                         retry_stats)
 
     report = create_report_dict(processed_count, errors_count, skipped_count,
-                                total_attempted, total_time, accuracy_stats, timing_totals)
+                                total_attempted, total_time, accuracy_stats, timing_totals,
+                                character_metrics)
+    report['retries'] = retry_stats
+    report['schedule'] = schedule_stats
+    report['sampling'] = sampling_stats
+    report['concurrency'] = concurrency_stats
+    report['dedup'] = dedup_stats
+    report['prefetch'] = prefetch_stats
+    report['callbacks'] = callback_stats
+    report['rate_limits'] = rate_limit_stats
+    report['hedging'] = hedge_stats
+    report['slices'] = slices
+    report['chunked'] = None
+    if chunked_stats is not None:
+        if chunked_stats['average_timing'] is not None:
+            report['average_time_per_image'] = chunked_stats['average_timing']
+        report['chunked'] = {key: chunked_stats[key] for key in
+                             ('chunk_size', 'chunks', 'rows', 'missing_images', 'peak_rss_mb')}
 
     print_report(report)
 
     try:
         wb = openpyxl.load_workbook(excel_file)
-        from generators.summary_report import create_summary_sheet
+        from generators.summary_report import create_summary_sheet, create_concurrency_sheet, create_slices_sheet
         create_summary_sheet(wb, report)
+        if concurrency_stats:
+            create_concurrency_sheet(wb, concurrency_stats)
+        if slices:
+            create_slices_sheet(wb, slices)
         wb.save(excel_file)
         logger.info("✅ Итоговый отчет добавлен в Excel файл")
     except Exception as e:
@@ -240,6 +223,86 @@ def generate_summary_report(processed_count, errors_count, skipped_count, total_
     return report
 
 
+def accuracy_from_chunks(chunked_stats, retry_stats):
+    # Обработка частями: точность накоплена по частям, результаты целиком не загружаются
+    accuracy_stats = chunked_stats['accuracy'] or create_empty_accuracy_stats()
+    first_attempt = chunked_stats['first_attempt_accuracy']
+    retried = chunked_stats['retried_accuracy']
+    if retry_stats is not None and first_attempt is not None:
+        retry_stats['first_attempt_images'] = first_attempt['total_tests']
+        retry_stats['first_attempt_accuracy'] = first_attempt['overall']['accuracy']
+        retry_stats['retried_images'] = retried['total_tests']
+        retry_stats['retried_accuracy'] = retried['overall']['accuracy']
+    return accuracy_stats, chunked_stats['character_metrics'], chunked_stats['slices']
+
+
+def accuracy_from_results(excel_file, sampling_stats, retry_stats):
+    timing_totals = []
+    character_metrics = None
+    slices = None
+
+    try:
+        logger.info(f"📊 ЗАГРУЖАЕМ ДАННЫЕ ДЛЯ РАСЧЕТА ТОЧНОСТИ ИЗ: {excel_file}")
+
+        from utils.file_utils import load_results_data
+        df = load_results_data(excel_file)
+        logger.info(f"📊 ЗАГРУЖЕНО ДАННЫХ: {len(df)} строк, {len(df.columns)} колонок")
+        logger.info(f"📋 КОЛОНКИ: {list(df.columns)}", extra=DETAIL)
+
+        if sampling_stats is not None:
+            # В выборочном режиме точность считается только по обработанной выборке
+            sampled_files = set(sampling_stats.pop('sampled_files', []))
+            df = df[df['Filename'].astype(str).str.strip().isin(sampled_files)]
+            logger.info(f"🎲 Выборка: {len(df)} из {sampling_stats['population']} изображений")
+
+        # ПОЛУЧАЕМ TIMING TOTALS ИЗ DataFrame
+        if 'Timing Total' in df.columns:
+            timing_totals = df['Timing Total'].dropna().tolist()
+            logger.info(f"⏱️  Найдено {len(timing_totals)} значений Timing Total")
+            if timing_totals:
+                avg_from_timing = sum(timing_totals) / len(timing_totals)
+                logger.info(f"📊 Среднее время из Timing Total: {avg_from_timing:.2f} сек")
+        else:
+            logger.warning("⚠️ Колонка 'Timing Total' не найдена в DataFrame")
+
+        required_cols = ['Indications Match', 'Series Match', 'Model Match', 'Rate Match', 'Overall Match']
+        for col in required_cols:
+            if col in df.columns:
+                non_zero = (df[col] == 1).sum()
+                logger.info(f"   ✅ {col}: {non_zero} совпадений из {len(df)}")
+            else:
+                logger.error(f"   ❌ {col}: ОТСУТСТВУЕТ")
+
+        accuracy_stats = calculate_accuracy_stats(df)
+
+        try:
+            character_metrics = calculate_character_metrics(df)
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось рассчитать посимвольные метрики: {e}")
+
+        try:
+            slices = calculate_slice_stats(df, SLICE_COLUMNS, SLICE_MAX_VALUES)
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось рассчитать срезы точности: {e}")
+
+        if retry_stats is not None and 'Attempts' in df.columns:
+            attempts = pd.to_numeric(df['Attempts'], errors='coerce').fillna(0)
+            first_attempt = calculate_accuracy_stats(df[attempts == 1])
+            retried = calculate_accuracy_stats(df[attempts > 1])
+            retry_stats['first_attempt_images'] = first_attempt['total_tests']
+            retry_stats['first_attempt_accuracy'] = first_attempt['overall']['accuracy']
+            retry_stats['retried_images'] = retried['total_tests']
+            retry_stats['retried_accuracy'] = retried['overall']['accuracy']
+
+    except Exception as e:
+        logger.error(f"❌ Ошибка загрузки данных для расчета точности: {str(e)}")
+        import traceback
+        logger.error(f"📋 Детали ошибки: {traceback.format_exc()}")
+        accuracy_stats = create_empty_accuracy_stats()
+
+    return accuracy_stats, character_metrics, timing_totals, slices
+
+
 def create_empty_accuracy_stats():
     return {
         'total_tests': 0,
@@ -327,7 +390,8 @@ def create_empty_accuracy_stats():
 #     return report
 
 
-def create_report_dict(processed, errors, skipped, attempted, total_time, accuracy_stats, timing_totals=None):
+def create_report_dict(processed, errors, skipped, attempted, total_time, accuracy_stats, timing_totals=None,
+                       character_metrics=None):
     if timing_totals and len(timing_totals) > 0:
         average_time = sum(timing_totals) / len(timing_totals)
         logger.info(f"✅ Среднее время рассчитано из Timing Total: {average_time:.2f} сек")
@@ -345,34 +409,106 @@ def create_report_dict(processed, errors, skipped, attempted, total_time, accura
         "average_time_per_image": average_time,
         "images_per_minute": (attempted / total_time) * 60 if total_time > 0 else 0,
         "completion_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        "accuracy": accuracy_stats
+        "accuracy": accuracy_stats,
+        "character_metrics": character_metrics
     }
 
 
 def print_report(report):
     acc = report['accuracy']
 
-    logger.info("=" * 60)
-    logger.info("ИТОГОВЫЙ ОТЧЕТ С ТОЧНОСТЬЮ")
-    logger.info("=" * 60)
-    logger.info(f"Всего тестов: {acc['total_tests']}")
-    logger.info("=" * 50)
+    logger.info("=" * 60, extra=SUMMARY)
+    logger.info("ИТОГОВЫЙ ОТЧЕТ С ТОЧНОСТЬЮ", extra=SUMMARY)
+    logger.info("=" * 60, extra=SUMMARY)
+    logger.info(f"Всего тестов: {acc['total_tests']}", extra=SUMMARY)
+    logger.info("=" * 50, extra=SUMMARY)
     logger.info(
-        f"Показания: верно {acc['indications']['correct']}/{acc['total_tests']} ({acc['indications']['accuracy']:.1f}%)")
+        f"Показания: верно {acc['indications']['correct']}/{acc['total_tests']} ({acc['indications']['accuracy']:.1f}%)", extra=SUMMARY)
     logger.info(
-        f"Серийные номера: верно {acc['series']['correct']}/{acc['total_tests']} ({acc['series']['accuracy']:.1f}%)")
-    logger.info(f"Модели: верно {acc['model']['correct']}/{acc['total_tests']} ({acc['model']['accuracy']:.1f}%)")
-    logger.info(f"Тарифы: верно {acc['rate']['correct']}/{acc['total_tests']} ({acc['rate']['accuracy']:.1f}%)")
-    logger.info("=" * 50)
-    logger.info(f"Общая точность: {acc['overall']['accuracy']:.1f}%")
-    logger.info("=" * 50)
-    logger.info(f"Всего файлов: {report['total_images']}")
-    logger.info(f"Успешно обработано: {report['successfully_processed']}")
-    logger.info(f"Ошибок: {report['errors']}")
-    logger.info(f"Пропущено: {report['skipped']}")
-    logger.info(f"Успешность обработки: {report['success_rate']:.2f}%")
-    logger.info(f"Общее время: {report['total_time_seconds']:.2f} секунд")
-    logger.info(f"Среднее время на изображение: {report['average_time_per_image']:.2f} секунд")
-    logger.info(f"Скорость обработки: {report['images_per_minute']:.2f} изображений/мин")
-    logger.info(f"Завершено: {report['completion_time']}")
-    logger.info("=" * 60)
\ No newline at end of file
+        f"Серийные номера: верно {acc['series']['correct']}/{acc['total_tests']} ({acc['series']['accuracy']:.1f}%)", extra=SUMMARY)
+    logger.info(f"Модели: верно {acc['model']['correct']}/{acc['total_tests']} ({acc['model']['accuracy']:.1f}%)", extra=SUMMARY)
+    logger.info(f"Тарифы: верно {acc['rate']['correct']}/{acc['total_tests']} ({acc['rate']['accuracy']:.1f}%)", extra=SUMMARY)
+    logger.info("=" * 50, extra=SUMMARY)
+    logger.info(f"Общая точность: {acc['overall']['accuracy']:.1f}%", extra=SUMMARY)
+    logger.info("=" * 50, extra=SUMMARY)
+    for field, label in (('indications', 'Показания'), ('series', 'Серийные номера')):
+        metrics = (report.get('character_metrics') or {}).get(field)
+        if metrics:
+            confusions = ', '.join(f"{pair}: {count}" for pair, count in metrics['top_confusions']) or '-'
+            logger.info(f"{label}: CER {metrics['cer']:.2f}% ({metrics['edit_distance']}/{metrics['reference_chars']} "
+                        f"симв.), частые ошибки цифр: {confusions}", extra=SUMMARY)
+    worst = {}
+    for item in report.get('slices') or []:
+        if item['dimension'] not in worst or item['overall']['accuracy'] < worst[item['dimension']]['overall']['accuracy']:
+            worst[item['dimension']] = item
+    for dimension, item in worst.items():
+        logger.info(f"Срез {dimension}: худшее значение '{item['value']}' - {item['overall']['accuracy']:.1f}% "
+                    f"({item['total_tests']} тестов)", extra=SUMMARY)
+    logger.info("=" * 50, extra=SUMMARY)
+    logger.info(f"Всего файлов: {report['total_images']}", extra=SUMMARY)
+    logger.info(f"Успешно обработано: {report['successfully_processed']}", extra=SUMMARY)
+    logger.info(f"Ошибок: {report['errors']}", extra=SUMMARY)
+    logger.info(f"Пропущено: {report['skipped']}", extra=SUMMARY)
+    logger.info(f"Успешность обработки: {report['success_rate']:.2f}%", extra=SUMMARY)
+    logger.info(f"Общее время: {report['total_time_seconds']:.2f} секунд", extra=SUMMARY)
+    logger.info(f"Среднее время на изображение: {report['average_time_per_image']:.2f} секунд", extra=SUMMARY)
+    logger.info(f"Скорость обработки: {report['images_per_minute']:.2f} изображений/мин", extra=SUMMARY)
+    retries = report.get('retries')
+    if retries and retries['deferred']:
+        logger.info(f"Отложено для повтора: {retries['deferred']}, восстановлено: {retries['recovered']}, "
+                    f"исчерпали попытки: {retries['exhausted']}, не успели до дедлайна: "
+                    f"{retries['deadline_expired']}", extra=SUMMARY)
+    sampling = report.get('sampling')
+    if sampling:
+        logger.info(f"Выборочная оценка: {sampling['sampled']} из {sampling['population']} изображений, "
+                    f"страт: {sampling['strata']}, доверие {sampling['confidence']:.0%}", extra=SUMMARY)
+        for field, label in SAMPLING_LABELS.items():
+            estimate = sampling['estimates'].get(field)
+            if estimate:
+                logger.info(f"   {label}: {estimate['estimate']:.1f}% [{estimate['low']:.1f}; {estimate['high']:.1f}]",
+                            extra=SUMMARY)
+    concurrency = report.get('concurrency')
+    if concurrency:
+        logger.info(f"Адаптивный параллелизм ({concurrency['name']}): средний {concurrency['average_limit']:.1f}, "
+                    f"пик {concurrency['peak_limit']}, итог {concurrency['final_limit']}, "
+                    f"снижений: {concurrency['decreases']}", extra=SUMMARY)
+    dedup = report.get('dedup')
+    if dedup and dedup['duplicates']:
+        saved = f", сэкономлено ~{dedup['saved_seconds']:.1f} сек распознавания" \
+            if dedup['saved_seconds'] is not None else ""
+        logger.info(f"Дубликаты ({dedup['mode']}): {dedup['duplicates']} из {dedup['images']} изображений, "
+                    f"результат скопирован в {dedup['fanned_out']} строк{saved}", extra=SUMMARY)
+    prefetch = report.get('prefetch')
+    if prefetch and prefetch['taken']:
+        logger.info(f"Упреждающее чтение: попаданий {prefetch['hit_rate']:.1f}% ({prefetch['hits']}/{prefetch['taken']}), "
+                    f"ожиданий диска: {prefetch['stalls']} ({prefetch['stall_seconds']:.2f} сек), "
+                    f"чтение {prefetch['read_mb_per_second']:.1f} МБ/сек", extra=SUMMARY)
+    callbacks = report.get('callbacks')
+    if callbacks and callbacks['tasks']:
+        logger.info(f"Обратные вызовы: результат в уведомлении {callbacks['pushed']}, уведомление + запрос "
+                    f"{callbacks['notified']}, найдено страховочным опросом {callbacks['polled']} из "
+                    f"{callbacks['tasks']}; сэкономлено опросов ~{callbacks['polls_avoided']}", extra=SUMMARY)
+    for bucket in report.get('rate_limits') or []:
+        logger.info(f"Квота {bucket['name']} ({bucket['rate']:g} запр/сек): создание задач {bucket['submit_requests']} "
+                    f"(ожидание {bucket['submit_wait_seconds']:.1f} сек), опрос {bucket['poll_requests']} "
+                    f"(ожидание {bucket['poll_wait_seconds']:.1f} сек)", extra=SUMMARY)
+    hedging = report.get('hedging')
+    if hedging and hedging['requests']:
+        p99 = f"{hedging['latency_p99']:.2f} сек" if hedging['latency_p99'] is not None else "нет данных"
+        logger.info(f"Хеджирование: повторов {hedging['hedged']} из {hedging['requests']} ({hedging['hedge_rate']:.1f}%), "
+                    f"выиграл повтор {hedging['hedge_wins']}, исходный {hedging['primary_wins']}, "
+                    f"отказов по бюджету {hedging['budget_denied']}; p99 задержки {p99}", extra=SUMMARY)
+    chunked = report.get('chunked')
+    if chunked:
+        peak = f"{chunked['peak_rss_mb']:.0f} МБ" if chunked['peak_rss_mb'] is not None else "нет данных"
+        logger.info(f"Обработка частями: {chunked['chunks']} частей по {chunked['chunk_size']} строк, "
+                    f"строк {chunked['rows']}, без изображения {chunked['missing_images']}, "
+                    f"пиковая память {peak}", extra=SUMMARY)
+    schedule = report.get('schedule')
+    if schedule and schedule['actual_makespan'] is not None:
+        predicted = f"{schedule['predicted_makespan']:.2f} сек" if schedule['predicted_makespan'] is not None \
+            else "нет истории"
+        logger.info(f"Планирование {schedule['strategy']} ({schedule['workers']} потоков): прогноз {predicted}, "
+                    f"факт {schedule['actual_makespan']:.2f} сек", extra=SUMMARY)
+    logger.info(f"Завершено: {report['completion_time']}", extra=SUMMARY)
+    logger.info("=" * 60, extra=SUMMARY)
\ No newline at end of file
@@ -1,5 +1,8 @@
 import logging
 from openpyxl.styles import Font, Alignment, Border, Side, PatternFill
+from openpyxl.utils import get_column_letter
+from openpyxl.chart import LineChart, Reference
+from process.sampler import SAMPLING_LABELS
 
 logger = logging.getLogger(__name__)
 
@@ -121,6 +124,107 @@ def create_summary_sheet(wb, report_data):
                                          stats_data, COLORS, header_font, bold_font,
                                          normal_font, left_alignment, thin_border)
 
+        retries = report_data.get('retries')
+        if retries:
+            current_row += 1
+            retry_rows = [
+                ("🔁 Отложено для повтора", retries['deferred']),
+                ("🔁 Повторных попыток", retries['retry_attempts']),
+                ("✅ Восстановлено повтором", retries['recovered']),
+                ("❌ Исчерпали попытки", f"{retries['exhausted']} (лимит {retries['max_attempts']})"),
+                ("⏰ Не успели до дедлайна", retries['deadline_expired']),
+                ("🔌 Срабатываний автомата", f"{retries['circuit_open_count']} "
+                                            f"(отклонено запросов: {retries['circuit_rejected']})"),
+            ]
+            if 'first_attempt_images' in retries:
+                retry_rows.append(("🎯 Точность с 1-й попытки",
+                                   f"{retries['first_attempt_accuracy']:.1f}% ({retries['first_attempt_images']} изобр.)"))
+                retry_rows.append(("🎯 Точность после повтора",
+                                   f"{retries['retried_accuracy']:.1f}% ({retries['retried_images']} изобр.)"))
+            current_row = _create_info_block(ws, current_row, "🔁 ПОВТОРНЫЕ ПОПЫТКИ", retry_rows,
+                                             COLORS, header_font, bold_font, normal_font,
+                                             left_alignment, thin_border)
+
+        sampling = report_data.get('sampling')
+        if sampling:
+            current_row += 1
+            current_row = _create_info_block(ws, current_row, "🎲 ВЫБОРОЧНАЯ ОЦЕНКА", _sampling_rows(sampling),
+                                             COLORS, header_font, bold_font, normal_font,
+                                             left_alignment, thin_border)
+
+        concurrency = report_data.get('concurrency')
+        if concurrency:
+            current_row += 1
+            current_row = _create_info_block(ws, current_row, "🎚️ АДАПТИВНЫЙ ПАРАЛЛЕЛИЗМ",
+                                             _concurrency_rows(concurrency), COLORS, header_font, bold_font,
+                                             normal_font, left_alignment, thin_border)
+
+        dedup = report_data.get('dedup')
+        if dedup and dedup['duplicates']:
+            current_row += 1
+            current_row = _create_info_block(ws, current_row, "🪞 ДУБЛИКАТЫ ИЗОБРАЖЕНИЙ", _dedup_rows(dedup),
+                                             COLORS, header_font, bold_font, normal_font,
+                                             left_alignment, thin_border)
+
+        prefetch = report_data.get('prefetch')
+        if prefetch and prefetch['taken']:
+            current_row += 1
+            current_row = _create_info_block(ws, current_row, "📖 УПРЕЖДАЮЩЕЕ ЧТЕНИЕ", _prefetch_rows(prefetch),
+                                             COLORS, header_font, bold_font, normal_font,
+                                             left_alignment, thin_border)
+
+        callbacks = report_data.get('callbacks')
+        if callbacks and callbacks['tasks']:
+            current_row += 1
+            current_row = _create_info_block(ws, current_row, "📬 ОБРАТНЫЕ ВЫЗОВЫ", _callback_rows(callbacks),
+                                             COLORS, header_font, bold_font, normal_font,
+                                             left_alignment, thin_border)
+
+        rate_limits = report_data.get('rate_limits')
+        if rate_limits:
+            current_row += 1
+            current_row = _create_info_block(ws, current_row, "🪣 КВОТЫ СЕРВЕРОВ", _rate_limit_rows(rate_limits),
+                                             COLORS, header_font, bold_font, normal_font,
+                                             left_alignment, thin_border)
+
+        hedging = report_data.get('hedging')
+        if hedging and hedging['requests']:
+            current_row += 1
+            current_row = _create_info_block(ws, current_row, "🐇 ХЕДЖИРОВАНИЕ ЗАПРОСОВ", _hedge_rows(hedging),
+                                             COLORS, header_font, bold_font, normal_font,
+                                             left_alignment, thin_border)
+
+        chunked = report_data.get('chunked')
+        if chunked:
+            current_row += 1
+            current_row = _create_info_block(ws, current_row, "🧩 ОБРАБОТКА ЧАСТЯМИ", _chunked_rows(chunked),
+                                             COLORS, header_font, bold_font, normal_font,
+                                             left_alignment, thin_border)
+
+        watch = report_data.get('watch')
+        if watch:
+            current_row += 1
+            current_row = _create_info_block(ws, current_row, "👁️ РЕЖИМ НАБЛЮДЕНИЯ", _watch_rows(watch),
+                                             COLORS, header_font, bold_font, normal_font,
+                                             left_alignment, thin_border)
+
+        schedule = report_data.get('schedule')
+        if schedule and schedule['actual_makespan'] is not None:
+            current_row += 1
+            current_row = _create_info_block(ws, current_row, "🗂️ ПЛАНИРОВАНИЕ", _schedule_rows(schedule),
+                                             COLORS, header_font, bold_font, normal_font,
+                                             left_alignment, thin_border)
+
+        character_metrics = report_data.get('character_metrics')
+        if character_metrics:
+            current_row += 1
+            current_row = _create_info_block(ws, current_row, "🔤 ПОСИМВОЛЬНЫЕ МЕТРИКИ",
+                                             _character_metrics_rows(character_metrics),
+                                             COLORS, header_font, bold_font, normal_font,
+                                             left_alignment, thin_border)
+            _add_confusion_matrices(ws, character_metrics, COLORS, header_font, bold_font,
+                                    normal_font, center_alignment, thin_border)
+
         current_row += 1
         ws.merge_cells(f'A{current_row}:B{current_row}')
         ws[f'A{current_row}'] = "🕒 Завершено:"
@@ -142,9 +246,17 @@ def create_summary_sheet(wb, report_data):
         try:
             from database.db_manager import db_manager
 
-            success = db_manager.save_test_result(report_data)
+            # Повторная запись того же прогона (режим наблюдения) обновляет прежнюю строку
+            record_id = report_data.get('db_record_id')
+            if record_id:
+                success = db_manager.update_test_result(record_id, report_data)
+            else:
+                success = db_manager.save_test_result(report_data)
+                if success:
+                    report_data['db_record_id'] = success
             if success:
                 logger.info("✅ Результаты успешно сохранены в базу данных MySQL")
+                db_manager.checkpoint('PASSIVE')
 
                 current_row += 2
                 _add_database_info_section(ws, current_row, COLORS, header_font,
@@ -215,6 +327,281 @@ def _add_database_info_section(ws, start_row, colors, header_font, bold_font,
         logger.warning(f"Не удалось добавить информацию о БД: {e}")
 
 
+def _sampling_rows(sampling):
+    stop_reasons = {'target_width': 'достигнута целевая ширина', 'exhausted': 'обработаны все изображения'}
+    rows = [
+        ("🎲 Объем выборки", f"{sampling['sampled']} из {sampling['population']} "
+                            f"(страт: {sampling['strata']})"),
+        ("📏 Целевая ширина", f"{sampling['target_width']:.1f} п.п. при доверии {sampling['confidence']:.0%}"),
+        ("🏁 Остановка", stop_reasons.get(sampling['stop_reason'], sampling['stop_reason'])),
+    ]
+    for field, label in SAMPLING_LABELS.items():
+        estimate = sampling['estimates'].get(field)
+        if estimate:
+            rows.append((f"🎯 {label}", f"{estimate['estimate']:.1f}% [{estimate['low']:.1f}; "
+                                       f"{estimate['high']:.1f}] ±{estimate['width'] / 2:.1f}"))
+    return rows
+
+
+def _concurrency_rows(concurrency):
+    baseline = concurrency['baseline_latency']
+    return [
+        ("🎚️ Ресурс", concurrency['name']),
+        ("📏 Границы", f"{concurrency['min_limit']}..{concurrency['max_limit']}"),
+        ("📊 Средний параллелизм", f"{concurrency['average_limit']:.1f} (пик {concurrency['peak_limit']}, "
+                                  f"итог {concurrency['final_limit']})"),
+        ("📉 Снижений лимита", f"{concurrency['decreases']} (перегрузок: {concurrency['overloads']})"),
+        ("⏱️ Базовая задержка", f"{baseline:.2f} сек" if baseline is not None else "нет данных"),
+        ("📈 График", "лист 'Параллелизм'"),
+    ]
+
+
+def _dedup_rows(dedup):
+    mode = f"перцептивный хэш, расстояние <= {dedup['max_distance']}" if dedup['mode'] == 'perceptual' \
+        else "точные копии (SHA-256)"
+    rows = [
+        ("🔎 Режим", mode),
+        ("🪞 Дубликатов", f"{dedup['duplicates']} из {dedup['images']} (групп: {dedup['groups']})"),
+        ("📑 Точных копий", dedup['exact_duplicates']),
+        ("🧩 Перекодированных копий", dedup['perceptual_duplicates']),
+        ("📋 Строк с результатом копии", dedup['fanned_out']),
+        ("⏱️ Хэширование", f"{dedup['hash_seconds']:.2f} сек"),
+    ]
+    if dedup['saved_seconds'] is not None:
+        rows.append(("💰 Сэкономлено распознавания", f"~{dedup['saved_seconds']:.1f} сек"))
+    return rows
+
+
+def _prefetch_rows(prefetch):
+    return [
+        ("📏 Глубина буфера", f"{prefetch['depth']} изображений / {prefetch['max_bytes'] / 2**20:.0f} МБ "
+                             f"(потоков чтения: {prefetch['workers']})"),
+        ("🎯 Попадания", f"{prefetch['hit_rate']:.1f}% ({prefetch['hits']} из {prefetch['taken']})"),
+        ("⏳ Ожидания диска", f"{prefetch['stalls']} ({prefetch['stall_seconds']:.2f} сек)"),
+        ("🚫 Промахи", prefetch['misses']),
+        ("💾 Прочитано", f"{prefetch['bytes_read'] / 2**20:.1f} МБ за {prefetch['read_seconds']:.2f} сек "
+                        f"({prefetch['read_mb_per_second']:.1f} МБ/сек)"),
+        ("📈 Пик буфера", f"{prefetch['peak_buffer_bytes'] / 2**20:.1f} МБ"),
+    ]
+
+
+def _callback_rows(callbacks):
+    return [
+        ("📨 Задач с обратным вызовом", callbacks['tasks']),
+        ("📬 Результат в уведомлении", callbacks['pushed']),
+        ("🔔 Уведомление + запрос результата", callbacks['notified']),
+        ("🛟 Найдено страховочным опросом", callbacks['polled']),
+        ("🔄 Запросов /result", f"{callbacks['requests']} (страховочных: {callbacks['safety_polls']})"),
+        ("💸 Сэкономлено опросов", f"~{callbacks['polls_avoided']} (против опроса раз в 5 сек)"),
+        ("⏱️ Среднее ожидание результата", f"{callbacks['mean_wait_seconds']:.2f} сек"),
+        ("📭 Задержка доставки уведомления", f"{callbacks['mean_delivery_ms']:.1f} мс"),
+        ("🚫 Отклонено уведомлений", callbacks['rejected']),
+    ]
+
+
+def _rate_limit_rows(rate_limits):
+    rows = []
+    for bucket in rate_limits:
+        rows.append((f"🪣 {bucket['name']}", f"{bucket['rate']:g} запр/сек, всплеск до {bucket['burst']}"))
+        rows.append(("   📤 Создание задач", f"{bucket['submit_requests']} запросов, ждали {bucket['submit_waited']} "
+                                            f"({bucket['submit_wait_seconds']:.1f} сек)"))
+        rows.append(("   🔄 Опрос результатов", f"{bucket['poll_requests']} запросов, ждали {bucket['poll_waited']} "
+                                              f"({bucket['poll_wait_seconds']:.1f} сек)"))
+        rows.append(("   ⏳ Всего ожидания квоты", f"{bucket['wait_seconds']:.1f} сек"))
+    return rows
+
+
+def _hedge_rows(hedging):
+    def seconds(value):
+        return f"{value:.2f} сек" if value is not None else "нет данных"
+
+    return [
+        ("🎯 Порог повтора", f"p{hedging['percentile']:g} недавних задержек, сейчас {seconds(hedging['threshold'])}"),
+        ("🐇 Повторов", f"{hedging['hedged']} из {hedging['requests']} ({hedging['hedge_rate']:.1f}%, "
+                       f"бюджет {hedging['budget'] * 100:g}%)"),
+        ("🏁 Первым пришел повтор", hedging['hedge_wins']),
+        ("🏁 Первым пришел исходный", hedging['primary_wins']),
+        ("🚫 Отказов по бюджету", hedging['budget_denied']),
+        ("⏱️ Задержка p50 / p95 / p99", f"{seconds(hedging['latency_p50'])} / {seconds(hedging['latency_p95'])} / "
+                                       f"{seconds(hedging['latency_p99'])}"),
+    ]
+
+
+def _chunked_rows(chunked):
+    peak = f"{chunked['peak_rss_mb']:.0f} МБ" if chunked['peak_rss_mb'] is not None else "нет данных"
+    return [
+        ("🧩 Размер части", f"{chunked['chunk_size']} строк"),
+        ("📦 Частей", chunked['chunks']),
+        ("📋 Строк эталонов", chunked['rows']),
+        ("🖼️ Строк без изображения", chunked['missing_images']),
+        ("🧠 Пиковая память процесса", peak),
+    ]
+
+
+def _watch_rows(watch):
+    rows = [
+        ("👁️ Способ наблюдения", watch['backend']),
+        ("🕐 Наблюдение с", watch['started']),
+        ("🔄 Обновлений отчета", watch['updates']),
+        ("⏳ Ждут строки в Excel", watch['pending']),
+    ]
+    batch = watch.get('last_batch')
+    if batch:
+        rows.append(("📦 Последнее обновление", f"{batch['reason']}: {batch['images']} изображений "
+                                                 f"за {batch['seconds']:.1f} сек"))
+    return rows
+
+
+def create_concurrency_sheet(wb, concurrency):
+    try:
+        if 'Параллелизм' in wb.sheetnames:
+            wb.remove(wb['Параллелизм'])
+        ws = wb.create_sheet('Параллелизм')
+
+        ws.append(['Время, сек', 'Лимит', 'В работе'])
+        for cell in ws[1]:
+            cell.font = Font(bold=True)
+        for elapsed, limit, in_flight in concurrency['history']:
+            ws.append([round(elapsed, 2), limit, in_flight])
+
+        chart = LineChart()
+        chart.title = f"Параллелизм: {concurrency['name']}"
+        chart.x_axis.title = 'Время, сек'
+        chart.y_axis.title = 'Запросов'
+        rows = len(concurrency['history']) + 1
+        chart.add_data(Reference(ws, min_col=2, max_col=3, min_row=1, max_row=rows), titles_from_data=True)
+        chart.set_categories(Reference(ws, min_col=1, min_row=2, max_row=rows))
+        chart.width = 24
+        chart.height = 12
+        ws.add_chart(chart, 'E2')
+
+        for col in 'ABC':
+            ws.column_dimensions[col].width = 14
+        return True
+
+    except Exception as e:
+        logger.error(f"Ошибка создания листа параллелизма: {str(e)}")
+        return False
+
+
+def create_slices_sheet(wb, slices):
+    try:
+        if 'Slices' in wb.sheetnames:
+            wb.remove(wb['Slices'])
+        ws = wb.create_sheet('Slices')
+
+        ws.append(['Срез', 'Значение', 'Тестов', 'Показания, %', 'Серийные номера, %', 'Модели, %', 'Тарифы, %',
+                   'Общая точность, %'])
+        for cell in ws[1]:
+            cell.font = Font(bold=True)
+        for item in slices:
+            ws.append([item['dimension'], item['value'], item['total_tests']] +
+                      [round(item[key]['accuracy'], 2) for key in ('indications', 'series', 'model', 'rate', 'overall')])
+
+        ws.freeze_panes = 'A2'
+        ws.auto_filter.ref = ws.dimensions
+        for col, width in zip('ABCDEFGH', (22, 28, 10, 14, 20, 12, 12, 18)):
+            ws.column_dimensions[col].width = width
+        return True
+
+    except Exception as e:
+        logger.error(f"Ошибка создания листа срезов: {str(e)}")
+        return False
+
+
+def _schedule_rows(schedule):
+    sources = schedule['cost_sources']
+    rows = [
+        ("🗂️ Порядок обработки", f"{schedule['strategy']} ({schedule['workers']} потоков)"),
+        ("📐 Оценки стоимости", f"история: {sources['history']}, пиксели: {sources['pixels']}, "
+                               f"медиана: {sources['default']}, размер файла: {sources['file_size']}"),
+    ]
+    if schedule['predicted_makespan'] is not None:
+        rows.append(("🔮 Прогноз времени", f"{schedule['predicted_makespan']:.2f} сек"))
+        rows.append(("🔮 Прогноз в порядке listdir", f"{schedule['predicted_listdir_makespan']:.2f} сек "
+                                                     f"(выигрыш {schedule['predicted_gain']:.1f}%)"))
+    else:
+        rows.append(("🔮 Прогноз времени", "нет истории Timing Total"))
+    rows.append(("⏱️ Фактическое время", f"{schedule['actual_makespan']:.2f} сек"))
+    return rows
+
+
+def _character_metrics_rows(character_metrics):
+    rows = []
+    for field, label in (('indications', '📈 Показания'), ('series', '🔢 Серийные номера')):
+        metrics = character_metrics.get(field)
+        if not metrics:
+            continue
+        rows.append((f"{label}: CER",
+                     f"{metrics['cer']:.2f}% ({metrics['edit_distance']}/{metrics['reference_chars']} симв.)"))
+        rows.append((f"{label}: длина не совпала", f"{metrics['length_mismatch']} из {metrics['rows']}"))
+        if metrics['position_accuracy']:
+            positions = ' | '.join(f"{accuracy:.0f}" for accuracy in metrics['position_accuracy'])
+            rows.append((f"{label}: точность по позициям, %", positions))
+        confusions = ', '.join(f"{pair} ({count})" for pair, count in metrics['top_confusions'])
+        rows.append((f"{label}: частые ошибки цифр", confusions or '—'))
+    return rows
+
+
+def _add_confusion_matrices(ws, character_metrics, colors, header_font, bold_font,
+                            normal_font, alignment, border, start_col=8):
+    current_row = 1
+    for field, title in (('indications', '🔢 Матрица ошибок цифр: показания'),
+                         ('series', '🔢 Матрица ошибок цифр: серийные номера')):
+        metrics = character_metrics.get(field)
+        if not metrics:
+            continue
+        matrix = metrics['digit_confusion']
+
+        ws.merge_cells(start_row=current_row, start_column=start_col,
+                       end_row=current_row, end_column=start_col + 10)
+        title_cell = ws.cell(row=current_row, column=start_col, value=title)
+        title_cell.font = header_font
+        title_cell.alignment = alignment
+        title_cell.fill = PatternFill(start_color=colors['header'], end_color=colors['header'], fill_type="solid")
+        current_row += 1
+
+        corner = ws.cell(row=current_row, column=start_col, value="эталон / распозн.")
+        corner.font = bold_font
+        corner.alignment = alignment
+        corner.border = border
+        for digit in range(10):
+            cell = ws.cell(row=current_row, column=start_col + 1 + digit, value=digit)
+            cell.font = bold_font
+            cell.alignment = alignment
+            cell.border = border
+        current_row += 1
+
+        max_error = max([matrix[r][h] for r in range(10) for h in range(10) if r != h] + [0])
+        for ref_digit in range(10):
+            cell = ws.cell(row=current_row, column=start_col, value=ref_digit)
+            cell.font = bold_font
+            cell.alignment = alignment
+            cell.border = border
+            for hyp_digit in range(10):
+                count = matrix[ref_digit][hyp_digit]
+                cell = ws.cell(row=current_row, column=start_col + 1 + hyp_digit, value=count)
+                cell.font = normal_font
+                cell.alignment = alignment
+                cell.border = border
+                if ref_digit == hyp_digit:
+                    fill_color = colors['success']
+                elif count > 0 and count == max_error:
+                    fill_color = colors['error']
+                elif count > 0:
+                    fill_color = colors['warning']
+                else:
+                    fill_color = "FFFFFF"
+                cell.fill = PatternFill(start_color=fill_color, end_color=fill_color, fill_type="solid")
+            current_row += 1
+
+        current_row += 1
+
+    ws.column_dimensions[get_column_letter(start_col)].width = 16
+    for offset in range(1, 11):
+        ws.column_dimensions[get_column_letter(start_col + offset)].width = 7
+
+
 def _create_info_block(ws, start_row, title, data, colors, header_font, bold_font,
                        normal_font, alignment, border):
     ws.merge_cells(f'A{start_row}:F{start_row}')
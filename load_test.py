@@ -0,0 +1,442 @@
+import argparse
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import requests
+from openpyxl import Workbook
+from openpyxl.chart import LineChart, Reference
+
+from config import *
+from recognition_runner import get_http_session
+from utils.file_utils import get_image_files
+from utils.log_utils import SUMMARY
+
+logger = logging.getLogger(__name__)
+
+QUEUED_STATUSES = ('queued', 'pending', 'waiting', 'new', 'created', 'accepted')
+FAILED_STATUSES = ('failed', 'error')
+PERCENTILES = (50, 90, 95, 99)
+REQUEST_ROWS_LIMIT = 20000
+
+
+def parse_profile(spec):
+    # constant:RATE:SEC | step:START:STEP:LEVELS:SEC | ramp:START:END:SEC[:LEVELS]
+    # Уровень - (интенсивность в начале, в конце, длительность); у ramp интенсивность растет внутри уровня
+    kind, *values = spec.split(':')
+    try:
+        values = [float(v) for v in values]
+    except ValueError:
+        raise ValueError(f"Профиль нагрузки '{spec}': ожидаются числа после '{kind}:'")
+
+    if kind == 'constant' and len(values) == 2:
+        rate, duration = values
+        levels = [(rate, rate, duration)]
+    elif kind == 'step' and len(values) == 4:
+        start, step, count, duration = values
+        levels = [(start + i * step, start + i * step, duration) for i in range(int(count))]
+    elif kind == 'ramp' and len(values) in (3, 4):
+        start, end, duration = values[:3]
+        count = int(values[3]) if len(values) == 4 else 10
+        bounds = np.linspace(start, end, count + 1)
+        levels = [(float(bounds[i]), float(bounds[i + 1]), duration / count) for i in range(count)]
+    else:
+        raise ValueError(f"Неизвестный профиль нагрузки '{spec}': constant:RATE:SEC, "
+                         f"step:START:STEP:LEVELS:SEC или ramp:START:END:SEC[:LEVELS]")
+
+    if any(r0 <= 0 and r1 <= 0 or duration <= 0 for r0, r1, duration in levels):
+        raise ValueError(f"Профиль нагрузки '{spec}': интенсивность и длительность должны быть больше нуля")
+    return kind, levels
+
+
+def build_schedule(levels, arrivals='poisson', seed=42):
+    # Моменты отправки считаются заранее и не зависят от ответов сервера (открытая модель нагрузки)
+    rng = random.Random(seed)
+    schedule = []
+    level_start = 0.0
+    for level, (rate_start, rate_end, duration) in enumerate(levels):
+        peak = max(rate_start, rate_end)
+        t = 0.0
+        while True:
+            if arrivals == 'uniform':
+                rate = rate_start + (rate_end - rate_start) * t / duration
+                t += 1.0 / max(rate, 1e-9)
+                if t >= duration:
+                    break
+                schedule.append((level_start + t, level))
+            else:
+                # Неоднородный пуассоновский поток методом прореживания
+                t += rng.expovariate(peak)
+                if t >= duration:
+                    break
+                rate = rate_start + (rate_end - rate_start) * t / duration
+                if rng.random() * peak <= rate:
+                    schedule.append((level_start + t, level))
+        level_start += duration
+    return schedule
+
+
+def load_images(images_folder, limit):
+    # Изображения читаются заранее: нагрузочный тест измеряет сервер, а не диск
+    images = []
+    for image_file in sorted(get_image_files(images_folder))[:limit]:
+        with open(os.path.join(images_folder, image_file), 'rb') as f:
+            images.append((image_file, f.read()))
+    return images
+
+
+def _percentiles(values):
+    if not values:
+        return {p: None for p in PERCENTILES}
+    return dict(zip(PERCENTILES, (float(v) for v in np.percentile(values, PERCENTILES))))
+
+
+class LoadTest:
+    def __init__(self, server_url, images, poll_interval=0.2, task_timeout=120.0, max_inflight=256):
+        self.server_url = server_url.rstrip('/')
+        self.images = images
+        self.poll_interval = poll_interval
+        self.task_timeout = task_timeout
+        self.max_inflight = max_inflight
+        self.records = []
+        self.inflight = 0
+        self.peak_inflight = 0
+        self.started = None
+        self._lock = threading.Lock()
+
+    def _request(self, record):
+        image_name, image_bytes = self.images[record['id'] % len(self.images)]
+        record['image'] = image_name
+        session = get_http_session()
+        try:
+            record['sent'] = time.perf_counter()
+            response = session.post(f"{self.server_url}/tasks", files={'image': (image_name, image_bytes)},
+                                    timeout=TIMEOUT)
+            record['created'] = time.perf_counter()
+            if response.status_code != 200:
+                record['error'] = f"HTTP {response.status_code} при создании задачи"
+                return
+            task_uuid = response.json().get('task_id')
+            if not task_uuid:
+                record['error'] = "нет task_id в ответе"
+                return
+
+            deadline = record['created'] + self.task_timeout
+            last_status = None
+            while time.perf_counter() < deadline:
+                response = session.get(f"{self.server_url}/result?uuid={task_uuid}", timeout=TIMEOUT)
+                now = time.perf_counter()
+                record['polls'] += 1
+                if response.status_code != 200:
+                    record['error'] = f"HTTP {response.status_code} при опросе"
+                    return
+                status = response.json().get('status')
+                if status != last_status:
+                    record['transitions'].append((status, now - record['created']))
+                    last_status = status
+                # Первый статус после очереди - начало обработки на сервере
+                if record['started'] is None and status not in QUEUED_STATUSES:
+                    record['started'] = now
+                if status == 'completed':
+                    record['completed'] = now
+                    return
+                if status in FAILED_STATUSES:
+                    record['error'] = f"статус задачи '{status}'"
+                    return
+                time.sleep(self.poll_interval)
+            record['error'] = f"нет результата за {self.task_timeout:.0f} сек"
+        except requests.exceptions.Timeout:
+            record['error'] = 'таймаут HTTP'
+        except (requests.exceptions.RequestException, ValueError) as e:
+            record['error'] = str(e)[:200]
+        finally:
+            with self._lock:
+                self.inflight -= 1
+
+    def run(self, schedule, level_count):
+        self.records = []
+        started_levels = set()
+        with ThreadPoolExecutor(max_workers=self.max_inflight, thread_name_prefix='load') as executor:
+            start = self.started = time.perf_counter()
+            for i, (offset, level) in enumerate(schedule):
+                if level not in started_levels:
+                    started_levels.add(level)
+                    logger.info(f"📈 Уровень нагрузки {level + 1}/{level_count}", extra=SUMMARY)
+                delay = start + offset - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                record = {'id': i, 'level': level, 'scheduled': start + offset, 'sent': None, 'created': None,
+                          'started': None, 'completed': None, 'error': None, 'polls': 0, 'transitions': []}
+                self.records.append(record)
+
+                with self._lock:
+                    if self.inflight >= self.max_inflight:
+                        # Открытая модель не ждет освобождения: запрос сверх лимита считается отказом
+                        record['error'] = 'превышен лимит одновременных запросов клиента'
+                        continue
+                    self.inflight += 1
+                    self.peak_inflight = max(self.peak_inflight, self.inflight)
+                executor.submit(self._request, record)
+        return self.records
+
+
+def summarize_levels(records, levels, max_error_rate, started):
+    summary = []
+    level_start = started
+    for level, (rate_start, rate_end, duration) in enumerate(levels):
+        level_records = [r for r in records if r['level'] == level]
+        completed = [r for r in level_records if r['completed'] is not None]
+        errors = len(level_records) - len(completed)
+        # Задержка считается от запланированного момента: отставание клиента тоже входит в нее
+        latencies = [r['completed'] - r['scheduled'] for r in completed]
+        queue_times = [r['started'] - r['created'] for r in completed if r['started'] is not None]
+        service_times = [r['completed'] - r['started'] for r in completed if r['started'] is not None]
+        send_lags = [r['sent'] - r['scheduled'] for r in level_records if r['sent'] is not None]
+        offered = len(level_records) / duration if duration else 0.0
+        # Пропускная способность - ответы, полученные в окне уровня (от любых запросов): при перегрузке
+        # ответы на запросы уровня приходят позже, и их число по уровню завысило бы емкость
+        level_end = level_start + duration
+        finished = sum(1 for r in records if r['completed'] is not None and level_start <= r['completed'] < level_end)
+        level_start = level_end
+
+        stats = {
+            'level': level + 1,
+            'target_rate': (rate_start + rate_end) / 2,
+            'offered_rate': offered,
+            'throughput': finished / duration if duration else 0.0,
+            'duration': duration,
+            'requests': len(level_records),
+            'completed': len(completed),
+            'errors': errors,
+            'error_rate': errors / len(level_records) * 100 if level_records else 0.0,
+            'latency': _percentiles(latencies),
+            'latency_mean': float(np.mean(latencies)) if latencies else None,
+            'queue_mean': float(np.mean(queue_times)) if queue_times else None,
+            'queue_p95': _percentiles(queue_times)[95],
+            'service_mean': float(np.mean(service_times)) if service_times else None,
+            'send_lag_p95': _percentiles(send_lags)[95],
+        }
+        stats['healthy'] = stats['error_rate'] <= max_error_rate and stats['completed'] > 0
+        summary.append(stats)
+    return summary
+
+
+def find_knee(summary):
+    # Колено кривой задержки (Kneedle): точка с наибольшим отрывом нормированной интенсивности
+    # от нормированной p95 задержки; дальше задержка растет быстрее нагрузки
+    points = [s for s in summary if s['latency'][95] is not None]
+    if len(points) < 3:
+        return None
+    x = np.array([s['offered_rate'] for s in points])
+    y = np.array([s['latency'][95] for s in points])
+    if np.ptp(x) == 0 or np.ptp(y) == 0:
+        return None
+    difference = (x - x.min()) / np.ptp(x) - (y - y.min()) / np.ptp(y)
+    best = int(np.argmax(difference))
+    if difference[best] <= 0:
+        return None
+    return points[best]
+
+
+def capacity_summary(summary):
+    knee = find_knee(summary)
+    healthy = [s for s in summary if s['healthy']]
+    best = max(healthy, key=lambda s: s['throughput']) if healthy else None
+    return {
+        'knee_level': knee['level'] if knee else None,
+        'knee_rate': knee['offered_rate'] if knee else None,
+        'knee_p95': knee['latency'][95] if knee else None,
+        'max_healthy_throughput': best['throughput'] if best else None,
+        'max_healthy_level': best['level'] if best else None,
+    }
+
+
+def _round(value, digits=3):
+    return round(value, digits) if value is not None else None
+
+
+def write_load_report(summary, capacity, records, settings, excel_path):
+    wb = Workbook()
+    ws = wb.active
+    ws.title = 'Нагрузка'
+
+    def header(sheet, row_values):
+        sheet.append(row_values)
+        for cell in sheet[sheet.max_row]:
+            cell.fill = HEADER_FILL
+            cell.font = BOLD_FONT
+
+    header(ws, ['Нагрузочный тест', ''])
+    for label, value in settings:
+        ws.append([label, value])
+    ws.append([])
+
+    header(ws, ['Емкость', ''])
+    if capacity['knee_rate'] is not None:
+        ws.append(['Колено кривой задержки', f"{capacity['knee_rate']:.2f} запр/сек (уровень {capacity['knee_level']}, "
+                                             f"p95 {capacity['knee_p95']:.3f} сек)"])
+    else:
+        ws.append(['Колено кривой задержки', 'не найдено (нужно не меньше 3 уровней с ростом задержки)'])
+    if capacity['max_healthy_throughput'] is not None:
+        ws.append(['Макс. пропускная способность без ошибок',
+                   f"{capacity['max_healthy_throughput']:.2f} запр/сек (уровень {capacity['max_healthy_level']})"])
+    ws.append([])
+
+    table_header = ['Уровень', 'Цель, запр/сек', 'Подано, запр/сек', 'Выполнено, запр/сек', 'Запросов', 'Ошибок',
+                    'Ошибок, %'] + [f"p{p}, сек" for p in PERCENTILES] + \
+                   ['Очередь, среднее', 'Очередь, p95', 'Обработка, среднее', 'Отставание клиента p95']
+    header(ws, table_header)
+    first_row = ws.max_row + 1
+    for s in summary:
+        ws.append([s['level'], _round(s['target_rate'], 2), _round(s['offered_rate'], 2), _round(s['throughput'], 2),
+                   s['requests'], s['errors'], _round(s['error_rate'], 2)]
+                  + [_round(s['latency'][p]) for p in PERCENTILES]
+                  + [_round(s['queue_mean']), _round(s['queue_p95']), _round(s['service_mean']),
+                     _round(s['send_lag_p95'])])
+        ws.cell(row=ws.max_row, column=7).fill = GREEN_FILL if s['healthy'] else RED_FILL
+        if capacity['knee_level'] == s['level']:
+            ws.cell(row=ws.max_row, column=1).value = f"{s['level']} (колено)"
+            ws.cell(row=ws.max_row, column=1).font = BOLD_FONT
+    last_row = ws.max_row
+
+    ws.column_dimensions['A'].width = 40
+    for col in 'BCDEFGHIJKLMNO':
+        ws.column_dimensions[col].width = 14
+
+    if summary:
+        chart = LineChart()
+        chart.title = 'Задержка от нагрузки'
+        chart.x_axis.title = 'Подано, запр/сек'
+        chart.y_axis.title = 'Задержка, сек'
+        chart.add_data(Reference(ws, min_col=8, max_col=11, min_row=first_row - 1, max_row=last_row),
+                       titles_from_data=True)
+        chart.set_categories(Reference(ws, min_col=3, min_row=first_row, max_row=last_row))
+        chart.width = 24
+        chart.height = 12
+        ws.add_chart(chart, f"A{last_row + 3}")
+
+    details = wb.create_sheet('Запросы')
+    header(details, ['#', 'Уровень', 'Изображение', 'Отставание отправки', 'Создание задачи', 'Очередь',
+                     'Обработка', 'Задержка', 'Опросов', 'Статусы', 'Ошибка'])
+    for r in records[:REQUEST_ROWS_LIMIT]:
+        def span(a, b):
+            return _round(r[b] - r[a]) if r[a] is not None and r[b] is not None else None
+        details.append([r['id'], r['level'] + 1, r.get('image'), span('scheduled', 'sent'), span('sent', 'created'),
+                        span('created', 'started'), span('started', 'completed'), span('scheduled', 'completed'),
+                        r['polls'], ' → '.join(f"{status}@{offset:.2f}" for status, offset in r['transitions']),
+                        r['error'] or ''])
+    if len(records) > REQUEST_ROWS_LIMIT:
+        details.append([f"... показаны первые {REQUEST_ROWS_LIMIT} из {len(records)} запросов"])
+    details.column_dimensions['C'].width = 24
+    details.column_dimensions['J'].width = 60
+    details.column_dimensions['K'].width = 40
+
+    wb.save(excel_path)
+    logger.info(f"💾 Отчет нагрузочного теста: {excel_path}")
+
+
+def resolve_server(target):
+    if target.startswith(('http://', 'https://')):
+        return target, target
+    server_url = SERVERS.get(target)
+    if not server_url or target == 'default':
+        raise ValueError(f"Неизвестный сервер '{target}': ожидается имя из SERVERS "
+                         f"({', '.join(name for name in SERVERS if name != 'default')}) или URL")
+    return target, server_url
+
+
+def run_load_test(target, profile, images_folder, arrivals='poisson', poll_interval=0.2, task_timeout=120.0,
+                  max_inflight=256, max_error_rate=1.0, image_limit=200, seed=42, output_file=None):
+    server_name, server_url = resolve_server(target)
+    kind, levels = parse_profile(profile)
+    images = load_images(images_folder, image_limit)
+    if not images:
+        logger.error(f"❌ В папке {images_folder} нет изображений для нагрузки")
+        return None
+
+    schedule = build_schedule(levels, arrivals, seed)
+    total_duration = sum(duration for _, _, duration in levels)
+    logger.info("=" * 60, extra=SUMMARY)
+    logger.info(f"🏋️ НАГРУЗОЧНЫЙ ТЕСТ {server_name} ({server_url}): профиль {profile}, поток {arrivals}, "
+                f"запросов: {len(schedule)} за {total_duration:.0f} сек, изображений в ротации: {len(images)}",
+                extra=SUMMARY)
+    logger.info("=" * 60, extra=SUMMARY)
+
+    test = LoadTest(server_url, images, poll_interval, task_timeout, max_inflight)
+    start_time = time.time()
+    records = test.run(schedule, len(levels))
+    wall_time = time.time() - start_time
+
+    summary = summarize_levels(records, levels, max_error_rate, test.started)
+    capacity = capacity_summary(summary)
+
+    if output_file is None:
+        target_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'detail')
+        os.makedirs(target_dir, exist_ok=True)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        output_file = os.path.join(target_dir, f"load_{server_name if server_name in SERVERS else 'url'}_"
+                                               f"{kind}_{timestamp}.xlsx")
+    settings = [
+        ('Сервер', f"{server_name} ({server_url})"),
+        ('Профиль', profile),
+        ('Поток запросов', arrivals),
+        ('Интервал опроса', f"{poll_interval} сек (точность времени очереди и обработки)"),
+        ('Лимит одновременных запросов', f"{max_inflight} (пик: {test.peak_inflight})"),
+        ('Допустимая доля ошибок', f"{max_error_rate}%"),
+        ('Общее время', f"{wall_time:.1f} сек"),
+    ]
+    write_load_report(summary, capacity, records, settings, output_file)
+
+    logger.info("=" * 60, extra=SUMMARY)
+    logger.info(f"🏋️ ИТОГ НАГРУЗОЧНОГО ТЕСТА за {wall_time:.1f} сек", extra=SUMMARY)
+    for s in summary:
+        p50, p95 = s['latency'][50], s['latency'][95]
+        latency = f"p50 {p50:.3f} / p95 {p95:.3f} сек" if p95 is not None else "нет ответов"
+        logger.info(f"   Уровень {s['level']}: подано {s['offered_rate']:.2f}, выполнено {s['throughput']:.2f} "
+                    f"запр/сек, {latency}, ошибок {s['error_rate']:.1f}%", extra=SUMMARY)
+    if capacity['knee_rate'] is not None:
+        logger.info(f"   Колено кривой задержки: {capacity['knee_rate']:.2f} запр/сек "
+                    f"(p95 {capacity['knee_p95']:.3f} сек)", extra=SUMMARY)
+    if capacity['max_healthy_throughput'] is not None:
+        logger.info(f"   Макс. пропускная способность без ошибок: {capacity['max_healthy_throughput']:.2f} запр/сек",
+                    extra=SUMMARY)
+    logger.info("=" * 60, extra=SUMMARY)
+    return {'summary': summary, 'capacity': capacity, 'output_file': output_file}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Нагрузочный тест сервера распознавания с заданной интенсивностью запросов (открытая модель). '
+                    'Для проверки без реального сервера: python benchmarks/stand_in_server.py'
+    )
+    parser.add_argument('server', help='Имя сервера из SERVERS или URL')
+    parser.add_argument('profile', help='constant:RATE:SEC | step:START:STEP:LEVELS:SEC | ramp:START:END:SEC[:LEVELS]')
+    parser.add_argument('--folder', default=FOLDER_TEST, help='Папка с изображениями (по умолчанию FOLDER_TEST)')
+    parser.add_argument('--arrivals', choices=('poisson', 'uniform'), default='poisson', help='Поток запросов')
+    parser.add_argument('--poll-interval', type=float, default=0.2, help='Интервал опроса /result, сек')
+    parser.add_argument('--task-timeout', type=float, default=120.0, help='Ожидание результата задачи, сек')
+    parser.add_argument('--max-inflight', type=int, default=256, help='Лимит одновременных запросов клиента')
+    parser.add_argument('--max-error-rate', type=float, default=1.0, help='Допустимая доля ошибок уровня, %%')
+    parser.add_argument('--images', type=int, default=200, help='Сколько изображений держать в ротации')
+    parser.add_argument('--seed', type=int, default=42, help='Зерно пуассоновского потока')
+    parser.add_argument('-o', '--output', help='Путь к отчету (.xlsx)')
+    args = parser.parse_args()
+
+    try:
+        result = run_load_test(args.server, args.profile, args.folder, args.arrivals, args.poll_interval,
+                               args.task_timeout, max(1, args.max_inflight), args.max_error_rate,
+                               max(1, args.images), args.seed, args.output)
+    except ValueError as e:
+        logger.error(f"❌ {e}")
+        raise SystemExit(2)
+    if result is None:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -21,14 +21,16 @@ def main():
 
     if SELECTED_SERVER == 'default':
         logger.info("⚙️  РЕЖИМ: Локальный (default)")
-        processing_mode = "последовательная обработка"
+        processing_mode = "последовательная обработка" if MAX_WORKERS == 1 else \
+            f"параллельная обработка ({MAX_WORKERS} потоков)"
     else:
         server_url = SERVERS.get(SELECTED_SERVER)
         logger.info(f"🌐 РЕЖИМ: Серверный - {SELECTED_SERVER}")
         logger.info(f"🔗 URL: {server_url}")
         logger.info(f"🔑 Токен авторизации: {AUTHORIZED_TOKEN[:8]}...")
         logger.info("📋 API: Многоэтапный (tasks → status → result)")
-        processing_mode = "последовательная обработка (серверная очередь)"
+        processing_mode = "последовательная обработка (серверная очередь)" if MAX_WORKERS == 1 else \
+            f"параллельная обработка ({MAX_WORKERS} потоков, серверная очередь)"
 
     if not validate_environment():
         logger.error("❌ Проверка окружения не пройдена. Завершение работы.")
@@ -36,20 +38,30 @@ def main():
 
     logger.info(f"📁 Папка с изображениями: {FOLDER_TEST}")
     logger.info(f"📊 Excel файл: {EXCEL_DATA}")
-    logger.info(f"🔄 Режим обработки: {processing_mode}")
+    logger.info(f"🔄 Режим обработки: {processing_mode}, порядок: {SCHEDULING_STRATEGY}")
 
     if SELECTED_SERVER == 'default':
         logger.info(f"🐍 Программа распознавания: {PROGRAM_SCRIPT}")
 
+    # Профилирование включается переменной PROFILE_ENABLED или ключом --profile
+    profile = PROFILE_ENABLED or '--profile' in sys.argv[1:]
+    if profile:
+        logger.info("🔬 Прогон будет профилироваться (cProfile)")
+
     start_time = time.time()
 
     success, processed_count, errors_count, skipped_count = process_images_folder(
-        FOLDER_TEST, EXCEL_DATA, PROGRAM_SCRIPT, max_workers=1
+        FOLDER_TEST, EXCEL_DATA, PROGRAM_SCRIPT, max_workers=MAX_WORKERS, profile=profile
     )
 
     total_time = time.time() - start_time
 
-    report = generate_summary_report(processed_count, errors_count, skipped_count, total_time, EXCEL_DATA)
+    if CHUNKED_MODE:
+        # Отчет уже построен по частям; повторный расчет загрузил бы все результаты в память
+        images_per_minute = (processed_count + errors_count) / total_time * 60 if total_time > 0 else 0
+    else:
+        report = generate_summary_report(processed_count, errors_count, skipped_count, total_time, EXCEL_DATA)
+        images_per_minute = report['images_per_minute']
 
     if success:
         try:
@@ -62,7 +74,7 @@ def main():
                 logger.info(f"🏁 Локальное тестирование завершено!")
 
             logger.info(f"⏱️  Общее время: {total_time:.2f} секунд")
-            logger.info(f"📈 Скорость: {report['images_per_minute']:.2f} изображений/мин")
+            logger.info(f"📈 Скорость: {images_per_minute:.2f} изображений/мин")
 
         except Exception as e:
             logger.error(f"❌ Ошибка переименования файла: {e}")
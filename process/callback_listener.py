@@ -0,0 +1,226 @@
+import hmac
+import json
+import logging
+import queue
+import secrets
+import socket
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+# Интервал опроса /result в режиме без обратных вызовов - по нему оценивается число сэкономленных запросов
+POLL_INTERVAL_SECONDS = 5
+
+
+class CallbackWaiter:
+    # Ожидание одной задачи: сервер шлет POST на url, обработчик кладет тело в очередь
+    def __init__(self, listener, callback_id, url):
+        self.listener = listener
+        self.callback_id = callback_id
+        self.url = url
+        self.created = time.monotonic()
+        self.requests = 0
+        self.safety_polls = 0
+        self.notified = False
+        self._queue = queue.Queue()
+        self._finished = False
+
+    def put(self, payload):
+        self._queue.put((time.monotonic(), payload))
+
+    def wait(self, timeout):
+        # None - уведомление не пришло за timeout, пора делать страховочный опрос
+        try:
+            received_at, payload = self._queue.get(timeout=max(0.0, timeout))
+        except queue.Empty:
+            self.notified = False
+            return None
+        self.notified = True
+        self.listener.record_delivery(time.monotonic() - received_at)
+        return payload
+
+    def record_request(self):
+        self.requests += 1
+        if not self.notified:
+            self.safety_polls += 1
+
+    def finish(self, outcome):
+        # outcome: pushed - результат пришел в уведомлении, notified - уведомление и один запрос за результатом,
+        # polled - результат нашел страховочный опрос (уведомление потеряно или опоздало)
+        if not self._finished:
+            self._finished = True
+            self.listener.record_outcome(self, outcome, time.monotonic() - self.created)
+
+    def close(self):
+        self.listener.unregister(self.callback_id)
+
+
+class _CallbackServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+
+class _CallbackHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, code):
+        self.send_response(code)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_POST(self):
+        # /callback/<token>/<callback_id>; токен отсекает чужие запросы на открытый порт
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0) or 0))
+        parts = urlparse(self.path).path.strip('/').split('/')
+        if len(parts) != 3 or parts[0] != 'callback':
+            return self._reply(404)
+        try:
+            payload = json.loads(body) if body else {}
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            payload = None
+        if not isinstance(payload, dict):
+            self.server.listener.record_rejected()
+            return self._reply(400)
+        self._reply(self.server.listener.deliver(parts[1], parts[2], payload))
+
+
+class CallbackListener:
+    def __init__(self, host='0.0.0.0', port=0, public_url=''):
+        self.host = host
+        self.port = port
+        self.public_url = public_url.rstrip('/')
+        self.token = secrets.token_urlsafe(16)
+        self._server = None
+        self._thread = None
+        self._waiters = {}
+        self._hosts = {}
+        self._lock = threading.Lock()
+        self.stats = {
+            'registered': 0,
+            'received': 0,
+            'rejected': 0,
+            'pushed': 0,
+            'notified': 0,
+            'polled': 0,
+            'requests': 0,
+            'safety_polls': 0,
+            'polls_avoided': 0,
+            'wait_seconds': 0.0,
+            'delivery_seconds': 0.0,
+            'deliveries': 0,
+        }
+
+    def start(self):
+        self._server = _CallbackServer((self.host, self.port), _CallbackHandler)
+        self._server.listener = self
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name='callback-listener', daemon=True)
+        self._thread.start()
+        logger.info(f"📬 Приемник обратных вызовов слушает {self.host}:{self.port}"
+                    + (f" (адрес для сервера: {self.public_url})" if self.public_url else ""))
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def _base_url(self, server_url):
+        if self.public_url:
+            return self.public_url
+        with self._lock:
+            if server_url not in self._hosts:
+                self._hosts[server_url] = self._reachable_host(server_url)
+            return f"http://{self._hosts[server_url]}:{self.port}"
+
+    def _reachable_host(self, server_url):
+        if self.host not in ('', '0.0.0.0'):
+            return self.host
+        # Адрес интерфейса, через который идет маршрут к серверу: UDP connect ничего не отправляет
+        try:
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as probe:
+                probe.connect((urlparse(server_url).hostname, 9))
+                return probe.getsockname()[0]
+        except OSError:
+            return socket.gethostbyname(socket.gethostname())
+
+    def register(self, server_url):
+        callback_id = uuid.uuid4().hex
+        waiter = CallbackWaiter(self, callback_id, f"{self._base_url(server_url)}/callback/{self.token}/{callback_id}")
+        with self._lock:
+            # Регистрация до создания задачи: уведомление может прийти раньше ответа на POST /tasks
+            self._waiters[callback_id] = waiter
+            self.stats['registered'] += 1
+        return waiter
+
+    def unregister(self, callback_id):
+        with self._lock:
+            self._waiters.pop(callback_id, None)
+
+    def deliver(self, token, callback_id, payload):
+        with self._lock:
+            waiter = self._waiters.get(callback_id) if hmac.compare_digest(token, self.token) else None
+            if waiter is None:
+                # Неверный токен или задача уже завершена страховочным опросом
+                self.stats['rejected'] += 1
+                return 404
+            self.stats['received'] += 1
+        waiter.put(payload)
+        return 200
+
+    def record_rejected(self):
+        with self._lock:
+            self.stats['rejected'] += 1
+
+    def record_delivery(self, seconds):
+        with self._lock:
+            self.stats['delivery_seconds'] += seconds
+            self.stats['deliveries'] += 1
+
+    def record_outcome(self, waiter, outcome, wait_seconds):
+        # Опрос раз в POLL_INTERVAL_SECONDS сделал бы первый запрос сразу и по одному на каждый интервал ожидания
+        polling_requests = int(wait_seconds // POLL_INTERVAL_SECONDS) + 1
+        with self._lock:
+            self.stats[outcome] += 1
+            self.stats['requests'] += waiter.requests
+            self.stats['safety_polls'] += waiter.safety_polls
+            self.stats['polls_avoided'] += max(0, polling_requests - waiter.requests)
+            self.stats['wait_seconds'] += wait_seconds
+
+    def get_stats(self, baseline=None):
+        # baseline - снимок на старте прогона: приемник общий для всех прогонов процесса
+        with self._lock:
+            stats = dict(self.stats)
+        if baseline:
+            stats = {key: value - baseline.get(key, 0) for key, value in stats.items()}
+        tasks = stats['pushed'] + stats['notified'] + stats['polled']
+        stats['tasks'] = tasks
+        stats['mean_wait_seconds'] = stats['wait_seconds'] / tasks if tasks else 0.0
+        stats['mean_delivery_ms'] = stats['delivery_seconds'] / stats['deliveries'] * 1000 \
+            if stats['deliveries'] else 0.0
+        return stats
+
+
+_listener = None
+_listener_failed = False
+_listener_lock = threading.Lock()
+
+
+def get_callback_listener(host='0.0.0.0', port=0, public_url=''):
+    # Один приемник на процесс; если порт занят, распознавание продолжает работать опросом
+    global _listener, _listener_failed
+    with _listener_lock:
+        if _listener is None and not _listener_failed:
+            try:
+                _listener = CallbackListener(host, port, public_url).start()
+            except OSError as e:
+                _listener_failed = True
+                logger.error(f"❌ Не удалось запустить приемник обратных вызовов на {host}:{port}: {e}, "
+                             f"результаты будут получаться опросом")
+        return _listener
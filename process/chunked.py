@@ -0,0 +1,106 @@
+import logging
+import pandas as pd
+from accuracy_calculator import (count_matches, accuracy_stats_from_counts, new_character_totals,
+                                 accumulate_character_metrics, finalize_character_metrics, count_slices,
+                                 merge_slice_counts, cap_slice_counts, slice_stats_from_counts)
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    # ru_maxrss в Linux - в килобайтах
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class ChunkAggregator:
+    # Итоги прогона, накопленные по частям: отчет строится по счетчикам, а не по загруженным результатам
+    def __init__(self, chunk_size, slice_columns=(), slice_max_values=50):
+        self.chunk_size = chunk_size
+        self.slice_columns = slice_columns
+        self.slice_max_values = slice_max_values
+        self.slice_counts = None
+        self.slices_failed = False
+        self.counts = {}
+        self.character_totals = new_character_totals()
+        self.timing_sum = 0.0
+        self.timing_count = 0
+        self.chunks = 0
+        self.rows = 0
+        self.missing_images = 0
+
+    def _add_counts(self, key, df):
+        counts = count_matches(df)
+        if key not in self.counts:
+            self.counts[key] = counts
+            return
+        for name, value in counts.items():
+            self.counts[key][name] += value
+
+    def add(self, df, missing_images=0):
+        self.chunks += 1
+        self.rows += len(df)
+        self.missing_images += missing_images
+        self._add_counts('all', df)
+
+        if 'Attempts' in df.columns:
+            attempts = pd.to_numeric(df['Attempts'], errors='coerce').fillna(0)
+            self._add_counts('first_attempt', df[attempts == 1])
+            self._add_counts('retried', df[attempts > 1])
+
+        if self.character_totals is not None:
+            try:
+                accumulate_character_metrics(self.character_totals, df)
+            except Exception as e:
+                logger.warning(f"⚠️ Не удалось рассчитать посимвольные метрики: {e}")
+                self.character_totals = None
+
+        if not self.slices_failed:
+            try:
+                self._add_slices(df)
+            except Exception as e:
+                logger.warning(f"⚠️ Не удалось рассчитать срезы точности: {e}")
+                self.slices_failed = True
+
+        if 'Timing Total' in df.columns:
+            timings = pd.to_numeric(df['Timing Total'], errors='coerce').dropna()
+            self.timing_sum += float(timings.sum())
+            self.timing_count += len(timings)
+
+    def _add_slices(self, df):
+        # Значения считаются по части без ограничения: самые частые в части не обязательно самые частые
+        # в наборе. Промежуточный запас в 10 раз больше держит счетчики компактными при большом числе значений
+        counts = merge_slice_counts(self.slice_counts, count_slices(df, self.slice_columns))
+        self.slice_counts = cap_slice_counts(counts, self.slice_max_values * 10)
+
+    def slices(self):
+        if self.slices_failed or self.slice_counts is None:
+            return None
+        return slice_stats_from_counts(cap_slice_counts(self.slice_counts, self.slice_max_values))
+
+    def accuracy(self, key='all'):
+        if key not in self.counts:
+            return None
+        return accuracy_stats_from_counts(self.counts[key])
+
+    def get_stats(self):
+        return {
+            'chunk_size': self.chunk_size,
+            'chunks': self.chunks,
+            'rows': self.rows,
+            'missing_images': self.missing_images,
+            'accuracy': self.accuracy(),
+            'first_attempt_accuracy': self.accuracy('first_attempt'),
+            'retried_accuracy': self.accuracy('retried'),
+            'character_metrics': finalize_character_metrics(self.character_totals)
+            if self.character_totals is not None else None,
+            'slices': self.slices(),
+            'average_timing': self.timing_sum / self.timing_count if self.timing_count else None,
+            'peak_rss_mb': peak_rss_mb(),
+        }
@@ -0,0 +1,120 @@
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+HISTORY_POINTS = 200
+
+
+class AdaptiveLimiter:
+    OK = 'ok'
+    OVERLOAD = 'overload'
+    IGNORE = 'ignore'
+
+    def __init__(self, name, initial=4, min_limit=1, max_limit=16, latency_tolerance=2.0,
+                 decrease_factor=0.7):
+        self.name = name
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self.latency_tolerance = latency_tolerance
+        self.decrease_factor = decrease_factor
+        self.in_flight = 0
+        self.started_at = time.time()
+        self.samples = deque(maxlen=100)
+        self.history = [(0.0, int(self.limit), 0)]
+        self.decreases = 0
+        self.overloads = 0
+        self.completed = 0
+        self._last_decrease = 0
+        self._condition = threading.Condition()
+
+    def baseline_latency(self):
+        return min(self.samples) if self.samples else None
+
+    def acquire(self):
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+            return time.time()
+
+    def release(self, started, outcome=OK, units=1.0):
+        # units - относительная стоимость работы (по оценке планировщика), чтобы крупные
+        # изображения не принимались за перегрузку сервера
+        latency = (time.time() - started) / max(units, 1e-3)
+        with self._condition:
+            self.in_flight -= 1
+            previous = int(self.limit)
+
+            if outcome != self.IGNORE:
+                self.completed += 1
+                baseline = self.baseline_latency()
+                self.samples.append(latency)
+                congested = baseline is not None and latency > baseline * self.latency_tolerance
+
+                if outcome == self.OVERLOAD or congested:
+                    if outcome == self.OVERLOAD:
+                        self.overloads += 1
+                    # Снижаем не чаще одного раза за "окно" из limit завершений, иначе одна волна
+                    # медленных ответов обрушит лимит до минимума
+                    if self.completed - self._last_decrease >= previous:
+                        self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+                        self._last_decrease = self.completed
+                        self.decreases += 1
+                else:
+                    self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+
+            current = int(self.limit)
+            if current != previous:
+                self.history.append((time.time() - self.started_at, current, self.in_flight))
+                log = logger.info if current < previous else logger.debug
+                log(f"🎚️  {self.name}: параллелизм {previous} → {current} "
+                    f"(задержка {latency:.2f} сек, базовая {self.baseline_latency() or 0:.2f} сек)")
+            self._condition.notify_all()
+
+    def get_stats(self):
+        with self._condition:
+            history = list(self.history)
+            elapsed = time.time() - self.started_at
+        history.append((elapsed, int(self.limit), self.in_flight))
+
+        # Средний лимит взвешиваем по времени, которое он действовал
+        weighted = sum((history[i + 1][0] - history[i][0]) * history[i][1] for i in range(len(history) - 1))
+        step = max(1, len(history) // HISTORY_POINTS)
+        sampled = history[::step]
+        if sampled[-1] is not history[-1]:
+            sampled.append(history[-1])
+        return {
+            'name': self.name,
+            'min_limit': self.min_limit,
+            'max_limit': self.max_limit,
+            'final_limit': int(self.limit),
+            'peak_limit': max(point[1] for point in history),
+            'average_limit': weighted / elapsed if elapsed > 0 else float(self.limit),
+            'decreases': self.decreases,
+            'overloads': self.overloads,
+            'completed': self.completed,
+            'baseline_latency': self.baseline_latency(),
+            'history': sampled,
+        }
+
+
+class FixedLimiter:
+    # Постоянный лимит одновременных распознаваний, общий для нескольких наборов в одном процессе
+    def __init__(self, name, limit):
+        self.name = name
+        self.min_limit = self.max_limit = self.limit = max(1, limit)
+        self._semaphore = threading.BoundedSemaphore(self.max_limit)
+
+    def acquire(self):
+        self._semaphore.acquire()
+        return time.time()
+
+    def release(self, started, outcome=AdaptiveLimiter.OK, units=1.0):
+        self._semaphore.release()
+
+    def get_stats(self):
+        return None
@@ -0,0 +1,154 @@
+import hashlib
+import logging
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+DEDUP_MODES = ('off', 'exact', 'perceptual')
+HASH_BITS = 64
+HASH_CHUNK = 1024 * 1024
+
+
+def content_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def difference_hash(path):
+    # dHash: 9x8 в оттенках серого, бит = "левый пиксель ярче правого". Устойчив к
+    # перекодированию, смене размера и небольшим изменениям яркости
+    with Image.open(path) as image:
+        pixels = list(image.convert('L').resize((9, 8), Image.Resampling.LANCZOS).getdata())
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = (value << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return value
+
+
+def _safe(func, path):
+    try:
+        return func(path)
+    except Exception as e:
+        logger.warning(f"⚠️ Не удалось вычислить хэш {os.path.basename(path)}: {e}")
+        return None
+
+
+class _DisjointSet:
+    def __init__(self, items):
+        self.parent = {item: item for item in items}
+
+    def find(self, item):
+        root = item
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[item] != root:
+            self.parent[item], item = root, self.parent[item]
+        return root
+
+    def union(self, a, b):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            self.parent[root_b] = root_a
+
+
+def _assign_representatives(values, max_distance):
+    # Каждый хэш сравнивается только с представителями групп, а не со всеми членами: иначе цепочка
+    # A~B, B~C собрала бы в одну группу далекие друг от друга A и C. Новый хэш входит в группу
+    # ближайшего представителя на расстоянии <= d или сам становится представителем.
+    # По принципу Дирихле хэши на расстоянии <= d совпадают хотя бы в одной из d + 1 полос битов,
+    # поэтому кандидаты берутся только из общих корзин
+    bands = min(max_distance + 1, HASH_BITS)
+    bounds = [round(i * HASH_BITS / bands) for i in range(bands + 1)]
+    buckets = defaultdict(list)
+    representatives = {}
+    for value in values:
+        keys = [(band, (value >> bounds[band]) & ((1 << (bounds[band + 1] - bounds[band])) - 1))
+                for band in range(bands)]
+        best = None
+        for key in keys:
+            for representative in buckets.get(key, ()):
+                distance = bin(value ^ representative).count('1')
+                if distance <= max_distance and (best is None or distance < best[0]):
+                    best = (distance, representative)
+        if best is not None:
+            representatives[value] = best[1]
+            continue
+        representatives[value] = value
+        for key in keys:
+            buckets[key].append(value)
+    return representatives
+
+
+def find_duplicates(image_files, images_folder, mode='exact', max_distance=4, workers=None):
+    start_time = time.time()
+    if mode == 'perceptual' and Image is None:
+        logger.warning("⚠️ Pillow не установлен, перцептивный поиск дубликатов недоступен - только точные копии")
+        mode = 'exact'
+
+    workers = workers or min(8, os.cpu_count() or 1)
+    paths = [os.path.join(images_folder, image_file) for image_file in image_files]
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='dedup') as executor:
+        digests = list(executor.map(lambda path: _safe(content_hash, path), paths))
+
+    groups = _DisjointSet(image_files)
+    by_digest = {}
+    for image_file, digest in zip(image_files, digests):
+        if digest is None:
+            continue
+        if digest in by_digest:
+            groups.union(by_digest[digest], image_file)
+        else:
+            by_digest[digest] = image_file
+    exact_duplicates = len([d for d in digests if d is not None]) - len(by_digest)
+
+    if mode == 'perceptual' and len(by_digest) > 1:
+        # Перцептивный хэш считаем один раз на группу точных копий
+        unique_files = list(by_digest.values())
+        unique_paths = [os.path.join(images_folder, image_file) for image_file in unique_files]
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='dedup') as executor:
+            perceptual = list(executor.map(lambda path: _safe(difference_hash, path), unique_paths))
+
+        by_value = {}
+        for image_file, value in zip(unique_files, perceptual):
+            if value is None:
+                continue
+            if value in by_value:
+                groups.union(by_value[value], image_file)
+            else:
+                by_value[value] = image_file
+        for value, representative in _assign_representatives(list(by_value), max_distance).items():
+            if value != representative:
+                groups.union(by_value[representative], by_value[value])
+
+    members = defaultdict(list)
+    for image_file in image_files:
+        members[groups.find(image_file)].append(image_file)
+    duplicate_groups = [group for group in members.values() if len(group) > 1]
+
+    duplicates = sum(len(group) - 1 for group in duplicate_groups)
+    stats = {
+        'mode': mode,
+        'max_distance': max_distance if mode == 'perceptual' else 0,
+        'images': len(image_files),
+        'unique': len(image_files) - duplicates,
+        'duplicates': duplicates,
+        'groups': len(duplicate_groups),
+        'exact_duplicates': exact_duplicates,
+        'perceptual_duplicates': duplicates - exact_duplicates,
+        'hash_seconds': time.time() - start_time,
+    }
+    logger.info(f"🪞 Дубликаты ({mode}): {duplicates} из {len(image_files)} изображений в {len(duplicate_groups)} "
+                f"группах, точных копий: {exact_duplicates}, хэширование {stats['hash_seconds']:.2f} сек")
+    return duplicate_groups, stats
@@ -0,0 +1,167 @@
+import contextvars
+import logging
+import math
+import queue
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+def _percentile(values, percentile):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(percentile / 100 * len(ordered)) - 1))]
+
+
+def _succeeded(result):
+    return not isinstance(result, Exception) and result.get('status') != 'failed'
+
+
+class HedgePolicy:
+    # Если задача не завершилась за percentile-й процентиль недавних задержек, та же задача отправляется
+    # повторно (на резервный сервер), и берется результат, пришедший первым. Повторов не больше
+    # budget от числа запросов - иначе при общей деградации сервера хеджирование удвоило бы нагрузку
+    def __init__(self, percentile=95.0, min_samples=20, budget=0.05, min_delay=1.0, window=200):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.budget = budget
+        self.min_delay = min_delay
+        self.recent = deque(maxlen=window)
+        self.latencies = []
+        self._lock = threading.Lock()
+        self.stats = {
+            'requests': 0,
+            'hedged': 0,
+            'hedge_wins': 0,
+            'primary_wins': 0,
+            'budget_denied': 0,
+        }
+
+    def threshold(self):
+        # None - истории еще мало, хеджировать не по чему
+        with self._lock:
+            if len(self.recent) < self.min_samples:
+                return None
+            return max(self.min_delay, _percentile(self.recent, self.percentile))
+
+    def _take_budget(self):
+        with self._lock:
+            if self.stats['hedged'] + 1 > self.budget * self.stats['requests']:
+                self.stats['budget_denied'] += 1
+                return False
+            self.stats['hedged'] += 1
+            return True
+
+    def _record(self, latency, source=None, hedged=False):
+        # Захеджированные запросы тоже идут в окно: их время не меньше порога, и без них хвост
+        # распределения исчезал бы, а порог сползал бы вниз
+        with self._lock:
+            self.latencies.append(latency)
+            self.recent.append(latency)
+            if source == 'hedge':
+                self.stats['hedge_wins'] += 1
+            elif hedged:
+                self.stats['primary_wins'] += 1
+
+    def run(self, primary, hedge):
+        # primary и hedge - функции от threading.Event: после set() проигравший запрос прекращает опрос.
+        # Исходный запрос выполняется в потоке вызывающего (контекст изображения и HTTP-сессия потока
+        # сохраняются), повтор - в потоке таймера с копией контекста и только если порог пройден
+        with self._lock:
+            self.stats['requests'] += 1
+        cancels = {'primary': threading.Event(), 'hedge': threading.Event()}
+        hedge_results = queue.Queue()
+        state = {'done': False, 'hedged': False, 'hedge_finished': None}
+        state_lock = threading.Lock()
+
+        start = time.monotonic()
+        delay = self.threshold()
+
+        def fire():
+            with state_lock:
+                if state['done'] or not self._take_budget():
+                    return
+                state['hedged'] = True
+            logger.info(f"🐇 Задача дольше {delay:.1f} сек (p{self.percentile:g}), отправляем повтор")
+            try:
+                result = hedge(cancels['hedge'])
+            except Exception as e:
+                result = e
+            state['hedge_finished'] = time.monotonic()
+            if _succeeded(result):
+                cancels['primary'].set()
+            hedge_results.put(result)
+
+        timer = None
+        if delay is not None:
+            timer = threading.Timer(delay, contextvars.copy_context().run, args=(fire,))
+            timer.daemon = True
+            timer.start()
+
+        try:
+            result = primary(cancels['primary'])
+        except Exception as e:
+            result = e
+        finished = time.monotonic()
+        with state_lock:
+            state['done'] = True
+            hedged = state['hedged']
+        if timer is not None:
+            timer.cancel()
+
+        source = 'primary'
+        if hedged:
+            if _succeeded(result):
+                cancels['hedge'].set()
+            else:
+                # Ошибка исходного запроса не повод отказаться от повтора, он еще может успеть
+                hedge_result = hedge_results.get()
+                if _succeeded(hedge_result) or isinstance(result, Exception):
+                    source, result = 'hedge', hedge_result
+                    finished = state['hedge_finished']
+        if isinstance(result, Exception):
+            raise result
+
+        if result.get('status') != 'failed':
+            self._record(finished - start, source, hedged)
+        return result
+
+    def get_stats(self, baseline=None):
+        with self._lock:
+            stats = dict(self.stats)
+            observed = baseline.get('observed', 0) if baseline else 0
+            latencies = self.latencies[observed:]
+            stats['observed'] = len(self.latencies)
+            stats['threshold'] = max(self.min_delay, _percentile(self.recent, self.percentile)) \
+                if len(self.recent) >= self.min_samples else None
+        if baseline:
+            for key in self.stats:
+                stats[key] -= baseline.get(key, 0)
+        stats['percentile'] = self.percentile
+        stats['budget'] = self.budget
+        stats['hedge_rate'] = stats['hedged'] / stats['requests'] * 100 if stats['requests'] else 0.0
+        for p in (50, 95, 99):
+            stats[f'latency_p{p}'] = _percentile(latencies, p)
+        return stats
+
+
+_policy = None
+_policy_lock = threading.Lock()
+
+
+def get_hedge_policy(percentile=95.0, min_samples=20, budget=0.05, min_delay=1.0, window=200):
+    global _policy
+    with _policy_lock:
+        if _policy is None:
+            _policy = HedgePolicy(percentile, min_samples, budget, min_delay, window)
+            logger.info(f"🐇 Хеджирование запросов: повтор после p{percentile:g} задержки "
+                        f"(не раньше {min_delay:g} сек), бюджет {budget * 100:g}% запросов")
+        return _policy
+
+
+def current_hedge_policy():
+    with _policy_lock:
+        return _policy
@@ -2,15 +2,35 @@ import pandas as pd
 import time
 import shutil
 import os
-from datetime import datetime
+from datetime import datetime, timedelta
 import threading
+from itertools import islice
 from config import *
-from recognition_runner import run_recognition_on_image
+from recognition_runner import (run_recognition_on_image, run_recognition_batch_local,
+                                get_local_batch_capabilities, configure_local_threads, create_error_result)
+from process.concurrency import AdaptiveLimiter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from process.retry_queue import RetryQueue, get_circuit_breakers
+from process.scheduler import schedule_images, BatchPlanner
+from process.sampler import StratifiedSampler
+from process.dedup import find_duplicates
+from process.prefetch import ImagePrefetcher, merge_prefetch_stats, summarize_prefetch_stats
+from process.chunked import ChunkAggregator, peak_rss_mb
+from process.callback_listener import get_callback_listener
+from process.rate_limiter import get_rate_limiters
+from process.hedging import current_hedge_policy
 from accuracy_calculator import compare_numeric_values, compare_text_values
-from utils.file_utils import load_excel_data, get_image_files, save_excel_progress
+from utils.file_utils import (get_image_files, save_excel_progress, save_results_parquet, iter_reference_chunks,
+                              ChunkedResultsWriter, create_chunked_results_workbook)
+from utils.log_utils import DETAIL, SUMMARY, detail_enabled, image_context
+from utils.raw_archive import RawResultArchive, raw_archive_path
+from utils.profiling import RunProfiler, profile_dir_path
+from utils.reference_cache import load_reference_data, build_filename_mapping
 
 logger = logging.getLogger(__name__)
 
+_copy_lock = threading.Lock()
+
 
 class ImageProcessor:
     def __init__(self):
@@ -18,8 +38,30 @@ class ImageProcessor:
         self.errors_count = 0
         self.skipped_count = 0
         self.df_lock = threading.Lock()
-
-    def create_excel_copy(self, original_excel):
+        self.save_lock = threading.Lock()
+        self.last_progress_save = time.monotonic()
+        self.retry_queue = None
+        self.deferred_images = set()
+        self.schedule_stats = None
+        self.sampler = None
+        self.limiter = None
+        self.image_costs = {}
+        self.raw_archive = None
+        self.profiler = None
+        self.filename_to_index = {}
+        self.duplicates = {}
+        self.dedup_stats = None
+        self.fanned_out = 0
+        self.results_file = None
+        self.last_report = None
+        self.prefetcher = None
+        self.prefetch_totals = None
+        self.callback_listener = None
+        self.callback_baseline = None
+        self.rate_limit_baseline = {}
+        self.hedge_baseline = None
+
+    def create_excel_copy(self, original_excel, create_copy=shutil.copy2):
         try:
             current_dir = os.path.dirname(os.path.abspath(__file__))
             target_dir = os.path.join(current_dir, '..', 'detail')
@@ -29,11 +71,17 @@ class ImageProcessor:
             name_without_ext = os.path.splitext(original_name)[0]
 
             version = get_git_version()
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-
-            copy_excel_file = os.path.join(target_dir, f"{name_without_ext}_v{version}_{timestamp}.xlsx")
-
-            shutil.copy2(original_excel, copy_excel_file)
+            created = datetime.now()
+
+            with _copy_lock:
+                # Наборы с одинаковым именем книги, запущенные в одну секунду, не должны делить копию
+                while True:
+                    timestamp = created.strftime("%Y%m%d_%H%M%S")
+                    copy_excel_file = os.path.join(target_dir, f"{name_without_ext}_v{version}_{timestamp}.xlsx")
+                    if not os.path.exists(copy_excel_file):
+                        break
+                    created += timedelta(seconds=1)
+                create_copy(original_excel, copy_excel_file)
             logger.info(f"📋 Создана копия Excel:")
             logger.info(f"   Исходный: {original_excel}")
             logger.info(f"   Копия: {copy_excel_file}")
@@ -90,34 +138,347 @@ class ImageProcessor:
         df.at[row_index, 'Overall Confidence Match'] = int(overall_confidence > 0)
 
     def process_single_image(self, image_file, image_path, df, filename_to_index, save_callback, program_script):
-        logger.info(f"🔍 ПОИСК ФАЙЛА {image_file} В МАППИНГЕ:")
-        logger.info(f"   Доступные файлы в маппинге: {list(filename_to_index.keys())[:5]}...")
+        with image_context(image_file):
+            return self._process_single_image(image_file, image_path, df, filename_to_index,
+                                              save_callback, program_script)
+
+    def _process_single_image(self, image_file, image_path, df, filename_to_index, save_callback, program_script):
+        row_index = self._prepare_image(image_file, df, filename_to_index)
+        if row_index is None:
+            if self.prefetcher:
+                self.prefetcher.discard(image_file)
+            return image_file in filename_to_index
+
+        logger.info(f"Обрабатываем: {image_file}", extra=DETAIL)
+        task_id = f"seq_{int(time.time())}_{image_file.replace('.', '_')}"
+
+        result = self.recognize(image_file, image_path, task_id, program_script)
+        return self._finish_image(result, image_file, image_path, row_index, df, save_callback)
+
+    def _cost_units(self, image_file):
+        if not self.image_costs or image_file not in self.image_costs:
+            return 1.0
+        mean_cost = sum(self.image_costs.values()) / len(self.image_costs)
+        return self.image_costs[image_file] / mean_cost if mean_cost > 0 else 1.0
+
+    def recognize(self, image_file, image_path, task_id, program_script):
+        # Байты берем до захвата слота: ожидание диска не должно занимать место в limiter
+        image_bytes = self.prefetcher.take(image_file) if self.prefetcher else None
+        if self.limiter is None:
+            return run_recognition_on_image(image_path, task_id, program_script, image_bytes)
+
+        started = self.limiter.acquire()
+        outcome = AdaptiveLimiter.IGNORE
+        try:
+            result = run_recognition_on_image(image_path, task_id, program_script, image_bytes)
+            if result.get('circuit_open'):
+                outcome = AdaptiveLimiter.IGNORE
+            elif result['status'] != 'completed' and result.get('retryable'):
+                # Таймауты и 5xx - признак перегрузки; ошибки конкретного изображения лимит не трогают
+                outcome = AdaptiveLimiter.OVERLOAD
+            else:
+                outcome = AdaptiveLimiter.OK
+            return result
+        finally:
+            self.limiter.release(started, outcome, self._cost_units(image_file))
+
+    def get_callback_stats(self):
+        if self.callback_listener is None:
+            return None
+        return self.callback_listener.get_stats(self.callback_baseline)
+
+    def get_rate_limit_stats(self):
+        stats = []
+        for name, bucket in get_rate_limiters().items():
+            bucket_stats = bucket.get_stats(self.rate_limit_baseline.get(name))
+            if bucket_stats['submit_requests'] or bucket_stats['poll_requests']:
+                stats.append(bucket_stats)
+        return stats or None
+
+    def get_hedge_stats(self):
+        policy = current_hedge_policy()
+        if policy is None:
+            return None
+        return policy.get_stats(self.hedge_baseline)
+
+    def get_prefetch_stats(self):
+        if self.prefetch_totals is not None:
+            return summarize_prefetch_stats(self.prefetch_totals)
+        if self.prefetcher is None:
+            return None
+        return self.prefetcher.get_stats()
+
+    def get_concurrency_stats(self):
+        if self.limiter is None:
+            return None
+        return self.limiter.get_stats()
+
+    def _prepare_image(self, image_file, df, filename_to_index):
+        if detail_enabled():
+            logger.info(f"🔍 ПОИСК ФАЙЛА {image_file} В МАППИНГЕ:", extra=DETAIL)
+            logger.info(f"   Доступные файлы в маппинге: {list(islice(filename_to_index, 5))}...", extra=DETAIL)
 
         if image_file not in filename_to_index:
             logger.warning(f"❌ Файл {image_file} не найден в Excel, пропускаем")
-            self.skipped_count += 1
-            return False
+            with self.df_lock:
+                self.skipped_count += 1
+            return None
 
         row_index = filename_to_index[image_file]
-        logger.info(f"✅ Найден файл {image_file} в строке {row_index}")
+        logger.info(f"✅ Найден файл {image_file} в строке {row_index}", extra=DETAIL)
 
         with self.df_lock:
             df.at[row_index, 'Filename'] = image_file
 
         if self.is_already_processed(df, row_index):
-            logger.info(f"Файл {image_file} уже обработан, пропускаем")
-            self.skipped_count += 1
-            return True
+            logger.info(f"Файл {image_file} уже обработан, пропускаем", extra=DETAIL)
+            with self.df_lock:
+                self.skipped_count += 1
+            if self.sampler:
+                self.sampler.record(image_file, row_index)
+            return None
 
-        logger.info(f"Обрабатываем: {image_file}")
-        task_id = f"seq_{int(time.time())}_{image_file.replace('.', '_')}"
+        return row_index
+
+    def _finish_image(self, result, image_file, image_path, row_index, df, save_callback):
+        attempts_used = 0 if result.get('circuit_open') else 1
+        if self.defer_retry(result, image_file, image_path, row_index, attempts_used):
+            return False
+
+        return self.record_result(result, df, row_index, image_file, save_callback, attempts_used)
+
+    def process_image_batch(self, chunk, images_folder, df, filename_to_index, save_callback, program_script):
+        rows = {}
+        items = []
+        for image_file in chunk:
+            with image_context(image_file):
+                row_index = self._prepare_image(image_file, df, filename_to_index)
+            if row_index is None:
+                continue
+            task_id = f"batch_{int(time.time())}_{image_file.replace('.', '_')}"
+            rows[task_id] = (image_file, row_index)
+            items.append((os.path.join(images_folder, image_file), task_id))
+
+        if not items:
+            return
+
+        def on_result(image_path, task_id, result):
+            image_file, row_index = rows[task_id]
+            with image_context(image_file, task_id):
+                self._finish_image(result, image_file, image_path, row_index, df, save_callback)
+
+        if self.limiter is None:
+            missing = run_recognition_batch_local(items, program_script, on_result)
+        else:
+            started = self.limiter.acquire()
+            missing = items
+            try:
+                missing = run_recognition_batch_local(items, program_script, on_result)
+            finally:
+                outcome = AdaptiveLimiter.OVERLOAD if missing else AdaptiveLimiter.OK
+                self.limiter.release(started, outcome, sum(self._cost_units(rows[task_id][0])
+                                                           for _, task_id in items))
+
+        # Изображения без результата повторяем по одному: если распознаватель упал
+        # на конкретном файле, ошибка достанется только его строке
+        for image_path, task_id in missing:
+            image_file, row_index = rows[task_id]
+            with image_context(image_file, task_id):
+                logger.warning(f"🔁 {image_file}: нет результата пакетного запуска, обрабатываем отдельно")
+                result = self.recognize(image_file, image_path, task_id, program_script)
+                self._finish_image(result, image_file, image_path, row_index, df, save_callback)
+
+    def run_batches(self, ordered_files, images_folder, df, filename_to_index, save_callback, program_script,
+                    workers, capabilities):
+        max_batch = min(LOCAL_BATCH_MAX_SIZE, int(capabilities.get('max_batch') or LOCAL_BATCH_MAX_SIZE))
+        planner = BatchPlanner(ordered_files, workers, max_batch, LOCAL_BATCH_TARGET_SECONDS)
+        logger.info(f"📦 Пакетная обработка: до {max_batch} изображений в пакете, "
+                    f"целевая длительность пакета {LOCAL_BATCH_TARGET_SECONDS:.0f} сек")
+
+        def worker():
+            while True:
+                chunk = planner.next_chunk()
+                if not chunk:
+                    return
+                started = time.time()
+                self.process_image_batch(chunk, images_folder, df, filename_to_index, save_callback,
+                                         program_script)
+                completed = planner.record(len(chunk), time.time() - started)
+                logger.info(f"📊 Прогресс: {completed}/{len(ordered_files)} обработано "
+                            f"(пакет {len(chunk)}, {planner.seconds_per_image:.2f} сек/изобр)", extra=SUMMARY)
+                if self.sampling_target_reached(df):
+                    planner.stop()
+
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='recognition') as executor:
+                for future in [executor.submit(worker) for _ in range(workers)]:
+                    future.result()
+        else:
+            worker()
+        logger.info(f"📦 Выполнено пакетов: {planner.chunks}", extra=SUMMARY)
+
+    def defer_retry(self, result, image_file, image_path, row_index, attempts_used):
+        if self.retry_queue is None or result['status'] == 'completed' or not result.get('retryable'):
+            return False
+
+        item = {'image_file': image_file, 'image_path': image_path, 'row_index': row_index}
+        if not self.retry_queue.defer(item, attempts_used, result.get('retry_after')):
+            return False
+
+        self.deferred_images.add(image_file)
+        if result.get('circuit_open'):
+            logger.info(f"🔌 {image_file} отложен: сервер временно исключен из отправки", extra=DETAIL)
+        else:
+            logger.warning(f"🔁 {image_file} отложен для повтора (использовано попыток: {attempts_used}/"
+                           f"{self.retry_queue.max_attempts}): {result.get('error', '')}")
+        return True
+
+    def process_deferred_retries(self, df, save_callback, program_script, deadline=None):
+        if not self.retry_queue:
+            return
+
+        logger.info(f"🔁 Повторная обработка отложенных изображений: {len(self.retry_queue)}", extra=SUMMARY)
+        stats = self.retry_queue.stats
+
+        while True:
+            entry = self.retry_queue.pop_ready(deadline)
+            if entry is None:
+                break
+
+            attempts_used, item = entry
+            image_file = item['image_file']
+            with image_context(image_file):
+                task_id = f"retry_{int(time.time())}_{image_file.replace('.', '_')}"
+                result = self.recognize(image_file, item['image_path'], task_id, program_script)
+
+                if not result.get('circuit_open'):
+                    attempts_used += 1
+                    stats['retry_attempts'] += 1
+
+                if self.defer_retry(result, image_file, item['image_path'], item['row_index'], attempts_used):
+                    continue
+
+                if result['status'] == 'completed':
+                    stats['recovered'] += 1
+                    logger.info(f"🔁 {image_file} успешно обработан с попытки {attempts_used}")
+                else:
+                    stats['exhausted'] += 1
+
+                self.record_result(result, df, item['row_index'], image_file, save_callback, attempts_used)
 
-        result = run_recognition_on_image(image_path, task_id, program_script)
+        for attempts_used, item in self.retry_queue.drain():
+            stats['deadline_expired'] += 1
+            result = create_error_result("Run deadline exceeded before retry")
+            self.record_result(result, df, item['row_index'], item['image_file'], save_callback, attempts_used)
 
-        return self.update_dataframe_with_result(result, df, row_index, image_file, save_callback)
+        if stats['deadline_expired']:
+            logger.warning(f"⏰ Дедлайн прогона истек, не повторено изображений: {stats['deadline_expired']}")
 
-    def update_dataframe_with_result(self, result, df, row_index, image_file, save_callback):
-        logger.info(f"📊 Начинаем запись в Excel для {image_file}")
+    def get_retry_stats(self):
+        if self.retry_queue is None:
+            return None
+
+        stats = dict(self.retry_queue.stats)
+        stats['deferred'] = len(self.deferred_images)
+        stats['max_attempts'] = self.retry_queue.max_attempts
+        breakers = get_circuit_breakers()
+        stats['circuit_open_count'] = sum(breaker.open_count for breaker in breakers.values())
+        stats['circuit_rejected'] = sum(breaker.rejected_count for breaker in breakers.values())
+        return stats
+
+    def sampling_target_reached(self, df, completed=None):
+        if not self.sampler or (completed is not None and completed % SAMPLE_CHECK_EVERY):
+            return False
+        with self.df_lock:
+            if not self.sampler.should_stop(df):
+                return False
+        logger.info(f"🎲 Интервалы сузились до {self.sampler.target_width:.1f} п.п. после "
+                    f"{self.sampler.sample_size()} изображений, обработка остановлена", extra=SUMMARY)
+        return True
+
+    def get_sampling_stats(self, df):
+        if not self.sampler:
+            return None
+        with self.df_lock:
+            return self.sampler.get_stats(df)
+
+    def select_representatives(self, groups, df):
+        self.duplicates = {}
+        for group in groups:
+            # Представителем берем первое еще не обработанное изображение группы, иначе при
+            # дозапуске готовый представитель был бы пропущен вместе со всеми копиями
+            pending = [f for f in group if f in self.filename_to_index
+                       and not self.is_already_processed(df, self.filename_to_index[f])]
+            representative = pending[0] if pending else group[0]
+            self.duplicates[representative] = [f for f in group if f != representative]
+        return {f for duplicates in self.duplicates.values() for f in duplicates}
+
+    def record_result(self, result, df, row_index, image_file, save_callback, attempt=1):
+        # Копии получают ответ представителя, но сравниваются каждая со своими эталонами.
+        # Сохраняет файл только запись представителя
+        for duplicate in self.duplicates.get(image_file, ()):
+            with image_context(duplicate):
+                duplicate_row = self._prepare_image(duplicate, df, self.filename_to_index)
+                if duplicate_row is None:
+                    continue
+                logger.info(f"🪞 {duplicate}: результат копии {image_file}", extra=DETAIL)
+                self.update_dataframe_with_result(result, df, duplicate_row, duplicate, lambda current_df: True,
+                                                  attempt, duplicate_of=image_file)
+                with self.df_lock:
+                    self.fanned_out += 1
+        return self.update_dataframe_with_result(result, df, row_index, image_file, save_callback, attempt)
+
+    def get_dedup_stats(self, df):
+        if self.dedup_stats is None:
+            return None
+        stats = dict(self.dedup_stats)
+        stats['fanned_out'] = self.fanned_out
+        stats['saved_seconds'] = None
+        rows = [self.filename_to_index[f] for f in self.duplicates if f in self.filename_to_index]
+        if rows and 'Timing Total' in df.columns:
+            with self.df_lock:
+                timings = pd.to_numeric(df.loc[rows, 'Timing Total'], errors='coerce').dropna()
+            if len(timings):
+                stats['saved_seconds'] = float(timings.mean()) * self.fanned_out
+        return stats
+
+    def save_progress(self, df, save_callback):
+        # Книга переписывается целиком, поэтому промежуточное сохранение - не чаще PROGRESS_SAVE_INTERVAL:
+        # сохранение после каждого изображения делало прогон квадратичным по числу строк.
+        # Пока один поток сохраняет, остальные не ждут его, а пропускают сохранение
+        if PROGRESS_SAVE_INTERVAL <= 0 or time.monotonic() - self.last_progress_save < PROGRESS_SAVE_INTERVAL:
+            return None
+        if not self.save_lock.acquire(blocking=False):
+            return None
+        try:
+            if time.monotonic() - self.last_progress_save < PROGRESS_SAVE_INTERVAL:
+                return None
+            # Сохранение читает весь DataFrame, поэтому не должно пересекаться с записью из других потоков
+            with self.df_lock:
+                saved = save_callback(df)
+            self.last_progress_save = time.monotonic()
+            return saved
+        finally:
+            self.save_lock.release()
+
+    def update_dataframe_with_result(self, result, df, row_index, image_file, save_callback, attempt=1,
+                                     duplicate_of=None):
+        logger.info(f"📊 Начинаем запись в Excel для {image_file}", extra=DETAIL)
+        if self.sampler and duplicate_of is None:
+            self.sampler.record(image_file, row_index)
+        if self.raw_archive:
+            self.raw_archive.append(image_file, attempt, result)
+        if self.profiler and duplicate_of is None:
+            self.profiler.image_done()
+
+        with self.df_lock:
+            if 'Attempts' not in df.columns:
+                df['Attempts'] = 0
+            df.at[row_index, 'Attempts'] = attempt
+            if duplicate_of is not None:
+                if 'Duplicate Of' not in df.columns:
+                    df['Duplicate Of'] = ''
+                df.at[row_index, 'Duplicate Of'] = duplicate_of
 
         if result['status'] == 'completed':
             try:
@@ -142,12 +503,13 @@ class ImageProcessor:
                 ref_rate = str(df.at[row_index, 'Rate (reference)']) if pd.notna(
                     df.at[row_index, 'Rate (reference)']) else ''
 
-                logger.info(f"💾 ЗАПИСЫВАЕМ В EXCEL ДЛЯ {image_file}:")
-                logger.info(f"   📝 Indications: {meter_reading}")
-                logger.info(f"   📝 Series number: {serial_number}")
-                logger.info(f"   📝 Model: {model}")
-                logger.info(f"   📝 Rate: {rate}")
-                logger.info(f"   📝 Overall Confidence: {overall_confidence}")
+                if detail_enabled():
+                    logger.info(f"💾 ЗАПИСЫВАЕМ В EXCEL ДЛЯ {image_file}:", extra=DETAIL)
+                    logger.info(f"   📝 Indications: {meter_reading}", extra=DETAIL)
+                    logger.info(f"   📝 Series number: {serial_number}", extra=DETAIL)
+                    logger.info(f"   📝 Model: {model}", extra=DETAIL)
+                    logger.info(f"   📝 Rate: {rate}", extra=DETAIL)
+                    logger.info(f"   📝 Overall Confidence: {overall_confidence}", extra=DETAIL)
 
                 with self.df_lock:
                     df.at[row_index, 'Filename'] = image_file
@@ -179,19 +541,14 @@ class ImageProcessor:
 
                     self.processed_count += 1
 
-                logger.info(f"✅ Данные записаны в DataFrame для {image_file}")
-                logger.info(f"💾 Вызываем сохранение Excel для {image_file}")
-                save_success = save_callback(df)
+                logger.info(f"✅ Данные записаны в DataFrame для {image_file}", extra=DETAIL)
+                save_success = self.save_progress(df, save_callback)
 
                 if save_success:
-                    logger.info(f"✅ Excel файл успешно сохранен для {image_file}")
-                else:
+                    logger.info(f"✅ Промежуточное сохранение Excel после {image_file}", extra=DETAIL)
+                elif save_success is not None:
                     logger.error(f"❌ Ошибка сохранения Excel для {image_file}")
 
-                if self.processed_count % 5 == 0:
-                    logger.info(f"📦 Дополнительное сохранение после {self.processed_count} изображений")
-                    save_callback(df)
-
                 return True
 
             except Exception as e:
@@ -209,28 +566,79 @@ class ImageProcessor:
             return False
 
     def create_filename_mapping(self, df):
-        filename_to_index = {}
         logger.info(f"🔍 СОЗДАЕМ МАППИНГ ФАЙЛОВ:")
         logger.info(f"   Всего строк в DF: {len(df)}")
+        filename_to_index = build_filename_mapping(df)
+        self.log_filename_mapping(filename_to_index)
+        return filename_to_index
 
-        for idx, row in df.iterrows():
-            filename = str(row.get('Filename', '')).strip()
-            if filename:
-                filename_to_index[filename] = idx
-                if len(filename_to_index) <= 5:
-                    logger.info(f"   📁 {filename} -> строка {idx}")
-
+    def log_filename_mapping(self, filename_to_index):
+        for filename, idx in list(filename_to_index.items())[:5]:
+            logger.info(f"   📁 {filename} -> строка {idx}")
         logger.info(f"   📊 Всего найдено соответствий: {len(filename_to_index)}")
-        return filename_to_index
 
-    def process_images_folder(self, images_folder, excel_file, program_script):
+    def process_images_folder(self, images_folder, excel_file, program_script, max_workers=1, profile=False,
+                              limiter=None):
         self.processed_count = self.errors_count = self.skipped_count = 0
         start_time = time.time()
+        self.last_progress_save = time.monotonic()
+        deadline = start_time + RUN_DEADLINE_SECONDS if RUN_DEADLINE_SECONDS > 0 else None
+        self.retry_queue = RetryQueue(RETRY_MAX_ATTEMPTS, RETRY_BACKOFF_BASE, RETRY_BACKOFF_MAX)
+        self.deferred_images = set()
+        workers = max(1, max_workers or 1)
+        # Переданный limiter общий для нескольких наборов, запущенных в одном процессе (run_suites.py)
+        self.limiter = limiter
+        if self.limiter is None and ADAPTIVE_CONCURRENCY:
+            limiter_name = 'local' if SELECTED_SERVER == 'default' else SELECTED_SERVER
+            self.limiter = AdaptiveLimiter(limiter_name, workers, ADAPTIVE_MIN_CONCURRENCY,
+                                           ADAPTIVE_MAX_CONCURRENCY, ADAPTIVE_LATENCY_TOLERANCE)
+        if self.limiter is not None:
+            # Пул потоков - только верхняя граница, фактическое число запросов в работе задает limiter
+            workers = max(workers, self.limiter.max_limit)
+        if SELECTED_SERVER == 'default':
+            # С limiter ядра делятся по стартовому лимиту, а не по максимуму: пока AIMD держит параллелизм
+            # ниже максимума, деление по max_limit оставляло бы ядра простаивать
+            configure_local_threads(int(self.limiter.limit) if self.limiter is not None else workers,
+                                    RECOGNIZER_THREADS)
+        self.callback_listener = None
+        if CALLBACK_ENABLED and SELECTED_SERVER != 'default':
+            # Приемник общий для процесса: статистика прогона считается от снимка на его старте
+            self.callback_listener = get_callback_listener(CALLBACK_HOST, CALLBACK_PORT, CALLBACK_PUBLIC_URL)
+            self.callback_baseline = self.callback_listener.get_stats() if self.callback_listener else None
+        # Квоты общие для процесса, как и приемник обратных вызовов
+        self.rate_limit_baseline = {name: bucket.get_stats() for name, bucket in get_rate_limiters().items()}
+        hedge_policy = current_hedge_policy()
+        self.hedge_baseline = hedge_policy.get_stats() if hedge_policy else None
+        self.prefetch_totals = None
 
         try:
-            copied_excel_file = self.create_excel_copy(excel_file)
-
-            df = load_excel_data(copied_excel_file)
+            if CHUNKED_MODE:
+                copied_excel_file = self.create_excel_copy(excel_file, create_chunked_results_workbook)
+                if copied_excel_file == excel_file:
+                    return False, 0, 0, 0
+            else:
+                copied_excel_file = self.create_excel_copy(excel_file)
+            self.results_file = copied_excel_file
+            self.last_report = None
+            self.raw_archive = None
+            if RAW_ARCHIVE_ENABLED:
+                self.raw_archive = RawResultArchive(raw_archive_path(copied_excel_file))
+            self.profiler = None
+            if profile:
+                self.profiler = RunProfiler(profile_dir_path(copied_excel_file), PROFILE_TRACEMALLOC_EVERY,
+                                            PROFILE_TRACEMALLOC_TOP, PROFILE_SAMPLE_INTERVAL)
+                self.profiler.start()
+
+            if CHUNKED_MODE:
+                aggregator = self.process_reference_chunks(images_folder, excel_file, copied_excel_file,
+                                                           program_script, workers, deadline)
+                return self._finish_run(aggregator is not None, start_time, copied_excel_file, excel_file, None,
+                                        aggregator.get_stats() if aggregator else None)
+
+            # Эталоны читаем из исходной книги: копия каждый раз новая и не попала бы в кэш
+            df, filename_to_index = load_reference_data(
+                excel_file, REFERENCE_CACHE_DIR if REFERENCE_CACHE_ENABLED else None
+            )
             if df is None:
                 logger.error("Не удалось загрузить данные из Excel файла")
                 return False, 0, 0, 0
@@ -240,72 +648,241 @@ class ImageProcessor:
                 logger.error("В указанной папке нет изображений")
                 return False, 0, 0, 0
 
-            filename_to_index = self.create_filename_mapping(df)
+            self.log_filename_mapping(filename_to_index)
+            self.filename_to_index = filename_to_index
+            save_callback = lambda current_df: save_excel_progress(current_df, copied_excel_file)
 
-            logger.info(f"🚀 Запускаем ПОСЛЕДОВАТЕЛЬНУЮ обработку")
+            existing_files = []
+            for image_file in image_files:
+                if not os.path.exists(os.path.join(images_folder, image_file)):
+                    logger.warning(f"Файл {os.path.join(images_folder, image_file)} не существует, пропускаем")
+                    self.skipped_count += 1
+                    continue
+                existing_files.append(image_file)
+
+            self.duplicates, self.dedup_stats, self.fanned_out = {}, None, 0
+            if DEDUP_MODE != 'off':
+                groups, self.dedup_stats = find_duplicates(existing_files, images_folder, DEDUP_MODE,
+                                                           DEDUP_PERCEPTUAL_DISTANCE)
+                fanned_out = self.select_representatives(groups, df)
+                existing_files = [f for f in existing_files if f not in fanned_out]
+
+            strategy = SCHEDULING_STRATEGY
+            self.sampler = None
+            if SAMPLING_ENABLED:
+                # Для выборки важен случайный стратифицированный порядок, поэтому LPT не применяется
+                self.sampler = StratifiedSampler(df, filename_to_index, existing_files, SAMPLE_CI_WIDTH,
+                                                 SAMPLE_CONFIDENCE, SAMPLE_MIN_SIZE, SAMPLE_SEED)
+                existing_files = self.sampler.order()
+                strategy = 'listdir'
+
+            ordered_files, self.image_costs, self.schedule_stats = schedule_images(
+                existing_files, images_folder, df, copied_excel_file, workers, strategy
+            )
+
+            if workers > 1:
+                logger.info(f"🚀 Запускаем ПАРАЛЛЕЛЬНУЮ обработку ({workers} потоков)")
+            else:
+                logger.info(f"🚀 Запускаем ПОСЛЕДОВАТЕЛЬНУЮ обработку")
             logger.info(f"📊 Всего изображений для обработки: {len(image_files)}")
 
-            for i, image_file in enumerate(image_files, 1):
-                image_path = os.path.join(images_folder, image_file)
+            batch_capabilities = None
+            if SELECTED_SERVER == 'default':
+                batch_capabilities = get_local_batch_capabilities(program_script)
+
+            self.prefetcher = None
+            if PREFETCH_DEPTH > 0 and not batch_capabilities:
+                # Серверу уходят прочитанные байты; локальный скрипт читает файл сам, и упреждающее
+                # чтение только прогревает для него кэш ОС
+                self.prefetcher = ImagePrefetcher(images_folder, ordered_files, PREFETCH_DEPTH,
+                                                  int(PREFETCH_MAX_MB * 2**20), PREFETCH_WORKERS,
+                                                  keep_bytes=SELECTED_SERVER != 'default').start()
+
+            dispatch_start = time.time()
+            if batch_capabilities:
+                self.run_batches(ordered_files, images_folder, df, filename_to_index, save_callback,
+                                 program_script, workers, batch_capabilities)
+            elif workers > 1:
+                with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='recognition') as executor:
+                    # Пул забирает задачи в порядке отправки, поэтому дорогие изображения стартуют первыми
+                    futures = [
+                        executor.submit(self.process_single_image, image_file,
+                                        os.path.join(images_folder, image_file), df, filename_to_index,
+                                        save_callback, program_script)
+                        for image_file in ordered_files
+                    ]
+                    for i, future in enumerate(as_completed(futures), 1):
+                        future.result()
+                        if i % 10 == 0 or i == len(futures):
+                            logger.info(f"📊 Прогресс: {i}/{len(futures)} обработано", extra=SUMMARY)
+                        if self.sampling_target_reached(df, i):
+                            for pending in futures:
+                                pending.cancel()
+                            break
+            else:
+                for i, image_file in enumerate(ordered_files, 1):
+                    self.process_single_image(
+                        image_file, os.path.join(images_folder, image_file), df, filename_to_index,
+                        save_callback, program_script
+                    )
 
-                if not os.path.exists(image_path):
-                    logger.warning(f"Файл {image_path} не существует, пропускаем")
-                    self.skipped_count += 1
-                    continue
+                    if i % 10 == 0 or i == len(ordered_files):
+                        logger.info(f"📊 Прогресс: {i}/{len(ordered_files)} обработано", extra=SUMMARY)
+                    if self.sampling_target_reached(df, i):
+                        break
 
-                success = self.process_single_image(
-                    image_file, image_path, df, filename_to_index,
-                    lambda current_df: save_excel_progress(current_df, copied_excel_file),
-                    program_script
-                )
+            self.schedule_stats['actual_makespan'] = time.time() - dispatch_start
+            if self.prefetcher:
+                self.prefetcher.stop()
 
-                if i % 10 == 0 or i == len(image_files):
-                    logger.info(f"📊 Прогресс: {i}/{len(image_files)} обработано")
+            self.process_deferred_retries(df, save_callback, program_script, deadline)
+            if self.raw_archive:
+                self.raw_archive.close()
 
             success = save_excel_progress(df, copied_excel_file)
-            total_time = time.time() - start_time
-
             if success:
-                logger.info("=" * 50)
-                logger.info(f"✅ Обработка завершена!")
-                logger.info(f"✅ Успешно: {self.processed_count}")
-                logger.info(f"❌ Ошибок: {self.errors_count}")
-                logger.info(f"⏭️  Пропущено: {self.skipped_count}")
-                logger.info(f"⏱️  Общее время: {total_time:.2f} секунд")
-                logger.info(f"📈 Скорость: {self.processed_count / max(total_time / 60, 0.01):.2f} изображений/мин")
-                logger.info("=" * 50)
-
-                logger.info(f"🎯 ПЕРЕДАЕМ ФАЙЛ В generate_summary_report:")
-                logger.info(f"   📁 copied_excel_file: {copied_excel_file}")
-                logger.info(f"   📁 excel_file (оригинал): {excel_file}")
-
-
-                from generators.report_generator import generate_summary_report
-                generate_summary_report(
-                    self.processed_count,
-                    self.errors_count,
-                    self.skipped_count,
-                    total_time,
-                    copied_excel_file
-                )
-            else:
-                logger.error("❌ Ошибка при сохранении результатов в Excel")
-
-            return success, self.processed_count, self.errors_count, self.skipped_count
+                save_results_parquet(df, copied_excel_file)
+            return self._finish_run(success, start_time, copied_excel_file, excel_file, df)
 
         except Exception as e:
             logger.error(f"💥 Критическая ошибка при обработке папки: {str(e)}")
             return False, self.processed_count, self.errors_count, self.skipped_count
+        finally:
+            if self.raw_archive:
+                self.raw_archive.close()
+            if self.prefetcher:
+                self.prefetcher.stop()
+            if self.profiler:
+                self.profiler.stop()
+                self.profiler = None
+
+    def _process_chunk_row(self, image_file, image_path, row_index, df, save_callback, program_script):
+        with image_context(image_file):
+            if self.is_already_processed(df, row_index):
+                logger.info(f"Файл {image_file} уже обработан, пропускаем", extra=DETAIL)
+                with self.df_lock:
+                    self.skipped_count += 1
+                if self.prefetcher:
+                    self.prefetcher.discard(image_file)
+                return False
+
+            logger.info(f"Обрабатываем: {image_file}", extra=DETAIL)
+            task_id = f"chunk_{int(time.time())}_{image_file.replace('.', '_')}"
+            result = self.recognize(image_file, image_path, task_id, program_script)
+            return self._finish_image(result, image_file, image_path, row_index, df, save_callback)
+
+    def process_reference_chunks(self, images_folder, excel_file, results_file, program_script, workers, deadline):
+        # Строки эталонов читаются, распознаются и записываются на диск по CHUNK_SIZE: следующая часть
+        # загружается только после записи предыдущей, поэтому память не растет с числом строк.
+        # Порядок задают строки эталонов, а не папка: выборка, дедупликация и LPT здесь не применяются
+        if SAMPLING_ENABLED:
+            logger.warning("⚠️ Выборочная оценка не поддерживается при обработке частями, обрабатываются все строки")
+        self.sampler = None
+        self.schedule_stats = None
+        self.duplicates, self.dedup_stats, self.fanned_out = {}, None, 0
+        self.filename_to_index = {}
+
+        writer = ChunkedResultsWriter(results_file)
+        aggregator = ChunkAggregator(CHUNK_SIZE, SLICE_COLUMNS, SLICE_MAX_VALUES)
+        # Строки части сохраняются целиком после ее обработки, а не после каждого изображения
+        save_callback = lambda current_df: True
+        logger.info(f"🧩 Обработка частями по {CHUNK_SIZE} строк ({workers} потоков)")
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='recognition') as executor:
+            for chunk_df in iter_reference_chunks(excel_file, CHUNK_SIZE):
+                rows = []
+                missing_images = 0
+                for row_index, image_file in chunk_df['Filename'].items():
+                    if not image_file:
+                        continue
+                    if not os.path.isfile(os.path.join(images_folder, image_file)):
+                        missing_images += 1
+                        continue
+                    rows.append((row_index, image_file))
+
+                self.prefetcher = None
+                if PREFETCH_DEPTH > 0 and rows:
+                    self.prefetcher = ImagePrefetcher(images_folder, [f for _, f in rows], PREFETCH_DEPTH,
+                                                      int(PREFETCH_MAX_MB * 2**20), PREFETCH_WORKERS,
+                                                      keep_bytes=SELECTED_SERVER != 'default').start()
+
+                futures = [
+                    executor.submit(self._process_chunk_row, image_file, os.path.join(images_folder, image_file),
+                                    row_index, chunk_df, save_callback, program_script)
+                    for row_index, image_file in rows
+                ]
+                for future in futures:
+                    future.result()
+                self.process_deferred_retries(chunk_df, save_callback, program_script, deadline)
+
+                if self.prefetcher:
+                    self.prefetcher.stop()
+                    self.prefetch_totals = merge_prefetch_stats(self.prefetch_totals, self.prefetcher.stats)
+                    self.prefetcher = None
+
+                aggregator.add(chunk_df, missing_images)
+                writer.write(chunk_df)
+                peak = peak_rss_mb()
+                logger.info(f"🧩 Часть {aggregator.chunks}: строк {aggregator.rows}, успешно {self.processed_count}, "
+                            f"ошибок {self.errors_count}, без изображения {aggregator.missing_images}"
+                            + (f", пиковая память {peak:.0f} МБ" if peak is not None else ""), extra=SUMMARY)
+
+        if writer.finalize() is None:
+            logger.error("В эталонах нет строк для обработки")
+            return None
+        return aggregator
+
+    def _finish_run(self, success, start_time, copied_excel_file, excel_file, df, chunked_stats=None):
+        total_time = time.time() - start_time
+
+        if success:
+            logger.info("=" * 50, extra=SUMMARY)
+            logger.info(f"✅ Обработка завершена!", extra=SUMMARY)
+            logger.info(f"✅ Успешно: {self.processed_count}", extra=SUMMARY)
+            logger.info(f"❌ Ошибок: {self.errors_count}", extra=SUMMARY)
+            logger.info(f"⏭️  Пропущено: {self.skipped_count}", extra=SUMMARY)
+            logger.info(f"⏱️  Общее время: {total_time:.2f} секунд", extra=SUMMARY)
+            logger.info(f"📈 Скорость: {self.processed_count / max(total_time / 60, 0.01):.2f} изображений/мин", extra=SUMMARY)
+            logger.info("=" * 50, extra=SUMMARY)
+
+            logger.info(f"🎯 ПЕРЕДАЕМ ФАЙЛ В generate_summary_report:")
+            logger.info(f"   📁 copied_excel_file: {copied_excel_file}")
+            logger.info(f"   📁 excel_file (оригинал): {excel_file}")
+
+
+            from generators.report_generator import generate_summary_report
+            self.last_report = generate_summary_report(
+                self.processed_count,
+                self.errors_count,
+                self.skipped_count,
+                total_time,
+                copied_excel_file,
+                retry_stats=self.get_retry_stats(),
+                schedule_stats=self.schedule_stats,
+                sampling_stats=self.get_sampling_stats(df),
+                concurrency_stats=self.get_concurrency_stats(),
+                dedup_stats=self.get_dedup_stats(df),
+                prefetch_stats=self.get_prefetch_stats(),
+                callback_stats=self.get_callback_stats(),
+                rate_limit_stats=self.get_rate_limit_stats(),
+                hedge_stats=self.get_hedge_stats(),
+                chunked_stats=chunked_stats
+            )
+        else:
+            logger.error("❌ Ошибка при сохранении результатов в Excel")
+
+        return success, self.processed_count, self.errors_count, self.skipped_count
 
 
-def process_images_folder(images_folder, excel_file, program_script, max_workers=None):
+def process_images_folder(images_folder, excel_file, program_script, max_workers=None, profile=None):
     logger.info(f"🔍 Обработка изображений:")
     logger.info(f"   Папка с изображениями: {images_folder}")
     logger.info(f"   Excel файл: {excel_file}")
     logger.info(f"   Сервер: {SELECTED_SERVER}")
 
     processor = ImageProcessor()
-    return processor.process_images_folder(images_folder, excel_file, program_script)
+    return processor.process_images_folder(images_folder, excel_file, program_script, max_workers or 1,
+                                           PROFILE_ENABLED if profile is None else profile)
 
 
 def get_processing_stats():
@@ -0,0 +1,184 @@
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class ImagePrefetcher:
+    # Читает изображения заранее, в порядке обработки, пока потоки распознавания ждут сеть.
+    # Буфер ограничен и числом файлов, и объемом: take() освобождает место под следующие
+    def __init__(self, images_folder, ordered_files, depth=8, max_bytes=256 * 2**20, workers=2,
+                 keep_bytes=True):
+        self.images_folder = images_folder
+        self.files = list(ordered_files)
+        self.depth = max(1, depth)
+        self.max_bytes = max_bytes
+        self.workers = max(1, workers)
+        # Без keep_bytes файл только прочитывается в кэш ОС: локальный распознаватель открывает его сам
+        self.keep_bytes = keep_bytes
+        self._planned = set(self.files)
+        self._position = 0
+        self._buffer = {}
+        self._reading = set()
+        self._buffered_bytes = 0
+        self._waiting_for_space = 0
+        self._stopped = False
+        self._cond = threading.Condition()
+        self._threads = []
+        self.stats = {
+            'depth': self.depth,
+            'max_bytes': self.max_bytes,
+            'workers': self.workers,
+            'planned': len(self.files),
+            'loaded': 0,
+            'hits': 0,
+            'stalls': 0,
+            'misses': 0,
+            'stall_seconds': 0.0,
+            'read_seconds': 0.0,
+            'bytes_read': 0,
+            'peak_buffer_bytes': 0,
+            'errors': 0,
+        }
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"prefetch_{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"📖 Упреждающее чтение: до {self.depth} изображений / {self.max_bytes / 2**20:.0f} МБ, "
+                    f"потоков чтения: {self.workers}")
+        return self
+
+    def _has_space(self):
+        return (len(self._buffer) + len(self._reading) < self.depth
+                and (self._buffered_bytes < self.max_bytes or not self._buffer))
+
+    def _next_file(self):
+        with self._cond:
+            while not self._stopped:
+                while self._position < len(self.files) and self.files[self._position] not in self._planned:
+                    self._position += 1
+                if self._position >= len(self.files):
+                    return None
+                if self._has_space():
+                    image_file = self.files[self._position]
+                    self._position += 1
+                    self._reading.add(image_file)
+                    return image_file
+                self._waiting_for_space += 1
+                self._cond.notify_all()
+                self._cond.wait()
+                self._waiting_for_space -= 1
+            return None
+
+    def _run(self):
+        while True:
+            image_file = self._next_file()
+            if image_file is None:
+                return
+
+            start = time.perf_counter()
+            data = None
+            try:
+                with open(os.path.join(self.images_folder, image_file), 'rb') as f:
+                    data = f.read()
+            except OSError as e:
+                logger.warning(f"⚠️ Упреждающее чтение {image_file} не удалось: {e}")
+            elapsed = time.perf_counter() - start
+
+            with self._cond:
+                self._reading.discard(image_file)
+                self.stats['read_seconds'] += elapsed
+                if data is None:
+                    # Ошибку чтения получит сам распознаватель при повторном открытии
+                    self._planned.discard(image_file)
+                    self.stats['errors'] += 1
+                elif image_file in self._planned:
+                    self.stats['loaded'] += 1
+                    self.stats['bytes_read'] += len(data)
+                    self._buffer[image_file] = data if self.keep_bytes else b''
+                    self._buffered_bytes += len(self._buffer[image_file])
+                    self.stats['peak_buffer_bytes'] = max(self.stats['peak_buffer_bytes'], self._buffered_bytes)
+                self._cond.notify_all()
+
+    def take(self, image_file):
+        # None - байтов в буфере нет, вызывающий читает файл сам
+        with self._cond:
+            if image_file not in self._planned:
+                return None
+
+            start = time.perf_counter()
+            stalled = False
+            while image_file not in self._buffer:
+                # Файл еще не начали читать, а буфер занят другими - ждать бессмысленно
+                not_started = image_file not in self._reading
+                if self._stopped or (not_started and self._waiting_for_space) or \
+                        (not_started and not any(thread.is_alive() for thread in self._threads)):
+                    self._planned.discard(image_file)
+                    self.stats['misses'] += 1
+                    if stalled:
+                        self.stats['stall_seconds'] += time.perf_counter() - start
+                    self._cond.notify_all()
+                    return None
+                stalled = True
+                self._cond.wait(0.5)
+
+            self._planned.discard(image_file)
+            data = self._buffer.pop(image_file)
+            self._buffered_bytes -= len(data)
+            if stalled:
+                self.stats['stalls'] += 1
+                self.stats['stall_seconds'] += time.perf_counter() - start
+            else:
+                self.stats['hits'] += 1
+            self._cond.notify_all()
+            return data if self.keep_bytes else None
+
+    def discard(self, image_file):
+        # Изображение пропущено (уже обработано, нет в Excel) - его байты больше не нужны
+        with self._cond:
+            self._planned.discard(image_file)
+            data = self._buffer.pop(image_file, None)
+            if data is not None:
+                self._buffered_bytes -= len(data)
+            self._cond.notify_all()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._buffer.clear()
+            self._buffered_bytes = 0
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout=5)
+
+    def get_stats(self):
+        with self._cond:
+            stats = dict(self.stats)
+        return summarize_prefetch_stats(stats)
+
+
+def merge_prefetch_stats(total, stats):
+    # Счетчики нескольких буферов подряд: при обработке частями буфер заводится на каждую часть
+    if total is None:
+        return dict(stats)
+    merged = dict(total)
+    for key, value in stats.items():
+        if key == 'peak_buffer_bytes':
+            merged[key] = max(merged[key], value)
+        elif key not in ('depth', 'max_bytes', 'workers'):
+            merged[key] += value
+    return merged
+
+
+def summarize_prefetch_stats(stats):
+    stats = dict(stats)
+    taken = stats['hits'] + stats['stalls'] + stats['misses']
+    stats['taken'] = taken
+    stats['hit_rate'] = stats['hits'] / taken * 100 if taken else 0.0
+    stats['read_mb_per_second'] = stats['bytes_read'] / 2**20 / stats['read_seconds'] \
+        if stats['read_seconds'] > 0 else 0.0
+    return stats
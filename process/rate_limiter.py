@@ -0,0 +1,105 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+SUBMIT = 'submit'
+POLL = 'poll'
+
+
+class TokenBucket:
+    # Квота сервера: rate запросов в секунду в среднем и не больше burst подряд.
+    # Создание задач и опрос результатов берут токены из одного ведра, но опрос уступает:
+    # пока хоть один поток ждет токен на создание задачи, опрос токен не получает
+    def __init__(self, name, rate, burst):
+        self.name = name
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self._waiting = {SUBMIT: 0, POLL: 0}
+        self._cond = threading.Condition()
+        self.stats = {}
+        for kind in (SUBMIT, POLL):
+            self.stats[f'{kind}_requests'] = 0
+            self.stats[f'{kind}_waited'] = 0
+            self.stats[f'{kind}_wait_seconds'] = 0.0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, kind=SUBMIT):
+        start = time.monotonic()
+        with self._cond:
+            self._waiting[kind] += 1
+            try:
+                while True:
+                    self._refill()
+                    yielding = kind == POLL and self._waiting[SUBMIT] > 0
+                    if self.tokens >= 1 and not yielding:
+                        self.tokens -= 1
+                        break
+                    # До следующего токена; уступивший опрос проснется по notify от забравшего токен
+                    timeout = (1 - self.tokens) / self.rate if self.tokens < 1 else 0.05
+                    self._cond.wait(timeout)
+            finally:
+                self._waiting[kind] -= 1
+            self._cond.notify_all()
+
+            waited = time.monotonic() - start
+            self.stats[f'{kind}_requests'] += 1
+            if waited > 0.001:
+                self.stats[f'{kind}_waited'] += 1
+                self.stats[f'{kind}_wait_seconds'] += waited
+        return waited
+
+    def get_stats(self, baseline=None):
+        with self._cond:
+            stats = dict(self.stats)
+        if baseline:
+            stats = {key: value - baseline.get(key, 0) for key, value in stats.items()}
+        stats.update(name=self.name, rate=self.rate, burst=self.burst)
+        stats['wait_seconds'] = stats[f'{SUBMIT}_wait_seconds'] + stats[f'{POLL}_wait_seconds']
+        return stats
+
+
+def parse_rate_limits(spec):
+    # "server1:5:10,server2:2" -> {'server1': (5.0, 10), 'server2': (2.0, None)}
+    limits = {}
+    for item in (spec or '').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        parts = item.split(':')
+        try:
+            if len(parts) not in (2, 3):
+                raise ValueError(item)
+            limits[parts[0].strip()] = (float(parts[1]), int(parts[2]) if len(parts) == 3 else None)
+        except ValueError:
+            logger.error(f"❌ Неверная квота сервера '{item}', ожидается имя:запросов_в_сек[:всплеск]")
+    return limits
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def get_rate_limiter(name, limits, default_rate=0.0, default_burst=5):
+    # None - квота для сервера не задана, запросы не ограничиваются
+    with _buckets_lock:
+        if name not in _buckets:
+            rate, burst = limits.get(name, (default_rate, None))
+            bucket = None
+            if rate > 0:
+                bucket = TokenBucket(name, rate, burst or default_burst)
+                logger.info(f"🪣 Квота сервера {name}: {rate:g} запр/сек, всплеск до {bucket.burst}")
+            _buckets[name] = bucket
+        return _buckets[name]
+
+
+def get_rate_limiters():
+    with _buckets_lock:
+        return {name: bucket for name, bucket in _buckets.items() if bucket is not None}
@@ -0,0 +1,147 @@
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.open_count = 0
+        self.rejected_count = 0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow_request(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+
+            if self.state == self.OPEN and time.time() - self.opened_at >= self.reset_timeout:
+                logger.info(f"🔌 Сервер {self.name}: пробный запрос после паузы {self.reset_timeout:.1f} сек")
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+
+            self.rejected_count += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info(f"🔌 Сервер {self.name} снова доступен, прием задач возобновлен")
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            self._probe_in_flight = False
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.open_count += 1
+                    logger.warning(f"🔌 Сервер {self.name} недоступен ({self.consecutive_failures} ошибок подряд), "
+                                   f"отправка остановлена на {self.reset_timeout:.1f} сек")
+                self.state = self.OPEN
+                self.opened_at = time.time()
+
+    def release_probe(self):
+        # Пробный запрос отменен (проиграл хеджированию) - исход неизвестен, состояние не меняем,
+        # но следующий запрос снова может стать пробным
+        with self._lock:
+            self._probe_in_flight = False
+
+    def retry_after(self):
+        with self._lock:
+            if self.state != self.OPEN:
+                return 0.0
+            return max(0.0, self.opened_at + self.reset_timeout - time.time())
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(name, failure_threshold=5, reset_timeout=30.0):
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name, failure_threshold, reset_timeout)
+        return _breakers[name]
+
+
+def get_circuit_breakers():
+    with _breakers_lock:
+        return dict(_breakers)
+
+
+class RetryQueue:
+    def __init__(self, max_attempts=3, backoff_base=5.0, backoff_max=120.0):
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._heap = []
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self.stats = {
+            'deferred': 0,
+            'retry_attempts': 0,
+            'recovered': 0,
+            'exhausted': 0,
+            'deadline_expired': 0,
+        }
+
+    def __len__(self):
+        return len(self._heap)
+
+    def backoff_delay(self, attempts_used):
+        delay = min(self.backoff_max, self.backoff_base * (2 ** max(attempts_used - 1, 0)))
+        return delay * random.uniform(0.8, 1.2)
+
+    def defer(self, item, attempts_used, delay=None):
+        if attempts_used >= self.max_attempts:
+            return False
+        if delay is None:
+            delay = self.backoff_delay(attempts_used)
+        with self._lock:
+            heapq.heappush(self._heap, (time.time() + delay, next(self._counter), attempts_used, item))
+        return True
+
+    def pop_ready(self, deadline=None):
+        # Ждем ближайшую по времени задачу, но не дольше дедлайна прогона
+        while self._heap:
+            ready_at = self._heap[0][0]
+            now = time.time()
+            if deadline is not None and now >= deadline:
+                return None
+            if ready_at <= now:
+                with self._lock:
+                    _, _, attempts_used, item = heapq.heappop(self._heap)
+                return attempts_used, item
+            wait = ready_at - now
+            if deadline is not None:
+                wait = min(wait, deadline - now)
+            time.sleep(wait)
+        return None
+
+    def drain(self):
+        with self._lock:
+            items = [(attempts_used, item) for _, _, attempts_used, item in sorted(self._heap)]
+            self._heap = []
+        return items
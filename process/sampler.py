@@ -0,0 +1,146 @@
+import logging
+import math
+import threading
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+SAMPLING_METRICS = {
+    'indications': 'Indications Match',
+    'series': 'Series Match',
+    'model': 'Model Match',
+    'rate': 'Rate Match',
+    'overall': 'Overall Match',
+}
+SAMPLING_LABELS = {
+    'indications': 'Показания',
+    'series': 'Серийные номера',
+    'model': 'Модели',
+    'rate': 'Тарифы',
+    'overall': 'Общая точность',
+}
+STRATA_COLUMNS = ['Model (reference)', 'Rate (reference)']
+
+
+def wilson_interval(p, n, z):
+    if n <= 0:
+        return 0.0, 1.0
+    denominator = 1 + z * z / n
+    center = (p + z * z / (2 * n)) / denominator
+    margin = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denominator
+    return max(0.0, center - margin), min(1.0, center + margin)
+
+
+def _stratum_key(df, row_index):
+    values = []
+    for col in STRATA_COLUMNS:
+        value = df.at[row_index, col] if col in df.columns else ''
+        values.append('' if pd.isna(value) else str(value).strip())
+    return ' | '.join(values)
+
+
+class StratifiedSampler:
+    def __init__(self, df, filename_to_index, image_files, target_width=2.0, confidence=0.95,
+                 min_samples=30, seed=None):
+        self.target_width = target_width
+        self.confidence = confidence
+        self.z = NormalDist().inv_cdf((1 + confidence) / 2)
+        self.min_samples = min_samples
+        self.rng = np.random.default_rng(seed)
+        self.strata = {}
+        self.image_stratum = {}
+        self.recorded = {}
+        self.stop_reason = None
+        self._lock = threading.Lock()
+
+        for image_file in image_files:
+            row_index = filename_to_index.get(image_file)
+            key = _stratum_key(df, row_index) if row_index is not None else ''
+            self.strata.setdefault(key, []).append(image_file)
+            self.image_stratum[image_file] = key
+
+        self.population = len(image_files)
+        logger.info(f"🎲 Выборочный режим: {self.population} изображений, страт: {len(self.strata)}, "
+                    f"целевая ширина интервала: {target_width:.1f} п.п. ({confidence:.0%})")
+
+    def order(self):
+        # Внутри страты порядок случайный; ключ (ранг + u) / размер страты перемешивает страты
+        # так, что любой префикс очереди почти пропорционален размерам страт
+        keys, files = [], []
+        for members in self.strata.values():
+            shuffled = self.rng.permutation(len(members))
+            keys.append((np.arange(len(members)) + self.rng.random(len(members))) / len(members))
+            files.extend(members[i] for i in shuffled)
+        if not files:
+            return []
+        return [files[i] for i in np.argsort(np.concatenate(keys), kind='stable')]
+
+    def record(self, image_file, row_index):
+        with self._lock:
+            self.recorded[image_file] = row_index
+
+    def sample_size(self):
+        with self._lock:
+            return len(self.recorded)
+
+    def estimate(self, df):
+        with self._lock:
+            recorded = list(self.recorded.items())
+        if not recorded:
+            return {}
+
+        files, rows = zip(*recorded)
+        sample = pd.DataFrame({'stratum': [self.image_stratum.get(f, '') for f in files]})
+        for metric, col in SAMPLING_METRICS.items():
+            values = df.loc[list(rows), col] if col in df.columns else pd.Series(0, index=range(len(rows)))
+            sample[metric] = pd.to_numeric(values, errors='coerce').fillna(0).clip(0, 1).to_numpy()
+
+        grouped = sample.groupby('stratum', sort=False)
+        n_h = grouped.size()
+        # Веса страт по генеральной совокупности, нормированные на страты, попавшие в выборку
+        weights = pd.Series({key: len(self.strata.get(key, ())) for key in n_h.index}, dtype=float)
+        weights = weights / weights.sum()
+        n = len(sample)
+
+        estimates = {}
+        for metric in SAMPLING_METRICS:
+            p_h = grouped[metric].mean()
+            p = min(1.0, max(0.0, float((weights * p_h).sum())))
+            variance = float((weights ** 2 * p_h * (1 - p_h) / n_h).sum())
+            # Эффективный объем выборки для стратифицированной оценки, подставляется в интервал Уилсона
+            n_eff = min(n, p * (1 - p) / variance) if variance > 0 else n
+            low, high = wilson_interval(p, n_eff, self.z)
+            estimates[metric] = {
+                'estimate': p * 100,
+                'low': low * 100,
+                'high': high * 100,
+                'width': (high - low) * 100,
+            }
+        return estimates
+
+    def should_stop(self, df):
+        if self.sample_size() < self.min_samples:
+            return False
+        estimates = self.estimate(df)
+        if estimates and all(e['width'] <= self.target_width for e in estimates.values()):
+            self.stop_reason = 'target_width'
+            return True
+        return False
+
+    def get_stats(self, df):
+        estimates = self.estimate(df)
+        with self._lock:
+            sampled_files = list(self.recorded)
+        return {
+            'population': self.population,
+            'sampled': len(sampled_files),
+            'strata': len(self.strata),
+            'confidence': self.confidence,
+            'target_width': self.target_width,
+            'stop_reason': self.stop_reason or 'exhausted',
+            'estimates': estimates,
+            'sampled_files': sampled_files,
+        }
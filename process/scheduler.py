@@ -0,0 +1,182 @@
+import glob
+import heapq
+import logging
+import os
+import re
+import threading
+
+import numpy as np
+import pandas as pd
+
+from utils.file_utils import load_results_parquet, pq
+
+logger = logging.getLogger(__name__)
+
+SCHEDULING_STRATEGIES = ('lpt', 'listdir')
+
+
+def find_previous_results(excel_file):
+    # Копии прогонов называются <имя>_v<версия>_<время>.xlsx, рядом лежит .parquet
+    name = os.path.splitext(os.path.basename(excel_file))[0]
+    match = re.match(r'^(.*)_v[^_]*_\d{8}_\d{6}$', name)
+    base_name = match.group(1) if match else name
+    pattern = os.path.join(os.path.dirname(os.path.abspath(excel_file)), f"{glob.escape(base_name)}_v*.parquet")
+    current = os.path.splitext(os.path.abspath(excel_file))[0]
+    candidates = [path for path in glob.glob(pattern) if os.path.splitext(path)[0] != current]
+    if not candidates:
+        return None
+    return max(candidates, key=os.path.getmtime)
+
+
+def load_timing_history(df, excel_file):
+    history = {}
+
+    previous = find_previous_results(excel_file) if pq is not None else None
+    if previous:
+        try:
+            prev_df = load_results_parquet(previous, ['Filename', 'Timing Total'])
+            if 'Timing Total' in prev_df.columns:
+                timings = pd.to_numeric(prev_df['Timing Total'], errors='coerce')
+                valid = timings.notna() & (timings > 0)
+                history.update(zip(prev_df.loc[valid, 'Filename'].astype(str).str.strip(), timings[valid]))
+                logger.info(f"⏱️  История времени из {os.path.basename(previous)}: {int(valid.sum())} изображений")
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось загрузить историю времени из {previous}: {e}")
+
+    # Значения в самой рабочей книге свежее предыдущего прогона
+    if 'Timing Total' in df.columns:
+        timings = pd.to_numeric(df['Timing Total'], errors='coerce')
+        valid = timings.notna() & (timings > 0)
+        history.update(zip(df.loc[valid, 'Filename'].astype(str).str.strip(), timings[valid]))
+
+    return history
+
+
+def load_pixel_counts(df):
+    if 'Total Pixels' in df.columns:
+        pixels = pd.to_numeric(df['Total Pixels'], errors='coerce')
+    elif 'Width (px)' in df.columns and 'Height (px)' in df.columns:
+        pixels = pd.to_numeric(df['Width (px)'], errors='coerce') * pd.to_numeric(df['Height (px)'], errors='coerce')
+    else:
+        return {}
+    valid = pixels.notna() & (pixels > 0)
+    return dict(zip(df.loc[valid, 'Filename'].astype(str).str.strip(), pixels[valid]))
+
+
+def estimate_costs(image_files, images_folder, history, pixel_counts):
+    # Секунд на пиксель оцениваем по изображениям, для которых известны и время, и размер
+    known = [(history[f], pixel_counts[f]) for f in history if f in pixel_counts]
+    seconds_per_pixel = sum(t for t, _ in known) / sum(p for _, p in known) if known else None
+    default_cost = float(np.median(list(history.values()))) if history else None
+
+    costs = {}
+    sources = {'history': 0, 'pixels': 0, 'file_size': 0, 'default': 0}
+    for image_file in image_files:
+        if image_file in history:
+            costs[image_file] = float(history[image_file])
+            sources['history'] += 1
+        elif image_file in pixel_counts and (seconds_per_pixel or not history):
+            pixels = float(pixel_counts[image_file])
+            costs[image_file] = pixels * seconds_per_pixel if seconds_per_pixel else pixels
+            sources['pixels'] += 1
+        elif default_cost is not None:
+            costs[image_file] = default_cost
+            sources['default'] += 1
+        else:
+            try:
+                costs[image_file] = float(os.path.getsize(os.path.join(images_folder, image_file)))
+            except OSError:
+                costs[image_file] = 0.0
+            sources['file_size'] += 1
+
+    # Без истории оценки относительные (пиксели/байты) и в секунды не переводятся
+    calibrated = bool(history) and sources['file_size'] == 0
+    return costs, sources, calibrated
+
+
+def simulate_makespan(ordered_costs, workers):
+    # Жадная списочная диспетчеризация: задача уходит первому освободившемуся потоку
+    loads = [0.0] * max(1, workers)
+    for cost in ordered_costs:
+        heapq.heapreplace(loads, loads[0] + cost)
+    return max(loads)
+
+
+def schedule_images(image_files, images_folder, df, excel_file, workers, strategy='lpt'):
+    history = load_timing_history(df, excel_file)
+    pixel_counts = load_pixel_counts(df)
+    costs, sources, calibrated = estimate_costs(image_files, images_folder, history, pixel_counts)
+
+    if strategy == 'lpt':
+        ordered = sorted(image_files, key=lambda f: costs[f], reverse=True)
+    else:
+        ordered = list(image_files)
+
+    listdir_makespan = simulate_makespan([costs[f] for f in image_files], workers)
+    predicted_makespan = simulate_makespan([costs[f] for f in ordered], workers)
+
+    stats = {
+        'strategy': strategy,
+        'workers': workers,
+        'images': len(image_files),
+        'cost_sources': sources,
+        'calibrated': calibrated,
+        'predicted_makespan': predicted_makespan if calibrated else None,
+        'predicted_listdir_makespan': listdir_makespan if calibrated else None,
+        'predicted_gain': (1 - predicted_makespan / listdir_makespan) * 100 if listdir_makespan > 0 else 0.0,
+        'actual_makespan': None,
+    }
+
+    logger.info(f"🗂️  Планирование: {strategy}, потоков: {workers}, оценки по истории: {sources['history']}, "
+                f"по пикселям: {sources['pixels']}, по медиане: {sources['default']}, "
+                f"по размеру файла: {sources['file_size']}")
+    if calibrated:
+        logger.info(f"🗂️  Прогноз времени: {predicted_makespan:.1f} сек (в порядке listdir: "
+                    f"{listdir_makespan:.1f} сек)")
+    return ordered, costs, stats
+
+
+class BatchPlanner:
+    def __init__(self, image_files, workers, max_batch, target_seconds, initial_estimate=None):
+        self.queue = list(image_files)
+        self.position = 0
+        self.workers = max(1, workers)
+        self.max_batch = max(1, max_batch)
+        self.target_seconds = target_seconds
+        self.seconds_per_image = initial_estimate
+        self.completed = 0
+        self.chunks = 0
+        self.stopped = False
+        self._lock = threading.Lock()
+
+    def next_chunk(self):
+        with self._lock:
+            remaining = len(self.queue) - self.position
+            if self.stopped or remaining <= 0:
+                return []
+
+            size = self.max_batch
+            if self.seconds_per_image:
+                # Пакет не должен длиться дольше целевого времени, иначе хвост прогона растягивается
+                size = min(size, max(1, int(self.target_seconds / self.seconds_per_image)))
+            # В конце очереди делим остаток поровну между потоками
+            size = max(1, min(size, -(-remaining // self.workers)))
+
+            chunk = self.queue[self.position:self.position + size]
+            self.position += len(chunk)
+            self.chunks += 1
+            return chunk
+
+    def record(self, chunk_size, elapsed):
+        with self._lock:
+            self.completed += chunk_size
+            observed = elapsed / max(chunk_size, 1)
+            if self.seconds_per_image is None:
+                self.seconds_per_image = observed
+            else:
+                self.seconds_per_image = 0.7 * self.seconds_per_image + 0.3 * observed
+            return self.completed
+
+    def stop(self):
+        with self._lock:
+            self.stopped = True
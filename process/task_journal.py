@@ -0,0 +1,95 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def idempotency_key(server_url, image_name, content_hash):
+    # Ключ зависит только от сервера и содержимого файла, поэтому совпадает между перезапусками
+    return hashlib.sha256(f"{server_url}\n{image_name}\n{content_hash}".encode('utf-8')).hexdigest()
+
+
+class TaskJournal:
+    def __init__(self, path, ttl_seconds=86400.0):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.tasks = {}
+        self._file = None
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        now = time.time()
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line_number, line in enumerate(f, 1):
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # Последняя строка могла оборваться при аварийной остановке
+                    logger.warning(f"⚠️ Поврежденная строка {line_number} в {self.path}, пропускаем")
+                    continue
+                if record.get('done'):
+                    self.tasks.pop(record['key'], None)
+                else:
+                    self.tasks[record['key']] = record
+        self.tasks = {key: record for key, record in self.tasks.items()
+                      if now - record['created'] <= self.ttl_seconds}
+
+        # Журнал переписывается только живыми задачами, иначе он рос бы от прогона к прогону
+        temp_file = f"{self.path}.tmp"
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            for record in self.tasks.values():
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        os.replace(temp_file, self.path)
+        if self.tasks:
+            logger.info(f"📒 Незавершенных задач сервера в журнале: {len(self.tasks)} ({self.path})")
+
+    def _write(self, record):
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        try:
+            if self._file is None:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                self._file = open(self.path, 'a', encoding='utf-8')
+            self._file.write(line)
+            # Запись должна пережить падение процесса сразу после создания задачи
+            self._file.flush()
+        except Exception as e:
+            logger.error(f"❌ Ошибка записи в журнал задач {self.path}: {e}")
+
+    def lookup(self, key):
+        with self._lock:
+            record = self.tasks.get(key)
+        if record is None or time.time() - record['created'] > self.ttl_seconds:
+            return None
+        return record['task_uuid']
+
+    def record_created(self, key, image_name, content_hash, task_uuid):
+        record = {'key': key, 'image': image_name, 'sha256': content_hash, 'task_uuid': task_uuid,
+                  'created': time.time()}
+        with self._lock:
+            self.tasks[key] = record
+            self._write(record)
+
+    def record_done(self, key):
+        # Завершенные задачи не переиспользуются: следующий прогон должен проверить сервер заново
+        with self._lock:
+            if self.tasks.pop(key, None) is not None:
+                self._write({'key': key, 'done': True})
+
+
+_journals = {}
+_journals_lock = threading.Lock()
+
+
+def get_task_journal(server_url, journal_dir, ttl_seconds=86400.0):
+    with _journals_lock:
+        if server_url not in _journals:
+            name = hashlib.sha1(server_url.encode('utf-8')).hexdigest()[:12]
+            _journals[server_url] = TaskJournal(os.path.join(journal_dir, f"tasks_{name}.jsonl"), ttl_seconds)
+        return _journals[server_url]
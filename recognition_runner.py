@@ -1,15 +1,65 @@
 import subprocess
+import hashlib
 import json
 import os
 import re
 import sys
 import logging
 import requests
+import tempfile
+import threading
 import time
-from config import TIMEOUT, SERVERS, SELECTED_SERVER, AUTHORIZED_TOKEN
+from config import (TIMEOUT, SERVERS, SELECTED_SERVER, AUTHORIZED_TOKEN,
+                    CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_SECONDS, LOCAL_BATCH_MODE,
+                    TASK_JOURNAL_ENABLED, TASK_JOURNAL_DIR, TASK_JOURNAL_TTL_HOURS,
+                    CALLBACK_ENABLED, CALLBACK_HOST, CALLBACK_PORT, CALLBACK_PUBLIC_URL, CALLBACK_FIELD,
+                    CALLBACK_SAFETY_POLL_SECONDS, RATE_LIMIT_RPS, RATE_LIMIT_BURST, RATE_LIMITS,
+                    HEDGE_ENABLED, HEDGE_SERVER, HEDGE_PERCENTILE, HEDGE_MIN_SAMPLES, HEDGE_BUDGET,
+                    HEDGE_MIN_DELAY, HEDGE_WINDOW)
+from process.callback_listener import get_callback_listener
+from process.hedging import get_hedge_policy
+from process.rate_limiter import get_rate_limiter, parse_rate_limits, SUBMIT, POLL
+from process.retry_queue import get_circuit_breaker
+from process.task_journal import get_task_journal, idempotency_key
+from utils.log_utils import DETAIL, detail_enabled, set_task_id
 
 logger = logging.getLogger(__name__)
 
+THREAD_LIMIT_VARIABLES = ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS',
+                          'NUMEXPR_NUM_THREADS', 'TF_NUM_INTRAOP_THREADS', 'TF_NUM_INTEROP_THREADS')
+_subprocess_env = None
+_http_local = threading.local()
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+_rate_limits = parse_rate_limits(RATE_LIMITS)
+
+
+def get_http_session():
+    # Сессия на поток: соединения с сервером переиспользуются (keep-alive) между изображениями
+    # и наборами одного процесса, а requests.Session не делится между потоками
+    session = getattr(_http_local, 'session', None)
+    if session is None:
+        session = requests.Session()
+        session.headers.update({
+            'Authorization': f'Bearer {AUTHORIZED_TOKEN}',
+            'X-API-Key': AUTHORIZED_TOKEN
+        })
+        _http_local.session = session
+    return session
+
+
+def configure_local_threads(concurrency, threads=0):
+    # Каждый процесс распознавателя по умолчанию занимает все ядра; при нескольких
+    # одновременных процессах делим ядра между ними
+    global _subprocess_env
+    if threads <= 0:
+        threads = max(1, (os.cpu_count() or 1) // max(concurrency, 1))
+    env = dict(os.environ)
+    for name in THREAD_LIMIT_VARIABLES:
+        env.setdefault(name, str(threads))
+    _subprocess_env = env
+    logger.info(f"🧵 Потоков на процесс распознавания: {threads} (одновременно процессов: {concurrency})")
+    return threads
+
 
 def extract_json_from_output(output):
     json_pattern = r'\{.*\}'
@@ -47,200 +97,491 @@ def extract_json_from_output(output):
     return None
 
 
-def run_recognition_on_image_server(image_path, task_id, server_url):
+def _reattach_task(session, server_url, task_uuid, bucket=None):
+    # Задача из журнала может быть уже удалена сервером - тогда изображение отправляется заново
     try:
-        image_name = os.path.basename(image_path)
-        logger.info(f"📤 Отправка изображения на сервер: {image_name}")
-
-        headers = {
-            'Authorization': f'Bearer {AUTHORIZED_TOKEN}',
-            'X-API-Key': AUTHORIZED_TOKEN
-        }
-
-        create_task_url = f"{server_url}/tasks"
-        logger.info(f"🆕 Создаем задачу")
-
-        with open(image_path, 'rb') as image_file:
-            files = {'image': image_file}
-
-            response = requests.post(
-                create_task_url,
-                files=files,
-                headers=headers,
-                timeout=TIMEOUT
-            )
+        if bucket:
+            bucket.acquire(POLL)
+        response = session.get(f"{server_url}/result?uuid={task_uuid}", timeout=TIMEOUT)
+        if response.status_code != 200:
+            return False
+        return response.json().get('status') not in (None, 'failed', 'error')
+    except (requests.exceptions.RequestException, ValueError):
+        return False
+
+
+def _completed_result(recognition_result, image_name):
+    # ЛОГИРУЕМ ЧТО ПРИШЛО В ОТВЕТЕ (только для семплированных изображений)
+    if detail_enabled():
+        logger.info("=" * 60, extra=DETAIL)
+        logger.info(f"📋 ПОЛНЫЙ ОТВЕТ ОТ СЕРВЕРА ДЛЯ {image_name}:", extra=DETAIL)
+
+        fields_to_log = [
+            ('status', '📊 Статус'),
+            ('create_date', '📅 Create date'),
+            ('image_size', '🖼️  Image size'),
+            ('meter_reading', '🔢 Meter reading'),
+            ('model', '📱 Model'),
+            ('model_confidence', '✅ Model confidence'),
+            ('rate', '⚡ Rate'),
+            ('serial_number', '🏷️  Serial number'),
+            ('serial_number_confidence', '✅ Serial confidence'),
+            ('recognition_confidences', '🔢 Recognition confidences'),
+            ('overall_confidence', '📈 Overall confidence'),
+            ('timings', '⏱️  Timings')
+        ]
+
+        for field, description in fields_to_log:
+            value = recognition_result.get(field)
+            logger.info(f"   {description}: {value}", extra=DETAIL)
+
+        logger.info("=" * 60, extra=DETAIL)
+    logger.info(f"✅ Задача завершена! Возвращаем результат для {image_name}", extra=DETAIL)
+    return recognition_result
+
+
+CANCEL_CHECK_SECONDS = 0.5
+
+
+def _cancelled_result():
+    # Проигравший хеджированный запрос: его результат не нужен, задача на сервере просто бросается
+    result = create_error_result('Hedged request cancelled')
+    result['cancelled'] = True
+    return result
+
+
+def _poll_task_result(session, server_url, task_uuid, image_name, waiter=None, bucket=None, cancel=None):
+    # Опрашиваем каждые 5 секунд пока не получим completed. С обратным вызовом ждем уведомления,
+    # а опрос раз в CALLBACK_SAFETY_POLL_SECONDS остается страховкой от потерянных уведомлений
+    result_url = f"{server_url}/result?uuid={task_uuid}"
+    max_attempts = 60  # максимум 5 минут ожидания
+    attempt = 0
+    deadline = time.monotonic() + max_attempts * 5
+
+    safety_poll_at = time.monotonic() + CALLBACK_SAFETY_POLL_SECONDS
+
+    while attempt < max_attempts:
+        if waiter is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            timeout = min(safety_poll_at - time.monotonic(), remaining)
+            if cancel is not None:
+                # Хеджированный запрос ждет уведомления короткими отрезками, чтобы сразу уступить победившему
+                timeout = min(timeout, CANCEL_CHECK_SECONDS)
+            payload = waiter.wait(timeout)
+            if payload is None and cancel is not None:
+                if cancel.is_set():
+                    return _cancelled_result()
+                if time.monotonic() < min(safety_poll_at, deadline):
+                    continue
+            safety_poll_at = time.monotonic() + CALLBACK_SAFETY_POLL_SECONDS
+            if payload is not None:
+                status = payload.get('status')
+                logger.info(f"📬 Уведомление о задаче: '{status}'", extra=DETAIL)
+                if status == 'completed' and 'meter_reading' in payload:
+                    waiter.finish('pushed')
+                    return _completed_result(payload, image_name)
+                if status not in ('completed', 'failed', 'error'):
+                    # Промежуточный статус - опрашивать сервер незачем
+                    continue
+            waiter.record_request()
+
+        if cancel is not None and cancel.is_set():
+            return _cancelled_result()
+        attempt += 1
+        logger.info(f"🔄 Опрос результата {attempt}/{max_attempts}...", extra=DETAIL)
+        if bucket:
+            bucket.acquire(POLL)
+
+        result_response = session.get(
+            result_url,
+            timeout=TIMEOUT
+        )
 
-        logger.info(f"📥 Ответ создания задачи - Статус: {response.status_code}")
+        logger.info(f"📥 Ответ результата - Статус: {result_response.status_code}", extra=DETAIL)
 
-        if response.status_code != 200:
-            error_msg = f"Ошибка создания задачи: HTTP {response.status_code} - {response.text}"
+        if result_response.status_code != 200:
+            error_msg = f"Ошибка получения результата: HTTP {result_response.status_code}"
             logger.error(error_msg)
-            return create_error_result(error_msg)
+            return create_error_result(error_msg, retryable=True)
 
         try:
-            task_data = response.json()
-            task_uuid = task_data.get('task_id')
-            if not task_uuid:
-                error_msg = "Не получен task_id от сервера"
-                logger.error(error_msg)
-                return create_error_result(error_msg)
-
-            logger.info(f"✅ Задача создана, ID: {task_uuid}")
+            recognition_result = result_response.json()
+            current_status = recognition_result.get('status')
+
+            logger.info(f"📊 Текущий статус задачи: '{current_status}'", extra=DETAIL)
+
+            if current_status == 'completed':
+                if waiter is not None:
+                    waiter.finish('notified' if waiter.notified else 'polled')
+                return _completed_result(recognition_result, image_name)
+            elif waiter is None:
+                logger.info(f"⏳ Статус '{current_status}' - ждем 5 секунд...", extra=DETAIL)
+                if cancel is not None:
+                    cancel.wait(5)
+                else:
+                    time.sleep(5)  # ждем 5 секунд перед следующим опросом
 
         except json.JSONDecodeError as e:
-            error_msg = f"Неверный JSON ответ от сервера при создании задачи: {str(e)}"
+            error_msg = f"Неверный JSON в результате: {str(e)}"
             logger.error(error_msg)
-            return create_error_result(error_msg)
+            logger.error(f"📋 Сырой ответ: {result_response.text}")
+            return create_error_result(error_msg, retryable=True)
 
-        # Опрашиваем каждые 5 секунд пока не получим completed
-        result_url = f"{server_url}/result?uuid={task_uuid}"
-        max_attempts = 60  # максимум 5 минут ожидания
-        attempt = 0
+    # Если вышли по максимальному количеству попыток
+    error_msg = f"Превышено время ожидания завершения задачи ({max_attempts * 5} секунд)"
+    logger.error(error_msg)
+    return create_error_result(error_msg, retryable=True)
 
-        while attempt < max_attempts:
-            attempt += 1
-            logger.info(f"🔄 Опрос результата {attempt}/{max_attempts}...")
 
-            result_response = requests.get(
-                result_url,
-                headers=headers,
+def run_recognition_on_image_server(image_path, task_id, server_url, image_bytes=None, bucket=None, cancel=None,
+                                    hedge=False):
+    waiter = None
+    try:
+        image_name = os.path.basename(image_path)
+        logger.info(f"📤 Отправка изображения на сервер: {image_name}", extra=DETAIL)
+
+        session = get_http_session()
+
+        if image_bytes is None:
+            with open(image_path, 'rb') as image_file:
+                image_bytes = image_file.read()
+
+        # Задача на сервере привязана к имени и содержимому файла: после перезапуска незавершенная
+        # задача опрашивается дальше, а не создается повторно
+        content_hash = hashlib.sha256(image_bytes).hexdigest()
+        task_key = idempotency_key(server_url, image_name, content_hash)
+        if hedge:
+            # Повтор на тот же сервер не должен совпасть с исходной задачей ни в журнале, ни по Idempotency-Key
+            task_key = idempotency_key(server_url, f"{image_name}#hedge", content_hash)
+        journal = get_task_journal(server_url, TASK_JOURNAL_DIR, TASK_JOURNAL_TTL_HOURS * 3600) \
+            if TASK_JOURNAL_ENABLED else None
+        task_uuid = journal.lookup(task_key) if journal else None
+
+        if task_uuid and _reattach_task(session, server_url, task_uuid, bucket):
+            set_task_id(task_uuid)
+            logger.info(f"♻️ {image_name}: продолжаем опрос задачи {task_uuid} без повторной загрузки")
+        else:
+            if task_uuid:
+                logger.info(f"♻️ Задача {task_uuid} недоступна на сервере, создаем новую", extra=DETAIL)
+            create_task_url = f"{server_url}/tasks"
+            logger.info(f"🆕 Создаем задачу", extra=DETAIL)
+
+            # Восстановленная из журнала задача создана с адресом прошлого запуска, поэтому
+            # обратный вызов передается только новым задачам
+            listener = get_callback_listener(CALLBACK_HOST, CALLBACK_PORT, CALLBACK_PUBLIC_URL) \
+                if CALLBACK_ENABLED else None
+            waiter = listener.register(server_url) if listener else None
+
+            if bucket:
+                bucket.acquire(SUBMIT)
+            # Байты могут быть прочитаны заранее: в A/B-режиме одно чтение идет на оба сервера
+            response = session.post(
+                create_task_url,
+                files={'image': (image_name, image_bytes)},
+                data={CALLBACK_FIELD: waiter.url} if waiter else None,
+                headers={IDEMPOTENCY_HEADER: task_key},
                 timeout=TIMEOUT
             )
 
-            logger.info(f"📥 Ответ результата - Статус: {result_response.status_code}")
+            logger.info(f"📥 Ответ создания задачи - Статус: {response.status_code}", extra=DETAIL)
 
-            if result_response.status_code != 200:
-                error_msg = f"Ошибка получения результата: HTTP {result_response.status_code}"
+            if response.status_code != 200:
+                error_msg = f"Ошибка создания задачи: HTTP {response.status_code} - {response.text}"
                 logger.error(error_msg)
-                return create_error_result(error_msg)
+                return create_error_result(error_msg, retryable=True)
 
             try:
-                recognition_result = result_response.json()
-                current_status = recognition_result.get('status')
-
-                logger.info(f"📊 Текущий статус задачи: '{current_status}'")
-
-                if current_status == 'completed':
-                    # ЛОГИРУЕМ ЧТО ПРИШЛО В ОТВЕТЕ
-                    logger.info("=" * 60)
-                    logger.info(f"📋 ПОЛНЫЙ ОТВЕТ ОТ СЕРВЕРА ДЛЯ {image_name}:")
-
-                    # Просто печатаем все поля что пришли
-                    fields_to_log = [
-                        ('status', '📊 Статус'),
-                        ('create_date', '📅 Create date'),
-                        ('image_size', '🖼️  Image size'),
-                        ('meter_reading', '🔢 Meter reading'),
-                        ('model', '📱 Model'),
-                        ('model_confidence', '✅ Model confidence'),
-                        ('rate', '⚡ Rate'),
-                        ('serial_number', '🏷️  Serial number'),
-                        ('serial_number_confidence', '✅ Serial confidence'),
-                        ('recognition_confidences', '🔢 Recognition confidences'),
-                        ('overall_confidence', '📈 Overall confidence'),
-                        ('timings', '⏱️  Timings')
-                    ]
-
-                    for field, description in fields_to_log:
-                        value = recognition_result.get(field)
-                        logger.info(f"   {description}: {value}")
-
-                    logger.info("=" * 60)
-                    logger.info(f"✅ Задача завершена! Возвращаем результат для {image_name}")
-                    return recognition_result
-                else:
-                    logger.info(f"⏳ Статус '{current_status}' - ждем 5 секунд...")
-                    time.sleep(5)  # ждем 5 секунд перед следующим опросом
+                task_data = response.json()
+                task_uuid = task_data.get('task_id')
+                if not task_uuid:
+                    error_msg = "Не получен task_id от сервера"
+                    logger.error(error_msg)
+                    return create_error_result(error_msg)
+
+                set_task_id(task_uuid)
+                logger.info(f"✅ Задача создана, ID: {task_uuid}", extra=DETAIL)
+                if journal:
+                    journal.record_created(task_key, image_name, content_hash, task_uuid)
 
             except json.JSONDecodeError as e:
-                error_msg = f"Неверный JSON в результате: {str(e)}"
+                error_msg = f"Неверный JSON ответ от сервера при создании задачи: {str(e)}"
                 logger.error(error_msg)
-                logger.error(f"📋 Сырой ответ: {result_response.text}")
-                return create_error_result(error_msg)
+                return create_error_result(error_msg, retryable=True)
 
-        # Если вышли по максимальному количеству попыток
-        error_msg = f"Превышено время ожидания завершения задачи ({max_attempts * 5} секунд)"
-        logger.error(error_msg)
-        return create_error_result(error_msg)
+        result = _poll_task_result(session, server_url, task_uuid, image_name, waiter, bucket, cancel)
+        if journal and not result.get('retryable'):
+            journal.record_done(task_key)
+        return result
 
     except requests.exceptions.Timeout:
         logger.error(f"⏰ Таймаут при обработке {os.path.basename(image_path)}")
-        return create_error_result('Server timeout')
+        return create_error_result('Server timeout', retryable=True)
+    except requests.exceptions.RequestException as e:
+        logger.error(f"💥 Ошибка соединения с сервером для {os.path.basename(image_path)}: {str(e)}")
+        return create_error_result(str(e), retryable=True)
     except Exception as e:
         logger.error(f"💥 Ошибка связи с сервером для {os.path.basename(image_path)}: {str(e)}")
         return create_error_result(str(e))
+    finally:
+        if waiter:
+            waiter.close()
+
+
+def finalize_local_result(recognition_result, image_path):
+    if recognition_result.get('status') == 'failed':
+        error_msg = recognition_result.get('error', 'Unknown error')
+        logger.error(f"Распознавание не удалось для {image_path}: {error_msg}")
+        return create_error_result(error_msg)
+    if 'overall_confidence' not in recognition_result:
+        serial_conf = recognition_result.get('serial_number_confidence', 0.0)
+        digit_confs = recognition_result.get('recognition_confidences', [])
+
+        def calculate_overall(serial_conf, digit_confs):
+            if not digit_confs:
+                return round(serial_conf, 4)
+
+            product = 1.0
+            for conf in digit_confs:
+                product *= conf
 
+            return round(serial_conf * product, 4)
 
-def run_recognition_on_image_local(image_path, task_id, program_script):
+        recognition_result['overall_confidence'] = calculate_overall(serial_conf, digit_confs)
+    return recognition_result
+
+
+def _communicate_local(process, cancel):
+    # С cancel ожидание идет короткими отрезками, чтобы проигравший хеджированный запуск не занимал
+    # процессор до конца распознавания
+    deadline = time.monotonic() + TIMEOUT
+    while True:
+        wait = deadline - time.monotonic()
+        if cancel is not None:
+            wait = min(wait, CANCEL_CHECK_SECONDS)
+        try:
+            return process.communicate(timeout=max(0, wait))
+        except subprocess.TimeoutExpired:
+            cancelled = cancel is not None and cancel.is_set()
+            if cancelled or time.monotonic() >= deadline:
+                process.kill()
+                process.communicate()
+                if cancelled:
+                    return None
+                raise
+
+
+def run_recognition_on_image_local(image_path, task_id, program_script, cancel=None):
     try:
-        logger.info(f"Локальный запуск распознавания для: {os.path.basename(image_path)}")
+        logger.info(f"Локальный запуск распознавания для: {os.path.basename(image_path)}", extra=DETAIL)
         cmd = [sys.executable, program_script, image_path, task_id]
 
-        result = subprocess.run(
+        process = subprocess.Popen(
             cmd,
-            capture_output=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
             text=True,
-            timeout=TIMEOUT,
             encoding='utf-8',
-            errors='ignore'
+            errors='ignore',
+            env=_subprocess_env
         )
+        output = _communicate_local(process, cancel)
+        if output is None:
+            return _cancelled_result()
+        stdout, stderr = output
 
-        if result.returncode != 0:
-            logger.error(f"Ошибка выполнения для {image_path}: {result.stderr}")
-            return create_error_result(result.stderr)
+        if process.returncode != 0:
+            logger.error(f"Ошибка выполнения для {image_path}: {stderr}")
+            return create_error_result(stderr)
 
-        recognition_result = extract_json_from_output(result.stdout)
+        recognition_result = extract_json_from_output(stdout)
 
         if recognition_result is None:
             logger.error(f"Не удалось извлечь JSON из вывода для {image_path}")
             return create_error_result('JSON not found in output')
 
-        if recognition_result.get('status') == 'failed':
-            error_msg = recognition_result.get('error', 'Unknown error')
-            logger.error(f"Распознавание не удалось для {image_path}: {error_msg}")
-            return create_error_result(error_msg)
-        if 'overall_confidence' not in recognition_result:
-            serial_conf = recognition_result.get('serial_number_confidence', 0.0)
-            digit_confs = recognition_result.get('recognition_confidences', [])
-
-            def calculate_overall(serial_conf, digit_confs):
-                if not digit_confs:
-                    return round(serial_conf, 4)
-
-                product = 1.0
-                for conf in digit_confs:
-                    product *= conf
+        recognition_result = finalize_local_result(recognition_result, image_path)
+        if recognition_result['status'] == 'failed':
+            return recognition_result
 
-                return round(serial_conf * product, 4)
-
-            recognition_result['overall_confidence'] = calculate_overall(serial_conf, digit_confs)
-
-        logger.info(f"Успешно обработано локально: {os.path.basename(image_path)}")
+        logger.info(f"Успешно обработано локально: {os.path.basename(image_path)}", extra=DETAIL)
         return recognition_result
 
     except subprocess.TimeoutExpired:
         logger.error(f"Таймаут при обработке {image_path}")
-        return create_error_result('Timeout (120 seconds)')
+        return create_error_result('Timeout (120 seconds)', retryable=True)
     except Exception as e:
         logger.error(f"Неожиданная ошибка при обработке {image_path}: {str(e)}")
         return create_error_result(str(e))
 
 
-def run_recognition_on_image(image_path, task_id, program_script):
+_batch_capabilities = {}
+_batch_capabilities_lock = threading.Lock()
+
+
+def get_local_batch_capabilities(program_script):
+    # Контракт пакетного режима:
+    #   <script> --batch-capabilities  -> {"batch": true, "max_batch": N}
+    #   <script> --batch <manifest>    -> по одной JSON-строке с task_id на каждое изображение в stdout
+    if LOCAL_BATCH_MODE == 'off' or not program_script:
+        return None
+
+    try:
+        cache_key = (os.path.abspath(program_script), os.path.getmtime(program_script))
+    except OSError:
+        return None
+
+    with _batch_capabilities_lock:
+        if cache_key in _batch_capabilities:
+            return _batch_capabilities[cache_key]
+
+        capabilities = None
+        if LOCAL_BATCH_MODE == 'on':
+            capabilities = {'batch': True}
+        else:
+            try:
+                probe = subprocess.run(
+                    [sys.executable, program_script, '--batch-capabilities'],
+                    capture_output=True, text=True, timeout=30, encoding='utf-8', errors='ignore'
+                )
+                reported = extract_json_from_output(probe.stdout) if probe.returncode == 0 else None
+                if reported and reported.get('batch') is True:
+                    capabilities = reported
+            except (subprocess.TimeoutExpired, OSError) as e:
+                logger.warning(f"⚠️ Не удалось проверить пакетный режим {program_script}: {e}")
+
+        if capabilities:
+            logger.info(f"📦 Программа распознавания поддерживает пакетный режим "
+                        f"(max_batch: {capabilities.get('max_batch', 'не задан')})")
+        else:
+            logger.info("📦 Пакетный режим не поддерживается, изображения обрабатываются по одному")
+        _batch_capabilities[cache_key] = capabilities
+        return capabilities
+
+
+def run_recognition_batch_local(items, program_script, on_result):
+    # items: список (image_path, task_id); on_result(image_path, task_id, result) вызывается
+    # по мере появления строк в stdout, а не после завершения всего пакета
+    paths_by_task = {task_id: image_path for image_path, task_id in items}
+    pending = dict(paths_by_task)
+
+    with tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False, encoding='utf-8') as manifest:
+        for image_path, task_id in items:
+            manifest.write(json.dumps({'task_id': task_id, 'image_path': image_path}, ensure_ascii=False) + '\n')
+        manifest_path = manifest.name
+
+    timed_out = threading.Event()
+    process = None
+    try:
+        logger.info(f"📦 Пакетный запуск распознавания: {len(items)} изображений", extra=DETAIL)
+        process = subprocess.Popen(
+            [sys.executable, program_script, '--batch', manifest_path],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            text=True, encoding='utf-8', errors='ignore', env=_subprocess_env
+        )
+
+        def kill_on_timeout():
+            timed_out.set()
+            process.kill()
+
+        watchdog = threading.Timer(TIMEOUT * len(items), kill_on_timeout)
+        watchdog.start()
+        # stderr читаем отдельно, чтобы заполненный буфер не остановил распознаватель
+        stderr_chunks = []
+        stderr_reader = threading.Thread(target=lambda: stderr_chunks.append(process.stderr.read()), daemon=True)
+        stderr_reader.start()
+        try:
+            for line in process.stdout:
+                line = line.strip()
+                if not line.startswith('{'):
+                    continue
+                try:
+                    recognition_result = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+
+                task_id = recognition_result.pop('task_id', None)
+                if task_id not in pending:
+                    logger.warning(f"⚠️ Пакетный результат с неизвестным task_id: {task_id}")
+                    continue
+                image_path = pending.pop(task_id)
+                on_result(image_path, task_id, finalize_local_result(recognition_result, image_path))
+            process.wait()
+        finally:
+            watchdog.cancel()
+            stderr_reader.join(timeout=5)
+
+        if pending:
+            stderr = ''.join(stderr_chunks).strip()
+            reason = 'timeout' if timed_out.is_set() else f"exit code {process.returncode}"
+            logger.error(f"❌ Пакетный запуск прерван ({reason}), без результата: {len(pending)} из {len(items)}"
+                         + (f": {stderr[-500:]}" if stderr else ''))
+        return [(image_path, task_id) for task_id, image_path in pending.items()]
+
+    except Exception as e:
+        logger.error(f"💥 Ошибка пакетного запуска распознавания: {str(e)}")
+        if process is not None and process.poll() is None:
+            process.kill()
+        return [(image_path, task_id) for task_id, image_path in pending.items()]
+    finally:
+        try:
+            os.remove(manifest_path)
+        except OSError:
+            pass
+
+
+def run_recognition_on_server(server_name, image_path, task_id, image_bytes=None, cancel=None, hedge=False):
+    server_url = SERVERS.get(server_name)
+    if not server_url:
+        logger.error(f"Неизвестный сервер: {server_name}")
+        return create_error_result(f"Unknown server: {server_name}")
+
+    breaker = get_circuit_breaker(server_name, CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_SECONDS)
+    if not breaker.allow_request():
+        result = create_error_result(f"Circuit breaker open: {server_name}", retryable=True)
+        result['circuit_open'] = True
+        result['retry_after'] = breaker.retry_after()
+        return result
+
+    bucket = get_rate_limiter(server_name, _rate_limits, RATE_LIMIT_RPS, RATE_LIMIT_BURST)
+    result = run_recognition_on_image_server(image_path, task_id, server_url, image_bytes, bucket, cancel, hedge)
+    if result.get('cancelled'):
+        breaker.release_probe()
+        return result
+    if result.get('retryable'):
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+    return result
+
+
+def run_recognition_on_image(image_path, task_id, program_script, image_bytes=None):
     if SELECTED_SERVER == 'default':
+        if HEDGE_ENABLED:
+            # Локальный повтор - второй процесс распознавателя; проигравший процесс завершается
+            policy = get_hedge_policy(HEDGE_PERCENTILE, HEDGE_MIN_SAMPLES, HEDGE_BUDGET, HEDGE_MIN_DELAY,
+                                      HEDGE_WINDOW)
+            return policy.run(
+                lambda cancel: run_recognition_on_image_local(image_path, task_id, program_script, cancel),
+                lambda cancel: run_recognition_on_image_local(image_path, task_id, program_script, cancel)
+            )
         return run_recognition_on_image_local(image_path, task_id, program_script)
-    else:
-        server_url = SERVERS.get(SELECTED_SERVER)
-        if server_url:
-            return run_recognition_on_image_server(image_path, task_id, server_url)
-        else:
-            logger.error(f"Неизвестный сервер: {SELECTED_SERVER}")
-            return create_error_result(f"Unknown server: {SELECTED_SERVER}")
+    if HEDGE_ENABLED:
+        policy = get_hedge_policy(HEDGE_PERCENTILE, HEDGE_MIN_SAMPLES, HEDGE_BUDGET, HEDGE_MIN_DELAY, HEDGE_WINDOW)
+        hedge_server = HEDGE_SERVER or SELECTED_SERVER
+        return policy.run(
+            lambda cancel: run_recognition_on_server(SELECTED_SERVER, image_path, task_id, image_bytes, cancel),
+            lambda cancel: run_recognition_on_server(hedge_server, image_path, task_id, image_bytes, cancel,
+                                                     hedge=True)
+        )
+    return run_recognition_on_server(SELECTED_SERVER, image_path, task_id, image_bytes)
 
 
-def create_error_result(error_message):
+def create_error_result(error_message, retryable=False):
     return {
         'status': 'failed',
+        'retryable': retryable,
         'error': error_message[:200] + "..." if len(error_message) > 200 else error_message,
         'meter_reading': '',
         'serial_number': '',
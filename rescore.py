@@ -0,0 +1,144 @@
+import argparse
+import logging
+import os
+import shutil
+import time
+from datetime import datetime
+
+from accuracy_calculator import compare_numeric_values, compare_text_values
+from process.image_processor import ImageProcessor
+from utils.file_utils import (load_excel_data, load_results_data, fix_column_data_types,
+                              save_excel_progress, save_results_parquet)
+from utils.raw_archive import raw_archive_path, load_raw_results
+
+logger = logging.getLogger(__name__)
+
+REFERENCE_COLUMNS = ['Inidications (reference)', 'Series number (reference)', 'Model (reference)', 'Rate (reference)']
+MATCH_COLUMNS = ['Indications Match', 'Series Match', 'Model Match', 'Rate Match', 'Overall Match',
+                 'Overall Confidence Match']
+
+
+def load_base_data(results_file, reference_file=None):
+    df = load_results_data(results_file)
+    df['Filename'] = df['Filename'].astype(str).str.strip()
+
+    if reference_file:
+        # Исправленные эталоны заменяют эталонные колонки прогона, набор строк остается прежним
+        reference = load_excel_data(reference_file)
+        reference['Filename'] = reference['Filename'].astype(str).str.strip()
+        reference = reference.drop_duplicates('Filename', keep='last')
+        columns = [col for col in REFERENCE_COLUMNS if col in reference.columns]
+        df = df.drop(columns=[col for col in columns if col in df.columns])
+        df = df.merge(reference[['Filename'] + columns], on='Filename', how='left')
+        logger.info(f"📚 Эталоны обновлены из {reference_file}: колонок {len(columns)}")
+
+    return fix_column_data_types(df)
+
+
+def rescore_dataframe(df, raw_results):
+    processor = ImageProcessor()
+    positions = [i for i, filename in enumerate(df['Filename']) if filename in raw_results]
+    records = [raw_results[df['Filename'].iat[i]] for i in positions]
+    results = [record['result'] for record in records]
+    completed = [result.get('status') == 'completed' for result in results]
+
+    def reference(col):
+        if col not in df.columns:
+            return [''] * len(positions)
+        values = df[col].iloc[positions]
+        return values.where(values.notna(), '').astype(str).tolist()
+
+    ref_indications = reference('Inidications (reference)')
+    ref_series = reference('Series number (reference)')
+    ref_model = reference('Model (reference)')
+    ref_rate = reference('Rate (reference)')
+
+    readings = [processor.process_meter_reading(result.get('meter_reading', '')) for result in results]
+    series = [str(result.get('serial_number', '')) for result in results]
+    models = [str(result.get('model', '')) for result in results]
+    rates = [str(result.get('rate', '')) for result in results]
+    overall_confidence = [result.get('overall_confidence', 0.0) for result in results]
+
+    # Та же логика, что и в ImageProcessor.update_match_columns, но без записи по одной ячейке
+    indications_match = [int(ok and compare_numeric_values(r, ref)) for ok, r, ref
+                         in zip(completed, readings, ref_indications)]
+    series_match = [int(ok and compare_text_values(v, ref)) for ok, v, ref in zip(completed, series, ref_series)]
+    model_match = [int(ok and compare_text_values(v, ref)) for ok, v, ref in zip(completed, models, ref_model)]
+    rate_match = [int(ok and compare_text_values(v, ref)) for ok, v, ref in zip(completed, rates, ref_rate)]
+    overall_match = [int(all(values)) for values in zip(indications_match, series_match, model_match, rate_match)]
+
+    columns = {
+        'Indications': [str(r) if ok else f"ERROR: {result.get('error', 'Unknown error')}"
+                        for ok, r, result in zip(completed, readings, results)],
+        'Series number': [v if ok else '' for ok, v in zip(completed, series)],
+        'Model': [v if ok else '' for ok, v in zip(completed, models)],
+        'Rate': [v if ok else '' for ok, v in zip(completed, rates)],
+        'Overall Confidence': overall_confidence,
+        'Indications Match': indications_match,
+        'Series Match': series_match,
+        'Model Match': model_match,
+        'Rate Match': rate_match,
+        'Overall Match': overall_match,
+        'Overall Confidence Match': [int(ok and (c or 0) > 0) for ok, c in zip(completed, overall_confidence)],
+        'Attempts': [record.get('attempt', 1) for record in records],
+    }
+
+    index = df.index[positions]
+    for col, values in columns.items():
+        if col not in df.columns:
+            df[col] = 0 if col in MATCH_COLUMNS or col == 'Attempts' else ''
+        df.loc[index, col] = values
+
+    processed = sum(completed)
+    errors = len(completed) - processed
+    return df, processed, errors, len(df) - len(positions)
+
+
+def rescore_run(results_file, reference_file=None, output_file=None):
+    start_time = time.time()
+
+    archive_file = raw_archive_path(results_file)
+    if not os.path.exists(archive_file):
+        logger.error(f"❌ Нет архива сырых результатов для {results_file}: {archive_file}")
+        return None
+
+    raw_results = load_raw_results(archive_file)
+    df = load_base_data(results_file, reference_file)
+    df, processed, errors, skipped = rescore_dataframe(df, raw_results)
+    rescore_time = time.time() - start_time
+    logger.info(f"🧮 Пересчет совпадений: {processed + errors} изображений за {rescore_time:.2f} сек")
+
+    if output_file is None:
+        name = os.path.splitext(os.path.basename(results_file))[0]
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        output_file = os.path.join(os.path.dirname(os.path.abspath(results_file)),
+                                   f"{name}_rescored_{timestamp}.xlsx")
+
+    if not save_excel_progress(df, output_file):
+        return None
+    save_results_parquet(df, output_file)
+    # Архив копируется рядом с новым файлом, чтобы его можно было пересчитать еще раз
+    shutil.copy2(archive_file, raw_archive_path(output_file))
+
+    from generators.report_generator import generate_summary_report
+    report = generate_summary_report(processed, errors, skipped, time.time() - start_time, output_file)
+
+    logger.info(f"🏁 Пересчет завершен без запуска распознавания: {output_file}")
+    logger.info(f"⏱️  Время пересчета: {rescore_time:.2f} сек, всего с сохранением: "
+                f"{time.time() - start_time:.2f} сек")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Пересчет совпадений по сохраненным сырым результатам')
+    parser.add_argument('results_file', help='Файл результатов прогона (detail/*.xlsx) с архивом *.raw.jsonl.gz')
+    parser.add_argument('-r', '--reference', help='Excel с исправленными эталонами (лист Image Data)')
+    parser.add_argument('-o', '--output', help='Путь к новому файлу результатов')
+    args = parser.parse_args()
+
+    if rescore_run(args.results_file, args.reference, args.output) is None:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+import argparse
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+
+from config import *
+from recognition_runner import (run_recognition_on_server, run_recognition_on_image_local,
+                                configure_local_threads)
+from rescore import rescore_dataframe
+from utils.file_utils import get_image_files
+from utils.log_utils import SUMMARY, image_context
+from utils.reference_cache import load_reference_data
+
+logger = logging.getLogger(__name__)
+
+MATCH_FIELDS = {
+    'indications': 'Indications Match',
+    'series': 'Series Match',
+    'model': 'Model Match',
+    'rate': 'Rate Match',
+    'overall': 'Overall Match',
+}
+SIDE_BY_SIDE_COLUMNS = ['Indications', 'Series number', 'Model', 'Rate', 'Overall Match', 'Overall Confidence']
+REFERENCE_COLUMNS = ['Inidications (reference)', 'Series number (reference)', 'Model (reference)',
+                     'Rate (reference)']
+SHEET_ROWS_LIMIT = 500
+
+
+def parse_target(spec):
+    # Цель - имя сервера из SERVERS или путь к скрипту распознавания ('default' = PROGRAM_SCRIPT)
+    if spec in SERVERS and spec != 'default':
+        return {'name': spec, 'kind': 'server', 'spec': spec}
+    path = PROGRAM_SCRIPT if spec == 'default' else spec
+    if path and os.path.exists(path):
+        return {'name': os.path.basename(path), 'kind': 'local', 'spec': os.path.abspath(path)}
+    raise ValueError(f"Неизвестная цель '{spec}': ожидается сервер из SERVERS ({', '.join(SERVERS)}) "
+                     f"или путь к скрипту распознавания")
+
+
+def recognize_on_target(target, image_path, task_id, image_bytes=None):
+    start = time.time()
+    if target['kind'] == 'server':
+        result = run_recognition_on_server(target['spec'], image_path, task_id, image_bytes)
+    else:
+        result = run_recognition_on_image_local(image_path, task_id, target['spec'])
+    return result, time.time() - start
+
+
+def _latency_stats(latencies):
+    values = np.array(latencies, dtype=float)
+    if not len(values):
+        return {'mean': 0.0, 'median': 0.0, 'p90': 0.0, 'total': 0.0}
+    return {
+        'mean': float(values.mean()),
+        'median': float(np.median(values)),
+        'p90': float(np.percentile(values, 90)),
+        'total': float(values.sum()),
+    }
+
+
+def compare_targets(scored, latencies, errors, image_files):
+    processed = scored[0]['Filename'].isin(set(image_files))
+    a, b = scored[0][processed], scored[1][processed]
+
+    fields = {}
+    for field, col in MATCH_FIELDS.items():
+        a_match = pd.to_numeric(a[col], errors='coerce').fillna(0).to_numpy() == 1
+        b_match = pd.to_numeric(b[col], errors='coerce').fillna(0).to_numpy() == 1
+        fields[field] = {
+            'a_correct': int(a_match.sum()),
+            'b_correct': int(b_match.sum()),
+            'a_wins': int((a_match & ~b_match).sum()),
+            'b_wins': int((~a_match & b_match).sum()),
+            'both_correct': int((a_match & b_match).sum()),
+            'both_wrong': int((~a_match & ~b_match).sum()),
+        }
+
+    return {
+        'images': int(processed.sum()),
+        'fields': fields,
+        'latency': [_latency_stats(list(side.values())) for side in latencies],
+        'errors': list(errors),
+    }
+
+
+def side_by_side(scored, latencies, image_files):
+    processed = scored[0]['Filename'].isin(set(image_files))
+    a, b = scored[0][processed], scored[1][processed]
+    table = a[['Filename'] + [col for col in REFERENCE_COLUMNS if col in a.columns]].copy()
+    for label, df, side_latency in (('A', a, latencies[0]), ('B', b, latencies[1])):
+        for col in SIDE_BY_SIDE_COLUMNS:
+            table[f"{col} ({label})"] = df[col].to_numpy() if col in df.columns else None
+        table[f"Latency ({label})"] = df['Filename'].map(side_latency).to_numpy()
+    overall_a = pd.to_numeric(table['Overall Match (A)'], errors='coerce').fillna(0)
+    overall_b = pd.to_numeric(table['Overall Match (B)'], errors='coerce').fillna(0)
+    table['Winner'] = np.select([overall_a > overall_b, overall_b > overall_a], ['A', 'B'], '')
+    return table.reset_index(drop=True)
+
+
+def write_ab_sheet(summary, table, targets, excel_path, wall_time, workers):
+    wb = Workbook()
+    ws = wb.active
+    ws.title = 'A-B сравнение'
+
+    def header(sheet, row_values):
+        sheet.append(row_values)
+        for cell in sheet[sheet.max_row]:
+            cell.fill = HEADER_FILL
+            cell.font = BOLD_FONT
+
+    header(ws, ['A/B сравнение', 'A', 'B'])
+    ws.append(['Цель', targets[0]['name'], targets[1]['name']])
+    ws.append(['Тип', targets[0]['kind'], targets[1]['kind']])
+    ws.append(['Изображений', summary['images'], summary['images']])
+    ws.append(['Ошибок распознавания', summary['errors'][0], summary['errors'][1]])
+    for key, label in (('mean', 'Задержка, среднее (сек)'), ('median', 'Задержка, медиана (сек)'),
+                       ('p90', 'Задержка, p90 (сек)'), ('total', 'Суммарное время распознавания (сек)')):
+        ws.append([label, round(summary['latency'][0][key], 3), round(summary['latency'][1][key], 3)])
+    ws.append(['Общее время прогона (сек)', round(wall_time, 1), f"потоков: {workers}"])
+    ws.append([])
+
+    header(ws, ['Поле', 'A верно', 'B верно', 'Победы A', 'Победы B', 'Оба верно', 'Оба неверно'])
+    for field, stats in summary['fields'].items():
+        ws.append([field, stats['a_correct'], stats['b_correct'], stats['a_wins'], stats['b_wins'],
+                   stats['both_correct'], stats['both_wrong']])
+        if stats['a_wins'] != stats['b_wins']:
+            better = 4 if stats['a_wins'] > stats['b_wins'] else 5
+            ws.cell(row=ws.max_row, column=better).fill = GREEN_FILL
+            ws.cell(row=ws.max_row, column=9 - better).fill = RED_FILL
+    ws.append([])
+
+    disagreements = table[table['Winner'] != '']
+    shown = min(len(disagreements), SHEET_ROWS_LIMIT)
+    header(ws, [f"Расхождения по Overall Match ({shown} из {len(disagreements)})"])
+    if shown:
+        header(ws, list(disagreements.columns))
+        for values in disagreements.head(SHEET_ROWS_LIMIT).itertuples(index=False):
+            ws.append([None if pd.isna(v) else v for v in values])
+
+    ws.column_dimensions['A'].width = 40
+    for col in 'BCDEFG':
+        ws.column_dimensions[col].width = 18
+
+    details = wb.create_sheet('Изображения')
+    header(details, list(table.columns))
+    for values in table.itertuples(index=False):
+        details.append([None if pd.isna(v) else v for v in values])
+    details.column_dimensions['A'].width = 40
+
+    wb.save(excel_path)
+    logger.info(f"💾 Отчет A/B: {excel_path}")
+
+
+def run_ab(target_a, target_b, images_folder, excel_file, workers, output_file=None):
+    targets = [parse_target(target_a), parse_target(target_b)]
+    df, filename_to_index = load_reference_data(excel_file, REFERENCE_CACHE_DIR if REFERENCE_CACHE_ENABLED else None)
+
+    all_files = get_image_files(images_folder)
+    image_files = [f for f in all_files if f in filename_to_index]
+    skipped = len(all_files) - len(image_files)
+    if skipped:
+        logger.warning(f"⚠️ Нет в Excel и пропущено изображений: {skipped}")
+    if not image_files:
+        logger.error("❌ Нет изображений для сравнения")
+        return None
+
+    if any(target['kind'] == 'local' for target in targets):
+        configure_local_threads(2 * workers, RECOGNIZER_THREADS)
+    needs_bytes = any(target['kind'] == 'server' for target in targets)
+
+    raw_results = ({}, {})
+    latencies = ({}, {})
+    errors = [0, 0]
+    lock = threading.Lock()
+
+    def process(image_file, side_executor):
+        image_path = os.path.join(images_folder, image_file)
+        with image_context(image_file):
+            # Изображение читается один раз и уходит на обе цели одновременно
+            image_bytes = None
+            if needs_bytes:
+                with open(image_path, 'rb') as f:
+                    image_bytes = f.read()
+            task_id = f"ab_{int(time.time())}_{image_file.replace('.', '_')}"
+            future_b = side_executor.submit(recognize_on_target, targets[1], image_path, f"{task_id}_b", image_bytes)
+            outcomes = [recognize_on_target(targets[0], image_path, f"{task_id}_a", image_bytes),
+                        future_b.result()]
+
+        with lock:
+            for side, (result, latency) in enumerate(outcomes):
+                raw_results[side][image_file] = {'attempt': 1, 'result': result}
+                latencies[side][image_file] = latency
+                if result.get('status') != 'completed':
+                    errors[side] += 1
+
+    logger.info("=" * 60, extra=SUMMARY)
+    logger.info(f"🆚 A/B: {targets[0]['name']} ({targets[0]['kind']}) против {targets[1]['name']} "
+                f"({targets[1]['kind']}), изображений: {len(image_files)}, потоков: {workers}", extra=SUMMARY)
+    logger.info("=" * 60, extra=SUMMARY)
+
+    start_time = time.time()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ab') as executor, \
+            ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ab-b') as side_executor:
+        futures = [executor.submit(process, image_file, side_executor) for image_file in image_files]
+        for i, future in enumerate(as_completed(futures), 1):
+            future.result()
+            if i % 10 == 0 or i == len(futures):
+                logger.info(f"📊 Прогресс: {i}/{len(futures)} обработано", extra=SUMMARY)
+    wall_time = time.time() - start_time
+
+    # Обе цели оцениваются одной и той же функцией по одним и тем же эталонам
+    scored = [rescore_dataframe(df.copy(), raw_results[side])[0] for side in (0, 1)]
+    summary = compare_targets(scored, latencies, errors, image_files)
+    table = side_by_side(scored, latencies, image_files)
+
+    if output_file is None:
+        target_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'detail')
+        os.makedirs(target_dir, exist_ok=True)
+        names = '_vs_'.join(re.sub(r'[^\w.-]+', '_', target['name']) for target in targets)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        output_file = os.path.join(target_dir, f"ab_{names}_{timestamp}.xlsx")
+    write_ab_sheet(summary, table, targets, output_file, wall_time, workers)
+
+    logger.info("=" * 60, extra=SUMMARY)
+    logger.info(f"🆚 ИТОГ A/B за {wall_time:.1f} сек (A: {summary['latency'][0]['total']:.1f} сек "
+                f"распознавания, B: {summary['latency'][1]['total']:.1f} сек)", extra=SUMMARY)
+    for field, stats in summary['fields'].items():
+        logger.info(f"   {field}: A {stats['a_correct']} / B {stats['b_correct']}, "
+                    f"победы A: {stats['a_wins']}, победы B: {stats['b_wins']}", extra=SUMMARY)
+    logger.info("=" * 60, extra=SUMMARY)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='A/B сравнение двух распознавателей на одном потоке изображений')
+    parser.add_argument('target_a', help='Цель A: имя сервера из SERVERS или путь к скрипту распознавания')
+    parser.add_argument('target_b', help='Цель B: имя сервера из SERVERS или путь к скрипту распознавания')
+    parser.add_argument('--folder', default=FOLDER_TEST, help='Папка с изображениями (по умолчанию FOLDER_TEST)')
+    parser.add_argument('--excel', default=EXCEL_DATA, help='Excel с эталонами (по умолчанию EXCEL_DATA)')
+    parser.add_argument('--workers', type=int, default=MAX_WORKERS, help='Одновременных изображений')
+    parser.add_argument('-o', '--output', help='Путь к отчету A/B (.xlsx)')
+    args = parser.parse_args()
+
+    if run_ab(args.target_a, args.target_b, args.folder, args.excel, max(1, args.workers), args.output) is None:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+import argparse
+import json
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+
+from config import HEADER_FILL, BOLD_FONT, GREEN_FILL, RED_FILL
+from accuracy_calculator import normalize_reading_series
+from utils.file_utils import load_results_data
+
+logger = logging.getLogger(__name__)
+
+DIFF_COLUMNS = ['Filename', 'Indications', 'Indications Match', 'Series Match', 'Model Match',
+                'Rate Match', 'Overall Match', 'Overall Confidence']
+MATCH_FIELDS = {
+    'indications': 'Indications Match',
+    'series': 'Series Match',
+    'model': 'Model Match',
+    'rate': 'Rate Match',
+    'overall': 'Overall Match',
+}
+CATEGORIES = ('newly_broken', 'newly_fixed', 'changed_reading', 'confidence_delta')
+CATEGORY_TITLES = {
+    'newly_broken': '❌ Сломалось',
+    'newly_fixed': '✅ Исправилось',
+    'changed_reading': '🔢 Изменились показания',
+    'confidence_delta': '📈 Изменилась уверенность',
+}
+SHEET_ROWS_LIMIT = 500
+
+
+def load_run(results_file):
+    df = load_results_data(results_file, DIFF_COLUMNS)
+    for col in DIFF_COLUMNS:
+        if col not in df.columns:
+            df[col] = np.nan
+
+    df = df[DIFF_COLUMNS]
+    df['Filename'] = df['Filename'].astype(str).str.strip()
+    df = df[(df['Filename'] != '') & (df['Filename'] != 'nan')]
+    df = df.drop_duplicates('Filename', keep='last')
+
+    for col in MATCH_FIELDS.values():
+        df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0).astype(np.int8)
+    df['Overall Confidence'] = pd.to_numeric(df['Overall Confidence'], errors='coerce').astype(np.float32)
+    df['Indications'] = normalize_reading_series(df['Indications'].astype(str).str.strip().replace('nan', ''))
+    return df
+
+
+def diff_runs(old_df, new_df, confidence_threshold=0.1):
+    # pandas merge по одному ключу - хеш-джойн по Filename
+    merged = old_df.merge(new_df, on='Filename', how='outer', suffixes=(' (old)', ' (new)'), indicator=True)
+    both = merged['_merge'] == 'both'
+    common = merged[both]
+
+    old_overall = common['Overall Match (old)'].to_numpy()
+    new_overall = common['Overall Match (new)'].to_numpy()
+    old_conf = common['Overall Confidence (old)'].to_numpy()
+    new_conf = common['Overall Confidence (new)'].to_numpy()
+    confidence_delta = new_conf - old_conf
+    finite_delta = confidence_delta[np.isfinite(confidence_delta)]
+
+    masks = {
+        'newly_broken': (old_overall == 1) & (new_overall == 0),
+        'newly_fixed': (old_overall == 0) & (new_overall == 1),
+        'changed_reading': (common['Indications (old)'] != common['Indications (new)']).to_numpy(),
+        'confidence_delta': np.nan_to_num(np.abs(confidence_delta)) >= confidence_threshold,
+    }
+
+    per_field = {}
+    for field, col in MATCH_FIELDS.items():
+        old_match = common[f'{col} (old)'].to_numpy()
+        new_match = common[f'{col} (new)'].to_numpy()
+        per_field[field] = {
+            'broken': int(((old_match == 1) & (new_match == 0)).sum()),
+            'fixed': int(((old_match == 0) & (new_match == 1)).sum()),
+            'old_correct': int(old_match.sum()),
+            'new_correct': int(new_match.sum()),
+        }
+
+    summary = {
+        'old_rows': int(len(old_df)),
+        'new_rows': int(len(new_df)),
+        'common_rows': int(both.sum()),
+        'only_in_old': int((merged['_merge'] == 'left_only').sum()),
+        'only_in_new': int((merged['_merge'] == 'right_only').sum()),
+        'mean_confidence_delta': float(finite_delta.mean()) if len(finite_delta) else 0.0,
+        'counts': {category: int(mask.sum()) for category, mask in masks.items()},
+        'fields': per_field,
+    }
+
+    details = {}
+    for category, mask in masks.items():
+        rows = pd.DataFrame({
+            'Filename': common['Filename'].to_numpy()[mask],
+            'Indications (old)': common['Indications (old)'].to_numpy()[mask],
+            'Indications (new)': common['Indications (new)'].to_numpy()[mask],
+            'Overall Match (old)': old_overall[mask],
+            'Overall Match (new)': new_overall[mask],
+            'Confidence (old)': old_conf[mask],
+            'Confidence (new)': new_conf[mask],
+            'Confidence delta': confidence_delta[mask],
+        })
+        if category == 'confidence_delta':
+            rows = rows.reindex(rows['Confidence delta'].abs().sort_values(ascending=False).index)
+        details[category] = rows.reset_index(drop=True)
+
+    return summary, details
+
+
+def write_diff_json(summary, details, json_path, old_file, new_file):
+    payload = {
+        'old_run': os.path.basename(old_file),
+        'new_run': os.path.basename(new_file),
+        'summary': summary,
+        'details': {
+            category: json.loads(rows.to_json(orient='records', force_ascii=False))
+            for category, rows in details.items()
+        }
+    }
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump(payload, f, ensure_ascii=False, indent=1)
+    logger.info(f"💾 Машиночитаемый результат сравнения: {json_path}")
+
+
+def write_diff_sheet(summary, details, excel_path, old_file, new_file):
+    wb = Workbook()
+    ws = wb.active
+    ws.title = 'Сравнение запусков'
+
+    def header(row_values):
+        ws.append(row_values)
+        for cell in ws[ws.max_row]:
+            cell.fill = HEADER_FILL
+            cell.font = BOLD_FONT
+
+    header(['Сравнение запусков', ''])
+    ws.append(['Старый запуск', os.path.basename(old_file)])
+    ws.append(['Новый запуск', os.path.basename(new_file)])
+    ws.append(['Общих изображений', summary['common_rows']])
+    ws.append(['Только в старом', summary['only_in_old']])
+    ws.append(['Только в новом', summary['only_in_new']])
+    ws.append(['Среднее изменение уверенности', round(summary['mean_confidence_delta'], 4)])
+    for category in CATEGORIES:
+        ws.append([CATEGORY_TITLES[category], summary['counts'][category]])
+    ws.append([])
+
+    header(['Поле', 'Было верно', 'Стало верно', 'Сломалось', 'Исправилось'])
+    for field, stats in summary['fields'].items():
+        ws.append([field, stats['old_correct'], stats['new_correct'], stats['broken'], stats['fixed']])
+        ws.cell(row=ws.max_row, column=4).fill = RED_FILL if stats['broken'] else GREEN_FILL
+    ws.append([])
+
+    for category in CATEGORIES:
+        rows = details[category]
+        shown = min(len(rows), SHEET_ROWS_LIMIT)
+        header([f"{CATEGORY_TITLES[category]} ({shown} из {len(rows)})"])
+        if not shown:
+            ws.append([])
+            continue
+        header(list(rows.columns))
+        for values in rows.head(SHEET_ROWS_LIMIT).itertuples(index=False):
+            ws.append([None if pd.isna(v) else v for v in values])
+        ws.append([])
+
+    ws.column_dimensions['A'].width = 40
+    for col in 'BCDEFGH':
+        ws.column_dimensions[col].width = 18
+
+    wb.save(excel_path)
+    logger.info(f"💾 Отчет сравнения: {excel_path}")
+
+
+def compare_runs(old_file, new_file, output_prefix=None, confidence_threshold=0.1):
+    old_df = load_run(old_file)
+    new_df = load_run(new_file)
+    summary, details = diff_runs(old_df, new_df, confidence_threshold)
+
+    if output_prefix is None:
+        new_name = os.path.splitext(os.path.basename(new_file))[0]
+        output_prefix = os.path.join(os.path.dirname(os.path.abspath(new_file)), f"{new_name}_diff")
+
+    write_diff_sheet(summary, details, f"{output_prefix}.xlsx", old_file, new_file)
+    write_diff_json(summary, details, f"{output_prefix}.json", old_file, new_file)
+
+    logger.info("=" * 60)
+    logger.info(f"🔍 СРАВНЕНИЕ: {os.path.basename(old_file)} → {os.path.basename(new_file)}")
+    for category in CATEGORIES:
+        logger.info(f"   {CATEGORY_TITLES[category]}: {summary['counts'][category]}")
+    logger.info("=" * 60)
+    return summary, details
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Сравнение результатов двух прогонов')
+    parser.add_argument('old_run', help='Файл результатов базового прогона (detail/*.xlsx)')
+    parser.add_argument('new_run', help='Файл результатов нового прогона (detail/*.xlsx)')
+    parser.add_argument('-o', '--output', help='Префикс выходных файлов (.xlsx и .json)')
+    parser.add_argument('--confidence-threshold', type=float, default=0.1,
+                        help='Минимальное изменение Overall Confidence для попадания в отчет')
+    args = parser.parse_args()
+
+    compare_runs(args.old_run, args.new_run, args.output, args.confidence_threshold)
+
+
+if __name__ == "__main__":
+    main()
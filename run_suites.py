@@ -0,0 +1,221 @@
+import argparse
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from openpyxl import Workbook
+
+from config import *
+from process.concurrency import AdaptiveLimiter, FixedLimiter
+from process.image_processor import ImageProcessor
+from utils.log_utils import SUMMARY
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+logger = logging.getLogger(__name__)
+
+ACCURACY_FIELDS = {
+    'indications': 'Показания',
+    'series': 'Серийные номера',
+    'model': 'Модели',
+    'rate': 'Тарифы',
+    'overall': 'Общая точность',
+}
+
+
+def load_manifest(manifest_file):
+    with open(manifest_file, 'r', encoding='utf-8') as f:
+        if manifest_file.lower().endswith(('.yaml', '.yml')):
+            if yaml is None:
+                raise RuntimeError("Для манифеста в YAML нужен PyYAML (pip install pyyaml)")
+            manifest = yaml.safe_load(f)
+        else:
+            manifest = json.load(f)
+
+    if isinstance(manifest, list):
+        manifest = {'suites': manifest}
+
+    # Относительные пути в манифесте считаются от папки самого манифеста
+    base_dir = os.path.dirname(os.path.abspath(manifest_file))
+    suites = []
+    for i, suite in enumerate(manifest.get('suites') or [], 1):
+        folder = os.path.join(base_dir, os.path.expanduser(suite['folder']))
+        excel = os.path.join(base_dir, os.path.expanduser(suite['excel']))
+        program_script = PROGRAM_SCRIPT
+        if suite.get('program_script'):
+            program_script = os.path.join(base_dir, os.path.expanduser(suite['program_script']))
+        suites.append({
+            'name': str(suite.get('name') or os.path.splitext(os.path.basename(excel))[0] or f"suite_{i}"),
+            'folder': folder,
+            'excel': excel,
+            'program_script': program_script,
+        })
+    if not suites:
+        raise ValueError(f"В манифесте {manifest_file} нет наборов (suites)")
+
+    return {
+        'suites': suites,
+        'workers': max(1, int(manifest.get('workers') or MAX_WORKERS)),
+        'parallel_suites': max(1, int(manifest.get('parallel_suites') or SUITE_PARALLELISM)),
+    }
+
+
+def run_suite(suite, workers, limiter):
+    result = dict(suite, success=False, processed=0, errors=0, skipped=0, total_time=0.0,
+                  results_file=None, report=None, error=None)
+
+    problems = []
+    if not os.path.exists(suite['excel']):
+        problems.append(f"нет файла {suite['excel']}")
+    if not os.path.isdir(suite['folder']):
+        problems.append(f"нет папки {suite['folder']}")
+    if problems:
+        result['error'] = ', '.join(problems)
+        logger.error(f"❌ Набор {suite['name']} пропущен: {result['error']}")
+        return result
+
+    logger.info(f"▶️  Набор {suite['name']}: {suite['folder']}", extra=SUMMARY)
+    start_time = time.time()
+    processor = ImageProcessor()
+    try:
+        success, processed, errors, skipped = processor.process_images_folder(
+            suite['folder'], suite['excel'], suite['program_script'], workers, limiter=limiter
+        )
+        result.update(success=success, processed=processed, errors=errors, skipped=skipped)
+    except Exception as e:
+        result['error'] = str(e)
+        logger.error(f"💥 Набор {suite['name']} завершился с ошибкой: {e}")
+
+    result['total_time'] = time.time() - start_time
+    result['results_file'] = processor.results_file
+    result['report'] = processor.last_report
+    logger.info(f"⏹️  Набор {suite['name']}: {result['processed']} обработано, {result['errors']} ошибок "
+                f"за {result['total_time']:.1f} сек", extra=SUMMARY)
+    return result
+
+
+def combine_results(results):
+    # Сводная точность - по всем изображениям всех наборов, а не среднее процентов
+    totals = {'suites': len(results), 'failed': 0, 'processed': 0, 'errors': 0, 'skipped': 0,
+              'tests': 0, 'correct': {field: 0 for field in ACCURACY_FIELDS}}
+    for result in results:
+        if not result['success']:
+            totals['failed'] += 1
+        totals['processed'] += result['processed']
+        totals['errors'] += result['errors']
+        totals['skipped'] += result['skipped']
+        accuracy = (result['report'] or {}).get('accuracy')
+        if accuracy:
+            totals['tests'] += accuracy['total_tests']
+            for field in ACCURACY_FIELDS:
+                totals['correct'][field] += accuracy[field]['correct']
+
+    totals['accuracy'] = {field: (correct / totals['tests'] * 100 if totals['tests'] else 0.0)
+                          for field, correct in totals['correct'].items()}
+    return totals
+
+
+def write_suites_sheet(results, totals, excel_path, wall_time):
+    wb = Workbook()
+    ws = wb.active
+    ws.title = 'Наборы'
+
+    def header(row_values):
+        ws.append(row_values)
+        for cell in ws[ws.max_row]:
+            cell.fill = HEADER_FILL
+            cell.font = BOLD_FONT
+
+    header(['Сводка по наборам', ''])
+    ws.append(['Версия', get_git_version()])
+    ws.append(['Сервер', SELECTED_SERVER])
+    ws.append(['Наборов', totals['suites']])
+    ws.append(['С ошибкой', totals['failed']])
+    ws.append(['Изображений с результатом', totals['tests']])
+    ws.append(['Общее время', f"{wall_time:.1f} сек"])
+    for field, label in ACCURACY_FIELDS.items():
+        ws.append([label, f"{totals['accuracy'][field]:.2f}%"])
+    ws.append([])
+
+    header(['Набор', 'Успех', 'Обработано', 'Ошибок', 'Пропущено', 'Время, сек']
+           + list(ACCURACY_FIELDS.values()) + ['Файл результатов', 'Ошибка'])
+    for result in results:
+        accuracy = (result['report'] or {}).get('accuracy')
+        ws.append([result['name'], 'да' if result['success'] else 'нет', result['processed'], result['errors'],
+                   result['skipped'], round(result['total_time'], 1)]
+                  + [round(accuracy[field]['accuracy'], 2) if accuracy else None for field in ACCURACY_FIELDS]
+                  + [os.path.basename(result['results_file']) if result['results_file'] else '',
+                     result['error'] or ''])
+        ws.cell(row=ws.max_row, column=2).fill = GREEN_FILL if result['success'] else RED_FILL
+
+    ws.column_dimensions['A'].width = 32
+    for col in 'BCDEFGHIJK':
+        ws.column_dimensions[col].width = 16
+    ws.column_dimensions['L'].width = 48
+    ws.column_dimensions['M'].width = 40
+
+    wb.save(excel_path)
+    logger.info(f"💾 Сводка по наборам: {excel_path}")
+
+
+def run_suites(manifest_file, output_file=None):
+    manifest = load_manifest(manifest_file)
+    suites, workers = manifest['suites'], manifest['workers']
+    parallel_suites = min(manifest['parallel_suites'], len(suites))
+
+    # Один limiter на все наборы: потоки разных наборов делят общие слоты распознавания,
+    # поэтому хвост одного набора заполняется изображениями следующего
+    limiter_name = 'local' if SELECTED_SERVER == 'default' else SELECTED_SERVER
+    if ADAPTIVE_CONCURRENCY:
+        limiter = AdaptiveLimiter(limiter_name, workers, ADAPTIVE_MIN_CONCURRENCY,
+                                  ADAPTIVE_MAX_CONCURRENCY, ADAPTIVE_LATENCY_TOLERANCE)
+    else:
+        limiter = FixedLimiter(limiter_name, workers)
+
+    logger.info("=" * 60, extra=SUMMARY)
+    logger.info(f"🧺 НАБОРОВ: {len(suites)}, потоков распознавания: {limiter.max_limit}, "
+                f"одновременно наборов: {parallel_suites}", extra=SUMMARY)
+    logger.info("=" * 60, extra=SUMMARY)
+
+    start_time = time.time()
+    with ThreadPoolExecutor(max_workers=parallel_suites, thread_name_prefix='suite') as executor:
+        futures = [executor.submit(run_suite, suite, workers, limiter) for suite in suites]
+        results = [future.result() for future in futures]
+    wall_time = time.time() - start_time
+
+    totals = combine_results(results)
+    if output_file is None:
+        target_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'detail')
+        os.makedirs(target_dir, exist_ok=True)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        output_file = os.path.join(target_dir, f"suites_v{get_git_version()}_{timestamp}.xlsx")
+    write_suites_sheet(results, totals, output_file, wall_time)
+
+    logger.info("=" * 60, extra=SUMMARY)
+    logger.info(f"🧺 ИТОГ ПО НАБОРАМ: {totals['suites']} наборов, с ошибкой: {totals['failed']}, "
+                f"изображений: {totals['tests']}, время: {wall_time:.1f} сек", extra=SUMMARY)
+    for field, label in ACCURACY_FIELDS.items():
+        logger.info(f"   {label}: {totals['accuracy'][field]:.2f}%", extra=SUMMARY)
+    logger.info("=" * 60, extra=SUMMARY)
+    return results, totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Прогон нескольких наборов (папка + Excel) в одном процессе')
+    parser.add_argument('manifest', help='Манифест наборов (.json или .yaml)')
+    parser.add_argument('-o', '--output', help='Путь к сводному Excel по наборам')
+    args = parser.parse_args()
+
+    results, totals = run_suites(args.manifest, args.output)
+    if totals['failed']:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,18 @@
 import pandas as pd
 import logging
-from openpyxl import load_workbook
+from openpyxl import Workbook, load_workbook
 import os
+import shutil
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
 
 from config import *
+from utils.log_utils import DETAIL, detail_enabled
 from generators.report_generator import apply_excel_styles
 
 logger = logging.getLogger(__name__)
@@ -53,18 +62,70 @@ def load_excel_data(excel_file):
 
         df = pd.read_excel(excel_file, sheet_name='Image Data', dtype=dtype_spec)
         logger.info(f"Загружен Excel файл: {excel_file}, строк: {len(df)}")
-
-        expected_columns = ['Indications Match', 'Series Match', 'Model Match', 'Rate Match', 'Overall Match']
-        for col in expected_columns:
-            if col not in df.columns:
-                df[col] = ''
-
-        return fix_column_data_types(df)
+        return prepare_reference_frame(df)
     except Exception as e:
         logger.error(f"Ошибка загрузки Excel файла: {str(e)}")
         raise
 
 
+def prepare_reference_frame(df):
+    expected_columns = ['Indications Match', 'Series Match', 'Model Match', 'Rate Match', 'Overall Match']
+    for col in expected_columns:
+        if col not in df.columns:
+            df[col] = ''
+
+    return fix_column_data_types(df)
+
+
+def iter_reference_chunks(reference_file, chunk_size):
+    # Эталоны по chunk_size строк, не загружая лист целиком. Индекс у частей сквозной, как у load_excel_data.
+    # У xlsx в памяти остается только таблица общих строк книги; Parquet читается группами строк
+    start = 0
+    if reference_file.lower().endswith('.parquet'):
+        if pq is None:
+            raise RuntimeError("Для чтения эталонов из Parquet нужен pyarrow")
+        for batch in pq.ParquetFile(reference_file).iter_batches(batch_size=chunk_size):
+            df = batch.to_pandas()
+            df.index = pd.RangeIndex(start, start + len(df))
+            start += len(df)
+            yield prepare_reference_frame(df)
+        return
+
+    wb = load_workbook(reference_file, read_only=True, data_only=True)
+    try:
+        rows = wb['Image Data'].iter_rows(values_only=True)
+        header = None
+        for _ in range(10):
+            values = next(rows, None)
+            if values is None:
+                break
+            if 'Filename' in [str(x) for x in values if x is not None]:
+                header = values
+                break
+        if header is None:
+            raise ValueError(f"Не найдена строка с заголовками в {reference_file}")
+
+        positions = [i for i, name in enumerate(header) if name is not None]
+        columns = [str(header[i]) for i in positions]
+        buffer = []
+        for values in rows:
+            if all(x is None for x in values):
+                continue
+            # Пустые ячейки - NaN, как у read_excel: иначе None превратился бы в строку 'None'
+            buffer.append([values[i] if i < len(values) and values[i] is not None else float('nan')
+                           for i in positions])
+            if len(buffer) >= chunk_size:
+                yield prepare_reference_frame(pd.DataFrame(buffer, columns=columns,
+                                                           index=pd.RangeIndex(start, start + len(buffer))))
+                start += len(buffer)
+                buffer = []
+        if buffer:
+            yield prepare_reference_frame(pd.DataFrame(buffer, columns=columns,
+                                                       index=pd.RangeIndex(start, start + len(buffer))))
+    finally:
+        wb.close()
+
+
 def fix_column_data_types(df):
     if 'Filename' not in df.columns:
         df.insert(0, 'Filename', '')
@@ -89,8 +150,8 @@ def fix_column_data_types(df):
         if col in df.columns:
             try:
                 if dtype == 'string':
-                    df[col] = df[col].astype(str).apply(
-                        lambda x: x if pd.isna(x) else str(x).strip() if x != 'nan' else '')
+                    values = df[col].astype(str)
+                    df[col] = values.where(values != 'nan', '').str.strip()
                 # ПРАВИЛЬНО:
                 if dtype == 'int64':
                     df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0).astype('int64')
@@ -103,49 +164,192 @@ def fix_column_data_types(df):
     return df
 
 
+def find_header_row(excel_file, sheet_name='Image Data', max_rows=10):
+    preview = pd.read_excel(excel_file, sheet_name=sheet_name, header=None, nrows=max_rows)
+    for i in range(len(preview)):
+        if 'Filename' in [str(x) for x in preview.iloc[i].values if pd.notna(x)]:
+            return i
+    return None
+
+
+def load_results_data(results_file, columns=None):
+    parquet_file = results_parquet_path(results_file)
+    if pq is not None and os.path.exists(parquet_file):
+        return load_results_parquet(parquet_file, columns)
+
+    # Результаты прогона: копия Excel из detail/ (с 3 строками версии над заголовком)
+    header_row = find_header_row(results_file)
+    if header_row is None:
+        raise ValueError(f"Не найдена строка с заголовками в {results_file}")
+
+    wanted = set(columns) if columns else None
+    df = pd.read_excel(results_file, sheet_name='Image Data', header=header_row,
+                       usecols=(lambda col: col in wanted) if wanted else None)
+    logger.info(f"Загружены результаты: {results_file}, строк: {len(df)}, колонок: {len(df.columns)}")
+    return df
+
+
+# Колонки вне этих списков (кроме Timing *) пишутся в Parquet строками
+RESULTS_INT_COLUMNS = [
+    'Width (px)', 'Height (px)', 'Total Pixels',
+    'Indications Match', 'Series Match', 'Model Match', 'Rate Match', 'Overall Match',
+    'Overall Confidence Match', 'Attempts'
+]
+RESULTS_FLOAT_COLUMNS = ['Serial Confidence', 'Overall Confidence']
+
+
+def results_parquet_path(excel_file):
+    return f"{os.path.splitext(excel_file)[0]}.parquet"
+
+
+def _results_column_type(col):
+    if col in RESULTS_INT_COLUMNS:
+        return pa.int64()
+    if col in RESULTS_FLOAT_COLUMNS or str(col).startswith('Timing '):
+        return pa.float64()
+    return pa.string()
+
+
+def _results_column_array(values, arrow_type):
+    if pa.types.is_integer(arrow_type):
+        values = pd.to_numeric(values, errors='coerce').fillna(0).astype('int64')
+    elif pa.types.is_floating(arrow_type):
+        values = pd.to_numeric(values, errors='coerce').astype('float64')
+    else:
+        values = values.astype(object).where(values.notna(), None)
+        values = values.map(lambda x: x if x is None or isinstance(x, str) else str(x))
+    return pa.array(values, type=arrow_type, from_pandas=True)
+
+
+def _results_table(df):
+    columns = [str(col) for col in df.columns]
+    schema = pa.schema([pa.field(col, _results_column_type(col)) for col in columns])
+    arrays = [_results_column_array(df[col], field.type) for col, field in zip(df.columns, schema)]
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+class ChunkedResultsWriter:
+    # Результаты обработки частями: каждая часть сразу уходит на диск, в конце части сливаются
+    # в обычный Parquet результатов. Колонки у частей могут различаться (Timing * появляются по ответам)
+    def __init__(self, excel_file):
+        if pa is None:
+            raise RuntimeError("Для обработки частями нужен pyarrow")
+        self.parquet_file = results_parquet_path(excel_file)
+        self.parts_dir = f"{self.parquet_file}.parts"
+        self.parts = []
+        self.rows = 0
+
+    def write(self, df):
+        os.makedirs(self.parts_dir, exist_ok=True)
+        part_file = os.path.join(self.parts_dir, f"part-{len(self.parts):05d}.parquet")
+        pq.write_table(_results_table(df), part_file, compression='zstd')
+        self.parts.append(part_file)
+        self.rows += len(df)
+
+    def finalize(self):
+        if not self.parts:
+            return None
+        fields = {}
+        for part_file in self.parts:
+            for field in pq.read_schema(part_file):
+                fields.setdefault(field.name, field)
+        schema = pa.schema(list(fields.values()))
+
+        # Части переписываются по одной - в памяти не больше одной части
+        temp_file = f"{self.parquet_file}.tmp"
+        with pq.ParquetWriter(temp_file, schema, compression='zstd') as writer:
+            for part_file in self.parts:
+                table = pq.read_table(part_file)
+                arrays = [table.column(field.name) if field.name in table.column_names
+                          else pa.nulls(len(table), field.type) for field in schema]
+                writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+        os.replace(temp_file, self.parquet_file)
+        shutil.rmtree(self.parts_dir, ignore_errors=True)
+        logger.info(f"💾 Результаты сохранены в Parquet: {self.parquet_file} ({self.rows} строк, "
+                    f"частей: {len(self.parts)})")
+        return self.parquet_file
+
+
+def create_chunked_results_workbook(reference_file, excel_file):
+    # При обработке частями строки результатов есть только в Parquet; книга хранит итоговый отчет
+    wb = Workbook()
+    ws = wb.active
+    ws.title = 'Image Data'
+    ws['A1'] = f"Результаты обработки частями: {os.path.basename(results_parquet_path(excel_file))}"
+    ws['A2'] = f"Эталоны: {os.path.abspath(reference_file)}"
+    wb.save(excel_file)
+
+
+def save_results_parquet(df, excel_file):
+    if pa is None:
+        logger.warning("⚠️ pyarrow не установлен, Parquet с результатами не создается")
+        return None
+
+    parquet_file = results_parquet_path(excel_file)
+    try:
+        temp_file = f"{parquet_file}.tmp"
+        pq.write_table(_results_table(df), temp_file, compression='zstd')
+        os.replace(temp_file, parquet_file)
+        logger.info(f"💾 Результаты сохранены в Parquet: {parquet_file}")
+        return parquet_file
+    except Exception as e:
+        logger.error(f"❌ Ошибка сохранения Parquet {parquet_file}: {e}")
+        return None
+
+
+def load_results_parquet(parquet_file, columns=None):
+    if columns:
+        available = set(pq.read_schema(parquet_file).names)
+        columns = [col for col in columns if col in available]
+    table = pq.read_table(parquet_file, columns=columns, memory_map=True)
+    df = table.to_pandas()
+    logger.info(f"Загружены результаты (Parquet): {parquet_file}, строк: {len(df)}, колонок: {len(df.columns)}")
+    return df
+
+
 def save_excel_progress(df, excel_file, report_data=None):
     try:
-        logger.info(f"💾 НАЧИНАЕМ СОХРАНЕНИЕ EXCEL: {excel_file}")
-        logger.info(f"📊 Размер DataFrame: {len(df)} строк, {len(df.columns)} колонок")
+        logger.info(f"💾 НАЧИНАЕМ СОХРАНЕНИЕ EXCEL: {excel_file}", extra=DETAIL)
+        logger.info(f"📊 Размер DataFrame: {len(df)} строк, {len(df.columns)} колонок", extra=DETAIL)
 
 
         if df.empty:
             logger.warning("⚠️ DataFrame пустой!")
             return False
-        if len(df) > 0:
+        if detail_enabled():
             last_rows = df.tail(3)
-            logger.info(f"📋 Последние 3 строки в DataFrame:")
+            logger.info(f"📋 Последние 3 строки в DataFrame:", extra=DETAIL)
             for idx, row in last_rows.iterrows():
                 logger.info(f"   Строка {idx}: Indications='{row.get('Indications', '')}', "
                             f"Series='{row.get('Series number', '')}', "
-                            f"Model='{row.get('Model', '')}'")
+                            f"Model='{row.get('Model', '')}'", extra=DETAIL)
 
         temp_file = excel_file.replace('.xlsx', '_temp.xlsx')
-        logger.info(f"🔄 Создаем временный файл: {temp_file}")
+        logger.info(f"🔄 Создаем временный файл: {temp_file}", extra=DETAIL)
 
         with pd.ExcelWriter(temp_file, engine='openpyxl') as writer:
             df.to_excel(writer, sheet_name='Image Data', index=False)
 
-        logger.info(f"✅ Данные записаны во временный файл")
+        logger.info(f"✅ Данные записаны во временный файл", extra=DETAIL)
 
         wb = load_workbook(temp_file)
-        logger.info(f"🎨 Применяем стили к Excel")
+        logger.info(f"🎨 Применяем стили к Excel", extra=DETAIL)
         apply_excel_styles(wb, excel_file)
 
         if report_data:
             from generators.summary_report import create_summary_sheet
-            logger.info(f"📈 Добавляем summary report")
+            logger.info(f"📈 Добавляем summary report", extra=DETAIL)
             create_summary_sheet(wb, report_data)
 
-        logger.info(f"💾 Сохраняем финальный файл: {excel_file}")
+        logger.info(f"💾 Сохраняем финальный файл: {excel_file}", extra=DETAIL)
         wb.save(excel_file)
-        logger.info(f"✅ Файл успешно сохранен: {excel_file}")
+        logger.info(f"✅ Файл успешно сохранен: {excel_file}", extra=DETAIL)
 
         if os.path.exists(temp_file):
             os.remove(temp_file)
-            logger.info(f"🗑️ Временный файл удален")
+            logger.info(f"🗑️ Временный файл удален", extra=DETAIL)
 
-        logger.info(f"🎉 Excel файл полностью сохранен и готов!")
+        logger.info(f"🎉 Excel файл полностью сохранен и готов!", extra=DETAIL)
         return True
 
     except Exception as e:
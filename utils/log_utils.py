@@ -0,0 +1,169 @@
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import zlib
+from contextlib import contextmanager
+from datetime import datetime
+
+# extra= для сообщений: DETAIL - подробности по одному изображению (семплируются),
+# SUMMARY - итоги прогона (остаются даже в профиле perf)
+DETAIL = {'detail': True}
+SUMMARY = {'summary': True}
+
+LOG_PROFILES = ('default', 'debug', 'perf')
+LOG_FORMATS = ('text', 'json')
+
+_image_context = contextvars.ContextVar('image_context', default=None)
+_settings = {'profile': 'default', 'sample_rate': 1.0}
+_listener = None
+
+
+def _is_sampled(image_file, sample_rate):
+    if sample_rate >= 1.0:
+        return True
+    if sample_rate <= 0.0:
+        return False
+    # Детерминированное решение по имени файла: все подробности одного изображения
+    # либо попадают в лог целиком, либо не попадают совсем
+    return zlib.crc32(image_file.encode('utf-8')) % 10000 < sample_rate * 10000
+
+
+@contextmanager
+def image_context(image_file, task_id=None):
+    context = {
+        'image': image_file,
+        'task_id': task_id,
+        'sampled': _is_sampled(image_file, _settings['sample_rate'])
+    }
+    token = _image_context.set(context)
+    try:
+        yield context
+    finally:
+        _image_context.reset(token)
+
+
+def set_task_id(task_id):
+    context = _image_context.get()
+    if context is not None:
+        context['task_id'] = task_id
+
+
+def detail_enabled():
+    if _settings['profile'] == 'perf':
+        return False
+    context = _image_context.get()
+    return context is None or context['sampled']
+
+
+class ContextFilter(logging.Filter):
+    def filter(self, record):
+        context = _image_context.get()
+        record.image = context['image'] if context else None
+        record.task_id = context['task_id'] if context else None
+        return True
+
+
+class ProfileFilter(logging.Filter):
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or getattr(record, 'summary', False):
+            return True
+        if _settings['profile'] == 'perf':
+            return False
+        if getattr(record, 'detail', False):
+            return detail_enabled()
+        return True
+
+
+class _LeanQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        # Форматирование строки делает поток QueueListener; здесь только
+        # подставляем аргументы и снимаем несериализуемый exc_info
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        event = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        for key in ('image', 'task_id', 'event'):
+            value = getattr(record, key, None)
+            if value is not None:
+                event[key] = value
+        if getattr(record, 'summary', False):
+            event['summary'] = True
+        if record.exc_info:
+            event['exc_info'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            event['exc_info'] = record.exc_text
+        return json.dumps(event, ensure_ascii=False, default=str)
+
+
+def setup_logging(profile='default', log_format='text', sample_rate=1.0, log_file=None):
+    global _listener
+
+    if profile not in LOG_PROFILES:
+        profile = 'default'
+    if log_format not in LOG_FORMATS:
+        log_format = 'text'
+
+    _settings['profile'] = profile
+    _settings['sample_rate'] = max(0.0, min(1.0, float(sample_rate)))
+
+    shutdown_logging()
+
+    if log_format == 'json':
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+
+    handlers = [logging.StreamHandler(sys.stderr)]
+    if log_file:
+        handlers.append(logging.FileHandler(log_file, encoding='utf-8'))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    # Запись в поток/файл выполняется отдельным потоком QueueListener,
+    # рабочие потоки только кладут запись в очередь
+    log_queue = queue.SimpleQueue()
+    queue_handler = _LeanQueueHandler(log_queue)
+    queue_handler.addFilter(ProfileFilter())
+    queue_handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(logging.DEBUG if profile == 'debug' else logging.INFO)
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def shutdown_logging():
+    # Остановка дописывает очередь, затем закрываются обработчики (файл журнала); sys.stderr
+    # StreamHandler.close() не закрывает
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+atexit.register(shutdown_logging)
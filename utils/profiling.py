@@ -0,0 +1,239 @@
+import cProfile
+import io
+import logging
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HOT_FUNCTIONS = 25
+STACK_DEPTH = 40
+
+
+def profile_dir_path(excel_file):
+    return f"{os.path.splitext(excel_file)[0]}.profile"
+
+
+def _is_pseudo_file(filename):
+    # cProfile помечает встроенные функции '~', замороженные модули и код из строки - '<frozen ...>', '<string>';
+    # abspath превратил бы их в пути внутри текущего каталога
+    return filename == '~' or filename.startswith('<')
+
+
+def _is_project_file(filename):
+    if _is_pseudo_file(filename):
+        return False
+    path = os.path.abspath(filename)
+    return path.startswith(PROJECT_ROOT + os.sep) and 'site-packages' not in path
+
+
+def _short_path(filename):
+    if _is_pseudo_file(filename):
+        return filename
+    path = os.path.abspath(filename)
+    return os.path.relpath(path, PROJECT_ROOT) if _is_project_file(path) else os.path.basename(path)
+
+
+def _thread_group(name):
+    # Потоки пула называются recognition_0, recognition_1 ... - в сводке их удобнее видеть вместе
+    return re.sub(r'_\d+$', '', name)
+
+
+class StackSampler(threading.Thread):
+    def __init__(self, interval):
+        super().__init__(name='profile-sampler', daemon=True)
+        self.interval = interval
+        self.samples = 0
+        self.stacks = Counter()
+        self.frames = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        own_ident = threading.get_ident()
+        while not self._stop_event.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < STACK_DEPTH:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({_short_path(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                if not stack:
+                    continue
+                group = _thread_group(names.get(ident, str(ident)))
+                self.frames[(group, stack[0])] += 1
+                self.stacks[';'.join([group] + stack[::-1])] += 1
+            self.samples += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join(timeout=max(1.0, self.interval * 5))
+
+
+class RunProfiler:
+    def __init__(self, output_dir, tracemalloc_every=0, tracemalloc_top=15, sample_interval=0.0):
+        self.output_dir = output_dir
+        self.tracemalloc_every = tracemalloc_every
+        self.tracemalloc_top = tracemalloc_top
+        self.sample_interval = sample_interval
+        self.images = 0
+        self.started_at = None
+        self.main_profile = None
+        self.thread_profiles = []
+        self.sampler = None
+        self.memory_snapshots = []
+        self._lock = threading.Lock()
+
+    def _bootstrap_thread(self, frame, event, arg):
+        # Срабатывает на первом вызове в каждом новом потоке и заменяет себя на cProfile этого потока
+        sys.setprofile(None)
+        profile = cProfile.Profile()
+        with self._lock:
+            self.thread_profiles.append((threading.current_thread().name, profile))
+        profile.enable()
+
+    def start(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.started_at = time.time()
+
+        if self.tracemalloc_every > 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        if self.sample_interval > 0:
+            self.sampler = StackSampler(self.sample_interval)
+            self.sampler.start()
+
+        threading.setprofile(self._bootstrap_thread)
+        self.main_profile = cProfile.Profile()
+        self.main_profile.enable()
+        logger.info(f"🔬 Профилирование включено: {self.output_dir}")
+
+    def image_done(self):
+        if self.tracemalloc_every <= 0:
+            return
+        with self._lock:
+            self.images += 1
+            if self.images % self.tracemalloc_every:
+                return
+            images = self.images
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+        ))
+        current, peak = tracemalloc.get_traced_memory()
+        top = snapshot.statistics('lineno')[:self.tracemalloc_top]
+        with self._lock:
+            self.memory_snapshots.append((images, time.time() - self.started_at, current, peak, top))
+
+    def stop(self):
+        if self.main_profile is None:
+            return None
+        # Сначала выключаем профилировщик главного потока: disable() чужого профиля сбрасывает
+        # профилирование текущего потока
+        self.main_profile.disable()
+        threading.setprofile(None)
+        elapsed = time.time() - self.started_at
+
+        if self.sampler:
+            self.sampler.stop()
+
+        try:
+            main_stats = pstats.Stats(self.main_profile)
+            main_stats.dump_stats(os.path.join(self.output_dir, 'main.pstats'))
+
+            combined = pstats.Stats(self.main_profile)
+            with self._lock:
+                thread_profiles = list(self.thread_profiles)
+            for _, profile in thread_profiles:
+                try:
+                    combined.add(profile)
+                except (TypeError, ValueError):
+                    # Профиль потока без единого вызова pstats не принимает
+                    continue
+            combined.dump_stats(os.path.join(self.output_dir, 'all_threads.pstats'))
+
+            if self.sampler:
+                with open(os.path.join(self.output_dir, 'stacks.folded'), 'w', encoding='utf-8') as f:
+                    for stack, count in self.sampler.stacks.most_common():
+                        f.write(f"{stack} {count}\n")
+
+            if self.memory_snapshots:
+                self._write_memory_report()
+
+            summary = self._summary(combined, elapsed, len(thread_profiles))
+            summary_file = os.path.join(self.output_dir, 'summary.txt')
+            with open(summary_file, 'w', encoding='utf-8') as f:
+                f.write(summary)
+        except Exception as e:
+            logger.error(f"❌ Ошибка сохранения результатов профилирования: {e}")
+            return None
+        finally:
+            self.main_profile = None
+            if tracemalloc.is_tracing() and self.tracemalloc_every > 0:
+                tracemalloc.stop()
+
+        logger.info(f"🔬 Профиль прогона сохранен: {summary_file}")
+        return self.output_dir
+
+    def _write_memory_report(self):
+        with open(os.path.join(self.output_dir, 'tracemalloc.txt'), 'w', encoding='utf-8') as f:
+            for images, elapsed, current, peak, top in self.memory_snapshots:
+                f.write(f"=== После {images} изображений ({elapsed:.1f} сек): "
+                        f"текущая {current / 2**20:.1f} МБ, пик {peak / 2**20:.1f} МБ\n")
+                for stat in top:
+                    frame = stat.traceback[0]
+                    f.write(f"{stat.size / 2**10:10.1f} КБ {stat.count:8d} блоков  "
+                            f"{_short_path(frame.filename)}:{frame.lineno}\n")
+                f.write("\n")
+
+    def _summary(self, stats, elapsed, threads):
+        lines = [
+            f"Профиль прогона: {os.path.basename(self.output_dir)}",
+            f"Время под профилировщиком: {elapsed:.2f} сек, потоков с профилем: {threads}",
+            "",
+        ]
+
+        # Только функции из модулей проекта: библиотечные вызовы видны в pstats целиком
+        entries = []
+        for (filename, line, name), (cc, nc, tottime, cumtime, _) in stats.stats.items():
+            if _is_project_file(filename):
+                entries.append((f"{_short_path(filename)}:{line}({name})", nc, tottime, cumtime))
+
+        for title, key in (("Собственное время (tottime)", 2), ("Суммарное время (cumtime)", 3)):
+            lines.append(f"--- Самые горячие функции проекта: {title} ---")
+            lines.append(f"{'вызовов':>10} {'tottime':>10} {'cumtime':>10}  функция")
+            for function, calls, tottime, cumtime in sorted(entries, key=lambda e: e[key], reverse=True)[:HOT_FUNCTIONS]:
+                lines.append(f"{calls:>10} {tottime:>10.3f} {cumtime:>10.3f}  {function}")
+            lines.append("")
+
+        if self.sampler and self.sampler.samples:
+            lines.append(f"--- Семплирование стеков: {self.sampler.samples} снимков "
+                         f"с интервалом {self.sample_interval} сек ---")
+            for (group, frame), count in self.sampler.frames.most_common(HOT_FUNCTIONS):
+                lines.append(f"{count / self.sampler.samples:>8.1%}  [{group}] {frame}")
+            lines.append("")
+
+        if self.memory_snapshots:
+            images, _, current, peak, top = self.memory_snapshots[-1]
+            lines.append(f"--- Память (tracemalloc), последний снимок после {images} изображений: "
+                         f"{current / 2**20:.1f} МБ, пик {peak / 2**20:.1f} МБ ---")
+            for stat in top[:10]:
+                frame = stat.traceback[0]
+                lines.append(f"{stat.size / 2**10:10.1f} КБ  {_short_path(frame.filename)}:{frame.lineno}")
+            lines.append("")
+
+        stream = io.StringIO()
+        stats.stream = stream
+        stats.sort_stats('cumulative').print_stats(15)
+        lines.append("--- Все модули: топ по cumtime ---")
+        lines.append(stream.getvalue())
+        return '\n'.join(lines)
@@ -0,0 +1,64 @@
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def raw_archive_path(excel_file):
+    return f"{os.path.splitext(excel_file)[0]}.raw.jsonl.gz"
+
+
+class RawResultArchive:
+    def __init__(self, path):
+        self.path = path
+        self.records = 0
+        self._file = None
+        self._lock = threading.Lock()
+
+    def append(self, image_file, attempt, result):
+        record = {
+            'filename': image_file,
+            'attempt': attempt,
+            'archived_at': time.time(),
+            'result': result,
+        }
+        line = json.dumps(record, ensure_ascii=False, default=str) + '\n'
+        with self._lock:
+            try:
+                if self._file is None:
+                    # Дописываем новым gzip-элементом, поэтому повторные запуски в тот же файл не портят архив
+                    self._file = gzip.open(self.path, 'at', encoding='utf-8', compresslevel=6)
+                self._file.write(line)
+                self.records += 1
+            except Exception as e:
+                logger.error(f"❌ Ошибка записи в архив сырых результатов {self.path}: {e}")
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+                logger.info(f"🗄️  Сырые результаты распознавания: {self.path} ({self.records} записей)")
+
+
+def load_raw_results(path):
+    # Для каждого изображения берем последнюю запись: она соответствует итоговой попытке
+    results = {}
+    try:
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            for line_number, line in enumerate(f, 1):
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"⚠️ Поврежденная строка {line_number} в {path}, пропускаем")
+                    continue
+                results[record['filename']] = record
+    except EOFError:
+        # Прогон оборвался, не закрыв последний gzip-элемент: все, что успело записаться, уже прочитано
+        logger.warning(f"⚠️ Архив {path} обрывается, используем {len(results)} прочитанных записей")
+    logger.info(f"🗄️  Загружено сырых результатов: {len(results)} из {path}")
+    return results
@@ -0,0 +1,160 @@
+import hashlib
+import json
+import logging
+import os
+import pickle
+import posixpath
+import time
+import zipfile
+import xml.etree.ElementTree as ET
+
+import pandas as pd
+
+from utils.file_utils import load_excel_data
+
+logger = logging.getLogger(__name__)
+
+CACHE_FORMAT = 2
+REFERENCE_SHEET = 'Image Data'
+XLSX_NS = {
+    'main': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main',
+    'rel': 'http://schemas.openxmlformats.org/package/2006/relationships',
+}
+XLSX_REL_ID = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id'
+HASH_CHUNK = 1024 * 1024
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _sheet_part(archive, sheet_name):
+    workbook = ET.fromstring(archive.read('xl/workbook.xml'))
+    rels = ET.fromstring(archive.read('xl/_rels/workbook.xml.rels'))
+    for sheet in workbook.iterfind('main:sheets/main:sheet', XLSX_NS):
+        if sheet.get('name') != sheet_name:
+            continue
+        for rel in rels.iterfind('rel:Relationship', XLSX_NS):
+            if rel.get('Id') == sheet.get(XLSX_REL_ID):
+                target = rel.get('Target')
+                return target.lstrip('/') if target.startswith('/') else posixpath.normpath(f"xl/{target}")
+    return None
+
+
+def reference_fingerprint(excel_file, sheet_name=REFERENCE_SHEET):
+    # Отчет дописывается в тот же файл (лист итогов, стили), поэтому свежесть кэша определяется
+    # только частью книги с листом эталонов и общими строками, а не всем файлом
+    try:
+        with zipfile.ZipFile(excel_file) as archive:
+            part = _sheet_part(archive, sheet_name)
+            if part is None:
+                return file_sha256(excel_file)
+            digest = hashlib.sha256()
+            for name in (part, 'xl/sharedStrings.xml'):
+                if name in archive.namelist():
+                    with archive.open(name) as f:
+                        for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+                            digest.update(chunk)
+            return digest.hexdigest()
+    except (zipfile.BadZipFile, KeyError, ET.ParseError):
+        return file_sha256(excel_file)
+
+
+def build_filename_mapping(df):
+    if 'Filename' not in df.columns:
+        return {}
+    names = df['Filename'].astype(str).str.strip()
+    valid = names != ''
+    # Как и раньше при обходе строк: для повторяющегося имени остается последняя строка
+    return dict(zip(names[valid].tolist(), df.index[valid].tolist()))
+
+
+class ReferenceCache:
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+
+    def _paths(self, excel_file):
+        key = hashlib.sha1(os.path.abspath(excel_file).encode('utf-8')).hexdigest()[:16]
+        name = os.path.splitext(os.path.basename(excel_file))[0]
+        base = os.path.join(self.cache_dir, f"{name}_{key}")
+        return f"{base}.pkl", f"{base}.json"
+
+    def _read_meta(self, meta_file):
+        try:
+            with open(meta_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _is_compatible(self, meta):
+        return meta.get('format') == CACHE_FORMAT and meta.get('pandas') == pd.__version__
+
+    def load(self, excel_file):
+        data_file, meta_file = self._paths(excel_file)
+        stat = os.stat(excel_file)
+        meta = self._read_meta(meta_file)
+
+        if meta and self._is_compatible(meta) and os.path.exists(data_file):
+            fresh = meta['size'] == stat.st_size and meta['mtime_ns'] == stat.st_mtime_ns
+            if not fresh:
+                # Файл изменился (копирование, touch, дописанный отчет), но лист эталонов мог остаться прежним
+                fresh = reference_fingerprint(excel_file) == meta['fingerprint']
+                if fresh:
+                    meta['size'] = stat.st_size
+                    meta['mtime_ns'] = stat.st_mtime_ns
+                    self._write_meta(meta_file, meta)
+            if fresh:
+                try:
+                    with open(data_file, 'rb') as f:
+                        cached = pickle.load(f)
+                    logger.info(f"⚡ Эталоны загружены из кэша: {os.path.basename(excel_file)}, "
+                                f"строк: {len(cached['df'])}")
+                    return cached['df'], cached['filename_to_index']
+                except Exception as e:
+                    logger.warning(f"⚠️ Кэш эталонов {data_file} не читается, пересобираем: {e}")
+
+        return self._rebuild(excel_file, data_file, meta_file, stat)
+
+    def _rebuild(self, excel_file, data_file, meta_file, stat):
+        start = time.time()
+        df = load_excel_data(excel_file)
+        filename_to_index = build_filename_mapping(df)
+
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            temp_file = f"{data_file}.tmp"
+            with open(temp_file, 'wb') as f:
+                pickle.dump({'df': df, 'filename_to_index': filename_to_index}, f,
+                            protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_file, data_file)
+            self._write_meta(meta_file, {
+                'format': CACHE_FORMAT,
+                'pandas': pd.__version__,
+                'source': os.path.abspath(excel_file),
+                'size': stat.st_size,
+                'mtime_ns': stat.st_mtime_ns,
+                'fingerprint': reference_fingerprint(excel_file),
+                'rows': len(df),
+            })
+            logger.info(f"🗃️  Кэш эталонов обновлен за {time.time() - start:.2f} сек: {data_file}")
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось сохранить кэш эталонов {data_file}: {e}")
+
+        return df, filename_to_index
+
+    def _write_meta(self, meta_file, meta):
+        temp_file = f"{meta_file}.tmp"
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+        os.replace(temp_file, meta_file)
+
+
+def load_reference_data(excel_file, cache_dir=None):
+    if not cache_dir:
+        df = load_excel_data(excel_file)
+        return df, build_filename_mapping(df)
+    return ReferenceCache(cache_dir).load(excel_file)
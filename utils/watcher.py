@@ -0,0 +1,154 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import sys
+import time
+
+logger = logging.getLogger(__name__)
+
+WATCH_BACKENDS = ('auto', 'inotify', 'polling')
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+EVENT_HEADER = struct.Struct('iIII')
+READ_SIZE = 64 * 1024
+
+
+def _watch_targets(paths):
+    # Файл отслеживаем через его папку: Excel сохраняется во временный файл с переименованием,
+    # и наблюдение за самим inode потерялось бы после первого сохранения
+    targets = {}
+    for path in paths:
+        path = os.path.abspath(path)
+        if os.path.isdir(path):
+            targets.setdefault(path, None)
+        else:
+            names = targets.setdefault(os.path.dirname(path), set())
+            if names is not None:
+                names.add(os.path.basename(path))
+    return targets
+
+
+class PollingWatcher:
+    backend = 'polling'
+
+    def __init__(self, paths, interval=1.0):
+        self.targets = _watch_targets(paths)
+        self.interval = interval
+        self.snapshot = self._scan()
+
+    def _scan(self):
+        snapshot = {}
+        for directory, names in self.targets.items():
+            try:
+                entries = list(os.scandir(directory))
+            except OSError as e:
+                logger.warning(f"⚠️ Не удалось прочитать папку {directory}: {e}")
+                continue
+            for entry in entries:
+                if names is not None and entry.name not in names:
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                if entry.is_file():
+                    snapshot[entry.path] = (stat.st_size, stat.st_mtime_ns)
+        return snapshot
+
+    def poll(self, timeout):
+        time.sleep(max(0.0, min(timeout, self.interval)))
+        snapshot = self._scan()
+        changed = {path for path, state in snapshot.items() if self.snapshot.get(path) != state}
+        self.snapshot = snapshot
+        return changed
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    backend = 'inotify'
+
+    def __init__(self, paths):
+        self.targets = _watch_targets(paths)
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1')
+
+        self.watches = {}
+        for directory in self.targets:
+            wd = libc.inotify_add_watch(self.fd, os.fsencode(directory), IN_CLOSE_WRITE | IN_MOVED_TO)
+            if wd < 0:
+                error = ctypes.get_errno()
+                os.close(self.fd)
+                raise OSError(error, f"inotify_add_watch {directory}")
+            self.watches[wd] = directory
+
+    def poll(self, timeout):
+        readable, _, _ = select.select([self.fd], [], [], max(0.0, timeout))
+        if not readable:
+            return set()
+        try:
+            data = os.read(self.fd, READ_SIZE)
+        except BlockingIOError:
+            return set()
+
+        changed = set()
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b'\0')
+            offset += EVENT_HEADER.size + length
+            if mask & IN_Q_OVERFLOW:
+                # Очередь ядра переполнилась: события потеряны, вызывающий перечитает папки целиком
+                logger.warning("⚠️ Переполнение очереди inotify, папки будут просканированы заново")
+                changed.update(self.targets)
+                continue
+            directory = self.watches.get(wd)
+            if directory is None or not name:
+                continue
+            name = os.fsdecode(name)
+            names = self.targets[directory]
+            if names is None or name in names:
+                changed.add(os.path.join(directory, name))
+        return changed
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+def create_watcher(paths, backend='auto', poll_interval=1.0):
+    if backend not in WATCH_BACKENDS:
+        logger.warning(f"⚠️ Неизвестный способ наблюдения '{backend}', используется auto")
+        backend = 'auto'
+    if backend != 'polling' and sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(paths)
+        except (OSError, AttributeError) as e:
+            logger.warning(f"⚠️ inotify недоступен ({e}), переключаемся на опрос каждые {poll_interval} сек")
+    elif backend == 'inotify':
+        logger.warning(f"⚠️ inotify есть только в Linux, переключаемся на опрос каждые {poll_interval} сек")
+    return PollingWatcher(paths, poll_interval)
+
+
+def wait_for_changes(watcher, timeout, debounce, max_delay=5.0):
+    # Файл копируется не мгновенно: ждем паузы в событиях, чтобы не забрать недописанное изображение.
+    # При непрерывном потоке файлов пачка отдается не позже max_delay
+    changed = watcher.poll(timeout)
+    deadline = time.monotonic() + max_delay
+    while changed and time.monotonic() < deadline:
+        more = watcher.poll(min(debounce, max(0.0, deadline - time.monotonic())))
+        if not more:
+            break
+        changed |= more
+    return changed
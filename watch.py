@@ -0,0 +1,405 @@
+import argparse
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from config import *
+from generators.report_generator import create_report_dict
+from process.image_processor import ImageProcessor
+from recognition_runner import configure_local_threads
+from utils.file_utils import get_image_files, load_results_data, save_excel_progress, save_results_parquet
+from utils.log_utils import SUMMARY, image_context
+from utils.raw_archive import RawResultArchive, raw_archive_path
+from utils.reference_cache import build_filename_mapping, load_reference_data
+from utils.watcher import create_watcher, wait_for_changes
+
+logger = logging.getLogger(__name__)
+
+ACCURACY_COLUMNS = {
+    'indications': 'Indications Match',
+    'series': 'Series Match',
+    'model': 'Model Match',
+    'rate': 'Rate Match',
+    'overall': 'Overall Match',
+    'overall_confidence': 'Overall Confidence Match',
+}
+REFERENCE_COLUMNS = ['Inidications (reference)', 'Series number (reference)', 'Model (reference)',
+                     'Rate (reference)']
+ERROR = 'error'
+
+
+def _text(value):
+    return str(value) if pd.notna(value) else ''
+
+
+def _flag(value):
+    try:
+        return int(float(value) == 1)
+    except (TypeError, ValueError):
+        return 0
+
+
+class WatchSession:
+    def __init__(self, images_folder, excel_file, program_script, workers, results_file=None):
+        self.images_folder = os.path.abspath(images_folder)
+        self.excel_file = os.path.abspath(excel_file)
+        self.program_script = program_script
+        self.workers = workers
+        self.results_file = results_file
+        self.processor = ImageProcessor()
+        self.df = None
+        self.executor = None
+        self.backend = None
+        # Точность ведется по дельте: у каждой строки запомнены ее совпадения, итог правится на разницу
+        self.row_scores = {}
+        self.totals = {field: 0 for field in ACCURACY_COLUMNS}
+        self.errors = 0
+        self.timings = {}
+        self.pending = set()
+        self.seen = {}
+        self.updates = 0
+        self.last_batch = None
+        self.db_record_id = None
+        self.report = None
+        self.workbook_dirty = False
+        self.last_workbook_save = 0.0
+        self.started_at = None
+        self._state_lock = threading.Lock()
+
+    def start(self):
+        self.started_at = time.time()
+        if self.results_file:
+            # Продолжение наблюдения: уже записанные результаты сразу попадают в итоги
+            self.df = load_results_data(self.results_file)
+            logger.info(f"📂 Продолжаем наблюдение с файлом результатов: {self.results_file}")
+        else:
+            self.results_file = self.processor.create_excel_copy(self.excel_file)
+            self.df, _ = load_reference_data(self.excel_file, REFERENCE_CACHE_DIR if REFERENCE_CACHE_ENABLED else None)
+
+        self.processor.results_file = self.results_file
+        self.processor.filename_to_index = build_filename_mapping(self.df)
+        if RAW_ARCHIVE_ENABLED:
+            self.processor.raw_archive = RawResultArchive(raw_archive_path(self.results_file))
+        if SELECTED_SERVER == 'default':
+            configure_local_threads(self.workers, RECOGNIZER_THREADS)
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='watch')
+
+        for row_index in self.df.index:
+            self._score_row(row_index)
+        if self.row_scores:
+            logger.info(f"📊 Строк с результатом: {len(self.row_scores)}")
+        self.sync_reference()
+
+    def _score_row(self, row_index):
+        with self.processor.df_lock:
+            indications = _text(self.df.at[row_index, 'Indications']) if 'Indications' in self.df.columns else ''
+            if not indications:
+                score = None
+            elif indications.startswith('ERROR:'):
+                score = ERROR
+            else:
+                score = tuple(_flag(self.df.at[row_index, col]) if col in self.df.columns else 0
+                              for col in ACCURACY_COLUMNS.values())
+            timing = None
+            if score not in (None, ERROR) and 'Timing Total' in self.df.columns:
+                timing = pd.to_numeric(self.df.at[row_index, 'Timing Total'], errors='coerce')
+
+        with self._state_lock:
+            previous = self.row_scores.pop(row_index, None)
+            if previous == ERROR:
+                self.errors -= 1
+            elif previous is not None:
+                for field, value in zip(ACCURACY_COLUMNS, previous):
+                    self.totals[field] -= value
+
+            if score == ERROR:
+                self.errors += 1
+            elif score is not None:
+                for field, value in zip(ACCURACY_COLUMNS, score):
+                    self.totals[field] += value
+            if score is not None:
+                self.row_scores[row_index] = score
+
+            if timing is not None and pd.notna(timing):
+                self.timings[row_index] = float(timing)
+            else:
+                self.timings.pop(row_index, None)
+
+    def _rescore_row(self, row_index):
+        df = self.df
+        confidence = pd.to_numeric(df.at[row_index, 'Overall Confidence'], errors='coerce') \
+            if 'Overall Confidence' in df.columns else 0.0
+        self.processor.update_match_columns(
+            df, row_index,
+            self.processor.process_meter_reading(_text(df.at[row_index, 'Indications'])),
+            _text(df.at[row_index, 'Series number']), _text(df.at[row_index, 'Model']),
+            _text(df.at[row_index, 'Rate']),
+            *[_text(df.at[row_index, col]) for col in REFERENCE_COLUMNS],
+            0.0 if pd.isna(confidence) else float(confidence)
+        )
+
+    def sync_reference(self):
+        # Эталоны перечитываются целиком (через кэш), но в результаты попадает только разница:
+        # новые строки дописываются, у изменившихся эталонов пересчитываются совпадения
+        try:
+            reference, reference_mapping = load_reference_data(
+                self.excel_file, REFERENCE_CACHE_DIR if REFERENCE_CACHE_ENABLED else None
+            )
+        except Exception as e:
+            logger.error(f"❌ Не удалось перечитать эталоны {self.excel_file}: {e}")
+            return set()
+
+        mapping = self.processor.filename_to_index
+        new_files = [f for f in reference_mapping if f not in mapping]
+        known_files = [f for f in reference_mapping if f in mapping]
+        columns = [col for col in REFERENCE_COLUMNS if col in reference.columns and col in self.df.columns]
+
+        with self.processor.df_lock:
+            changed_rows = []
+            if known_files and columns:
+                rows = [mapping[f] for f in known_files]
+                old = self.df.loc[rows, columns].fillna('').astype(str).to_numpy()
+                new = reference.loc[[reference_mapping[f] for f in known_files], columns]
+                differs = (old != new.fillna('').astype(str).to_numpy()).any(axis=1)
+                for row_index, values in zip([r for r, d in zip(rows, differs) if d], new[differs].to_numpy()):
+                    for col, value in zip(columns, values):
+                        self.df.at[row_index, col] = value
+                    changed_rows.append(row_index)
+
+            if new_files:
+                added = reference.loc[[reference_mapping[f] for f in new_files]]
+                added = added.reindex(columns=self.df.columns.union(added.columns, sort=False))
+                start = int(self.df.index.max()) + 1 if len(self.df) else 0
+                added.index = pd.RangeIndex(start, start + len(added))
+                self.df = pd.concat([self.df.reindex(columns=added.columns), added])
+                for image_file, row_index in zip(new_files, added.index):
+                    mapping[image_file] = row_index
+
+            rescored = [row_index for row_index in changed_rows
+                        if self.row_scores.get(row_index) not in (None, ERROR)]
+            for row_index in rescored:
+                self._rescore_row(row_index)
+
+        for row_index in rescored:
+            self._score_row(row_index)
+
+        with self._state_lock:
+            ready = {f for f in self.pending if f in mapping}
+            self.pending -= ready
+        if new_files or changed_rows:
+            logger.info(f"📋 Эталоны обновлены: новых строк {len(new_files)}, изменено {len(changed_rows)}, "
+                        f"пересчитано {len(rescored)}, ожидавших изображений {len(ready)}", extra=SUMMARY)
+        return ready
+
+    def _file_state(self, image_file):
+        try:
+            stat = os.stat(os.path.join(self.images_folder, image_file))
+        except OSError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    def process_image(self, image_file, force=False):
+        with image_context(image_file):
+            image_path = os.path.join(self.images_folder, image_file)
+            state = self._file_state(image_file)
+            if state is None:
+                return False
+
+            row_index = self.processor.filename_to_index.get(image_file)
+            if row_index is None:
+                logger.warning(f"⏳ {image_file}: нет строки в Excel, ждем обновления эталонов")
+                with self._state_lock:
+                    self.pending.add(image_file)
+                return False
+
+            with self._state_lock:
+                self.seen[image_file] = state
+            if not force and self.processor.is_already_processed(self.df, row_index):
+                return False
+
+            task_id = f"watch_{int(time.time())}_{image_file.replace('.', '_')}"
+            result = self.processor.recognize(image_file, image_path, task_id, self.program_script)
+            if result['status'] != 'completed':
+                # Старые совпадения перезаписанного изображения не должны пережить ошибку
+                with self.processor.df_lock:
+                    for col in ACCURACY_COLUMNS.values():
+                        if col in self.df.columns:
+                            self.df.at[row_index, col] = ''
+            self.processor.record_result(result, self.df, row_index, image_file, lambda current_df: True)
+            self._score_row(row_index)
+            return True
+
+    def process_batch(self, image_files, reason):
+        if not image_files:
+            return 0
+        start = time.time()
+        futures = [self.executor.submit(self.process_image, image_file, force)
+                   for image_file, force in image_files]
+        recognized = sum(1 for future in futures if future.result())
+        if not recognized:
+            return 0
+
+        elapsed = time.time() - start
+        self.last_batch = {'reason': reason, 'images': recognized, 'seconds': elapsed}
+        self.publish()
+        return recognized
+
+    def accuracy_stats(self):
+        with self._state_lock:
+            tests = len(self.row_scores)
+            totals = dict(self.totals)
+        return dict(
+            {'total_tests': tests},
+            **{field: {'correct': correct, 'accuracy': float(correct / tests * 100 if tests else 0)}
+               for field, correct in totals.items()}
+        )
+
+    def publish(self):
+        accuracy = self.accuracy_stats()
+        with self._state_lock:
+            errors = self.errors
+            pending = len(self.pending)
+            timings = list(self.timings.values())
+        processed = accuracy['total_tests'] - errors
+        self.updates += 1
+
+        report = create_report_dict(processed, errors, pending, processed + errors,
+                                    time.time() - self.started_at, accuracy, timings)
+        report['watch'] = {
+            'backend': self.backend,
+            'updates': self.updates,
+            'started': time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.started_at)),
+            'pending': pending,
+            'last_batch': self.last_batch,
+        }
+        report['db_record_id'] = self.db_record_id
+
+        # Строка прогона в базе обновляется на каждой пачке, а книга и Parquet переписываются целиком
+        # (O(всех строк)), поэтому не чаще раза в PROGRESS_SAVE_INTERVAL; пропущенная запись догоняется
+        # в цикле ожидания или при остановке
+        success = self.save_db_record(report)
+        self.report = report
+        self.processor.last_report = report
+        self.workbook_dirty = True
+        if time.monotonic() - self.last_workbook_save >= PROGRESS_SAVE_INTERVAL > 0:
+            success = self.flush_workbook()
+
+        batch = self.last_batch
+        logger.info(f"👁️  Обновление #{self.updates} ({batch['reason']}): {batch['images']} изображений за "
+                    f"{batch['seconds']:.1f} сек. Всего с результатом: {accuracy['total_tests']}, ошибок: {errors}, "
+                    f"точность: {accuracy['overall']['accuracy']:.1f}%, ждут эталонов: {pending}", extra=SUMMARY)
+        return success
+
+    def save_db_record(self, report):
+        try:
+            from database.db_manager import db_manager
+            if self.db_record_id:
+                success = db_manager.update_test_result(self.db_record_id, report)
+            else:
+                success = db_manager.save_test_result(report)
+                if success:
+                    self.db_record_id = report['db_record_id'] = success
+            if success:
+                db_manager.checkpoint('PASSIVE')
+            return bool(success)
+        except Exception as e:
+            logger.error(f"❌ Ошибка сохранения результатов наблюдения в базу данных: {e}")
+            return False
+
+    def flush_workbook(self, force=False):
+        if not self.workbook_dirty:
+            return True
+        if not force and (PROGRESS_SAVE_INTERVAL <= 0 or
+                          time.monotonic() - self.last_workbook_save < PROGRESS_SAVE_INTERVAL):
+            return True
+        with self.processor.df_lock:
+            success = save_excel_progress(self.df, self.results_file, report_data=self.report)
+            if success:
+                save_results_parquet(self.df, self.results_file)
+        self.last_workbook_save = time.monotonic()
+        self.workbook_dirty = False
+        return success
+
+    def _image_name(self, path):
+        if os.path.dirname(path) != self.images_folder:
+            return None
+        name = os.path.basename(path)
+        return name if name.lower().endswith(SUPPORTED_IMAGE_EXTENSIONS) else None
+
+    def handle_changes(self, changed):
+        rescan = self.images_folder in changed
+        excel_changed = self.excel_file in changed or os.path.dirname(self.excel_file) in changed
+
+        images = {}
+        names = get_image_files(self.images_folder) if rescan else \
+            [name for name in map(self._image_name, changed) if name]
+        for image_file in names:
+            state = self._file_state(image_file)
+            with self._state_lock:
+                previous = self.seen.get(image_file)
+            if state is None or (rescan and previous == state):
+                continue
+            # Файл, уже распознанный в другом виде, распознаем заново; новый - только если нет результата
+            images[image_file] = previous is not None and previous != state
+
+        if excel_changed:
+            for image_file in self.sync_reference():
+                images.setdefault(image_file, False)
+
+        reason = 'изменение эталонов' if excel_changed and not names else 'новые изображения'
+        if not self.process_batch(sorted(images.items()), reason) and excel_changed:
+            self.last_batch = {'reason': 'изменение эталонов', 'images': 0, 'seconds': 0.0}
+            self.publish()
+
+    def run(self):
+        self.start()
+        # Наблюдение начинается до первого прохода, чтобы не потерять файлы, добавленные во время него
+        watcher = create_watcher([self.images_folder, self.excel_file], WATCH_BACKEND, WATCH_POLL_INTERVAL)
+        self.backend = watcher.backend
+
+        logger.info("=" * 60, extra=SUMMARY)
+        logger.info(f"👁️  РЕЖИМ НАБЛЮДЕНИЯ ({self.backend}): {self.images_folder}", extra=SUMMARY)
+        logger.info(f"   Эталоны: {self.excel_file}", extra=SUMMARY)
+        logger.info(f"   Результаты: {self.results_file}", extra=SUMMARY)
+        logger.info("=" * 60, extra=SUMMARY)
+
+        try:
+            initial = [(image_file, False) for image_file in get_image_files(self.images_folder)]
+            if not self.process_batch(initial, 'начальный проход'):
+                self.last_batch = {'reason': 'начальный проход', 'images': 0, 'seconds': 0.0}
+                self.publish()
+            logger.info("👁️  Ожидаем новые изображения (Ctrl+C - остановка)", extra=SUMMARY)
+            while True:
+                changed = wait_for_changes(watcher, WATCH_POLL_INTERVAL, WATCH_DEBOUNCE_SECONDS)
+                if changed:
+                    self.handle_changes(changed)
+                self.flush_workbook()
+        except KeyboardInterrupt:
+            logger.info("⏹️  Наблюдение остановлено", extra=SUMMARY)
+        finally:
+            watcher.close()
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.flush_workbook(force=True)
+            if self.processor.raw_archive:
+                self.processor.raw_archive.close()
+        return self.processor.last_report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Режим наблюдения: распознавание новых изображений по мере появления')
+    parser.add_argument('--folder', default=FOLDER_TEST, help='Папка с изображениями (по умолчанию FOLDER_TEST)')
+    parser.add_argument('--excel', default=EXCEL_DATA, help='Excel с эталонами (по умолчанию EXCEL_DATA)')
+    parser.add_argument('--workers', type=int, default=MAX_WORKERS, help='Одновременных изображений')
+    parser.add_argument('--results', help='Продолжить наблюдение с готовым файлом результатов из detail/')
+    args = parser.parse_args()
+
+    session = WatchSession(args.folder, args.excel, PROGRAM_SCRIPT, max(1, args.workers), args.results)
+    session.run()
+
+
+if __name__ == "__main__":
+    main()